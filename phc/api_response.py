@@ -1,9 +1,9 @@
 """A Python module for a base PHC web response."""
 
-import json
 from typing import Callable, Any
 from urllib.parse import urlparse, parse_qs
 import phc.errors as e
+from phc.util import json_codec
 
 try:
     import pandas as _pd
@@ -20,6 +20,10 @@ class ApiResponse:
     ----------
     nextPageToken : str
         The nextPageToken for a paged response
+    retries : int
+        The number of times the request was retried before this response
+    size : int
+        The number of bytes in the (decompressed) response body
 
     Examples
     --------
@@ -38,6 +42,7 @@ class ApiResponse:
         data: [dict, str],
         headers: dict,
         status_code: int,
+        size: int = 0,
     ):
         self.http_verb = http_verb
         self.api_url = api_url
@@ -45,6 +50,8 @@ class ApiResponse:
         self.data = data
         self.headers = headers
         self.status_code = status_code
+        self.retries = 0
+        self.size = size
         self._initial_data = data
         self._client = client
         if isinstance(data, dict) and data.get("links", {}).get("next"):
@@ -54,7 +61,7 @@ class ApiResponse:
     def __str__(self):
         """Return the Response data if object is converted to a string."""
         return (
-            json.dumps(self.data, indent=2)
+            json_codec.dumps(self.data, indent=2)
             if isinstance(self.data, dict)
             else self.data
         )
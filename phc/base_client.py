@@ -1,21 +1,99 @@
 """A Python module for a base PHC web client."""
 from urllib.parse import urljoin, urlencode
-from typing import Union
+from typing import Tuple, Union
 
 import sys
+import gzip
+import time
+import atexit
+import weakref
 import platform
 import asyncio
 import aiohttp
-import backoff
 
 from phc import Session
 from phc.errors import RequestError, ApiError
 from phc.api_response import ApiResponse
+from phc.util import json_codec
+from phc.util.rate_limiter import host_limiter
+from phc.util.retry_policy import RetryPolicy
 import phc.version as ver
 
+# Connection pools shared by all clients using the same event loop and
+# connector settings. Keyed weakly by loop so that pools belonging to a
+# discarded loop can be garbage collected along with it.
+_shared_pools = weakref.WeakKeyDictionary()
+
+
+def _new_client_session(
+    pool_key: Tuple[bool, int, int, int, float]
+) -> aiohttp.ClientSession:
+    trust_env, limit, limit_per_host, dns_cache_ttl, keepalive_timeout = (
+        pool_key
+    )
+
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            use_dns_cache=dns_cache_ttl > 0,
+            ttl_dns_cache=dns_cache_ttl if dns_cache_ttl > 0 else None,
+            keepalive_timeout=keepalive_timeout,
+        ),
+        trust_env=trust_env,
+    )
+
+
+def _close_client_session(
+    loop: asyncio.AbstractEventLoop, session: aiohttp.ClientSession
+):
+    if session.closed or loop.is_closed():
+        return
+
+    if loop.is_running():
+        loop.create_task(session.close())
+    else:
+        loop.run_until_complete(session.close())
+
 
 class BaseClient:
-    """Base client for making API requests."""
+    """Base client for making API requests.
+
+    Parameters
+    ----------
+    session : phc.Session
+        The PHC session
+    run_async: bool
+        True to return promises, False to return results (default is False)
+    timeout: int
+        Operation timeout (default is 30)
+    trust_env: bool
+        Get proxies information from HTTP_PROXY / HTTPS_PROXY environment variables if the parameter is True (False by default)
+    share_pool: bool
+        Reuse the keep-alive connection pool shared by all clients on the same
+        event loop with the same connector settings (default is True). When
+        False, this client owns its pool and it is released by `close()`.
+    connector_limit: int
+        Maximum number of simultaneous connections in the pool (default is 100)
+    connector_limit_per_host: int
+        Maximum number of simultaneous connections to a single host
+        (default is 0 for no limit)
+    dns_cache_ttl: int
+        Seconds to cache resolved DNS entries, 0 to disable (default is 300)
+    keepalive_timeout: float
+        Seconds to keep an idle connection open for reuse (default is 30)
+    retry_policy: phc.util.retry_policy.RetryPolicy
+        Which failed requests to retry and when (defaults to the policy
+        shared by all clients of this class)
+    request_compression_threshold: int
+        Gzip JSON request bodies of at least this many bytes (defaults to the
+        threshold shared by all clients of this class, which is None to never
+        compress requests). Responses are always requested compressed and
+        decompressed as they are read.
+    """
+
+    retry_policy = RetryPolicy()
+    request_compression_threshold = None
 
     def __init__(
         self,
@@ -23,6 +101,13 @@ class BaseClient:
         run_async: bool = False,
         timeout: int = 30,
         trust_env: bool = False,
+        share_pool: bool = True,
+        connector_limit: int = 100,
+        connector_limit_per_host: int = 0,
+        dns_cache_ttl: int = 300,
+        keepalive_timeout: float = 30,
+        retry_policy: RetryPolicy = None,
+        request_compression_threshold: int = None,
     ):
         if not session:
             raise ValueError("Must provide a value for 'session'")
@@ -31,7 +116,103 @@ class BaseClient:
         self.run_async = run_async
         self.timeout = timeout
         self.trust_env = trust_env
+        self.share_pool = share_pool
+        self.connector_limit = connector_limit
+        self.connector_limit_per_host = connector_limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        if retry_policy is not None:
+            self.retry_policy = retry_policy
+        if request_compression_threshold is not None:
+            self.request_compression_threshold = request_compression_threshold
         self._event_loop_ptr = None
+        self._client_session_ptr = None
+        self._client_session_loop = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    def close(self):
+        """Release the connection pool owned by this client
+
+        Clients using the shared pool (the default) leave it open for other
+        clients. See `BaseClient.close_shared_pools` to release those.
+        """
+        session, loop = self._client_session_ptr, self._client_session_loop
+        self._client_session_ptr = None
+        self._client_session_loop = None
+
+        if session is not None:
+            _close_client_session(loop, session)
+
+    async def aclose(self):
+        "Release the connection pool owned by this client from a coroutine"
+        session = self._client_session_ptr
+        self._client_session_ptr = None
+        self._client_session_loop = None
+
+        if session is not None and not session.closed:
+            await session.close()
+
+    @staticmethod
+    def close_shared_pools(loop: asyncio.AbstractEventLoop = None):
+        """Close the connection pools shared between clients (run at exit)
+
+        Only the pools for `loop` are closed if provided.
+        """
+        for pool_loop, pools in list(_shared_pools.items()):
+            if loop is not None and pool_loop is not loop:
+                continue
+
+            for session in pools.values():
+                _close_client_session(pool_loop, session)
+            pools.clear()
+
+    @property
+    def _pool_key(self) -> Tuple[bool, int, int, int, float]:
+        return (
+            self.trust_env,
+            self.connector_limit,
+            self.connector_limit_per_host,
+            self.dns_cache_ttl,
+            self.keepalive_timeout,
+        )
+
+    def _client_session(self) -> aiohttp.ClientSession:
+        """Returns the pooled aiohttp session for the running event loop
+        (creating it if necessary)
+        """
+        loop = asyncio.get_event_loop()
+
+        if not self.share_pool:
+            if (
+                self._client_session_ptr is None
+                or self._client_session_ptr.closed
+                or self._client_session_loop is not loop
+            ):
+                self._client_session_ptr = _new_client_session(self._pool_key)
+                self._client_session_loop = loop
+
+            return self._client_session_ptr
+
+        pools = _shared_pools.setdefault(loop, {})
+        session = pools.get(self._pool_key)
+
+        if session is None or session.closed:
+            session = pools[self._pool_key] = _new_client_session(
+                self._pool_key
+            )
+
+        return session
 
     @property
     def _event_loop(self):
@@ -62,6 +243,7 @@ class BaseClient:
         final_headers = {
             "User-Agent": self._get_user_agent(),
             "Content-Type": "application/x-www-form-urlencoded;charset=utf-8",
+            "Accept-Encoding": "gzip, deflate",
         }
 
         if self.session.token:
@@ -92,8 +274,7 @@ class BaseClient:
         headers: dict = {},
         params: dict = {},
     ) -> Union[asyncio.Future, ApiResponse]:
-        if self.session.is_expired() and self.session.refresh_token:
-            self._refresh_token()
+        self.session.refresh_if_expiring(self._refresh_token)
 
         return self._api_call_impl(
             self.session.api_url,
@@ -115,8 +296,7 @@ class BaseClient:
         data: str = None,
         headers: dict = {},
     ) -> Union[asyncio.Future, ApiResponse]:
-        if self.session.is_expired() and self.session.refresh_token:
-            self._refresh_token()
+        self.session.refresh_if_expiring(self._refresh_token)
 
         return self._api_call_impl(
             self.session.fhir_url,
@@ -137,8 +317,7 @@ class BaseClient:
         data: str = None,
         headers: dict = {},
     ) -> Union[asyncio.Future, ApiResponse]:
-        if self.session.is_expired() and self.session.refresh_token:
-            self._refresh_token()
+        self.session.refresh_if_expiring(self._refresh_token)
 
         return self._api_call_impl(
             self.session.ga4gh_url,
@@ -150,11 +329,12 @@ class BaseClient:
             headers,
         )
 
-    def _refresh_token(self):
-        res = self._api_call_impl(
-            url=self.session.api_url,
-            api_path="oauth/token",
-            data=urlencode(
+    def _refresh_token_args(self) -> dict:
+        "Arguments to `_api_call_impl` for requesting a new access token"
+        return {
+            "url": self.session.api_url,
+            "api_path": "oauth/token",
+            "data": urlencode(
                 {
                     "grant_type": "refresh_token",
                     "client_id": self.session._get_decoded_token().get(
@@ -163,9 +343,17 @@ class BaseClient:
                     "refresh_token": self.session.refresh_token,
                 }
             ),
-            headers={"Authorization": None, "LifeOmic-Account": None},
-        )
-        self.session.token = res.data.get("access_token")
+            "headers": {"Authorization": None, "LifeOmic-Account": None},
+        }
+
+    def _refresh_token(self) -> str:
+        "Request a new access token with the session's refresh token"
+        res = self._api_call_impl(**self._refresh_token_args())
+
+        if asyncio.isfuture(res):
+            res = self._event_loop.run_until_complete(res)
+
+        return res.data.get("access_token")
 
     def _api_call_impl(
         self,
@@ -194,6 +382,39 @@ class BaseClient:
             Union[asyncio.Future, ApiResponse] -- A Future if run_async is True, otherwise the API response
         """
 
+        future = asyncio.ensure_future(
+            self._send(
+                **self._build_request(
+                    url,
+                    api_path,
+                    http_verb,
+                    upload_file,
+                    json,
+                    data,
+                    headers,
+                    params,
+                )
+            ),
+            loop=self._event_loop,
+        )
+
+        if self.run_async:
+            return future
+
+        return self._event_loop.run_until_complete(future)
+
+    def _build_request(
+        self,
+        url: str,
+        api_path: str,
+        http_verb: str = "POST",
+        upload_file: [str, bytes] = None,
+        json: dict = None,
+        data: str = None,
+        headers: dict = {},
+        params: dict = {},
+    ) -> dict:
+        "Build the arguments to `_send` for an API request"
         if self.session.is_expired() and not self.session.refresh_token:
             raise RequestError("The session token has expired.")
 
@@ -209,7 +430,20 @@ class BaseClient:
 
         req_args = {"headers": self._get_headers(has_json, headers)}
         if has_json:
-            req_args["json"] = {k: v for k, v in json.items() if v is not None}
+            # Encoded up front (with the fastest available JSON library) since
+            # DSL queries can contain tens of thousands of terms
+            req_args["data"] = json_codec.dump_bytes(
+                {k: v for k, v in json.items() if v is not None}
+            )
+
+            if (
+                self.request_compression_threshold is not None
+                and len(req_args["data"]) >= self.request_compression_threshold
+            ):
+                req_args["data"] = gzip.compress(
+                    req_args["data"], compresslevel=5
+                )
+                req_args["headers"]["Content-Encoding"] = "gzip"
 
         elif has_data:
             req_args["data"] = data
@@ -220,17 +454,11 @@ class BaseClient:
         if has_params:
             req_args["params"] = params
 
-        api_url = urljoin(url, api_path)
-
-        future = asyncio.ensure_future(
-            self._send(http_verb=http_verb, api_url=api_url, req_args=req_args),
-            loop=self._event_loop,
-        )
-
-        if self.run_async:
-            return future
-
-        return self._event_loop.run_until_complete(future)
+        return {
+            "http_verb": http_verb,
+            "api_url": urljoin(url, api_path),
+            "req_args": req_args,
+        }
 
     @staticmethod
     def _get_user_agent():
@@ -248,29 +476,59 @@ class BaseClient:
         user_agent_string = " ".join([python_version, client, system_info])
         return user_agent_string
 
-    @backoff.on_exception(
-        backoff.expo,
-        (ApiError, OSError),
-        max_tries=3,
-        jitter=backoff.full_jitter,
-    )
     async def _send(self, http_verb, api_url, req_args):
-        open_files = []
+        """Send the request, retrying failures allowed by the client's retry
+        policy
+        """
         upload_file = req_args.pop("file", None)
+        started = time.monotonic()
+        tries = 0
+
+        while True:
+            tries += 1
+
+            try:
+                response = await self._send_once(
+                    http_verb, api_url, req_args, upload_file
+                )
+                response.retries = tries - 1
+                response.validate()
+            except (ApiError, OSError, asyncio.TimeoutError) as err:
+                if isinstance(err, ApiError):
+                    err.response.retries = tries - 1
+
+                delay = self.retry_policy.retry_delay(
+                    http_verb, err, tries, time.monotonic() - started
+                )
+
+                if delay is None:
+                    self.retry_policy.record(tries, succeeded=False)
+                    raise
+
+                await asyncio.sleep(delay)
+                continue
+
+            self.retry_policy.record(tries, succeeded=True)
+            return response
+
+    async def _send_once(self, http_verb, api_url, req_args, upload_file):
+        open_files = []
         if upload_file is not None:
             if isinstance(upload_file, str):
+                # Opened for every attempt so retries upload the whole file
                 f = open(upload_file, "rb")
                 open_files.append(f)
                 req_args["data"] = f
             else:
                 req_args["data"] = upload_file
 
-        res = await self._request(
-            http_verb=http_verb, api_url=api_url, req_args=req_args
-        )
-
-        for f in open_files:
-            f.close()
+        try:
+            res = await self._request(
+                http_verb=http_verb, api_url=api_url, req_args=req_args
+            )
+        finally:
+            for f in open_files:
+                f.close()
 
         data = {
             "client": self,
@@ -278,25 +536,165 @@ class BaseClient:
             "api_url": api_url,
             "req_args": req_args,
         }
-        return ApiResponse(**{**data, **res}).validate()
+        return ApiResponse(**{**data, **res})
 
     async def _request(self, *, http_verb, api_url, req_args):
-        """Submit the HTTP request with the running session or a new session.
+        """Submit the HTTP request with the pooled session for this event loop
+        (throttled by the limiter shared by all clients for the host).
 
         Returns:
             A dictionary of the response data.
         """
-        async with aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=self.timeout),
-            trust_env=self.trust_env,
-        ) as session:
-            async with session.request(http_verb, api_url, **req_args) as res:
+        limiter = host_limiter(api_url)
+        await limiter.acquire()
+
+        started = time.monotonic()
+        status = None
+        cancelled = False
+
+        try:
+            async with self._client_session().request(
+                http_verb,
+                api_url,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                **req_args,
+            ) as res:
+                body = await res.read()
+                status = res.status
+
                 return {
-                    "data": await (
-                        res.json()
+                    "data": (
+                        (json_codec.loads(body) if body.strip() else None)
                         if res.content_type == "application/json"
-                        else res.text()
+                        else await res.text()
                     ),
                     "headers": res.headers,
                     "status_code": res.status,
+                    "size": len(body),
                 }
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            if cancelled:
+                limiter.discard()
+            else:
+                limiter.release(status, time.monotonic() - started)
+
+
+class AsyncBaseClient(BaseClient):
+    """Base client whose API calls are coroutines that run on the caller's
+    event loop (instead of blocking in `run_until_complete`)
+
+    Accepts the same parameters as `BaseClient` (except `run_async`).
+
+    Examples
+    --------
+    >>> from phc.services import AsyncFhir
+    >>> async with AsyncFhir(session) as fhir:
+    >>>     responses = await asyncio.gather(
+    >>>         *[fhir.dsl(project_id, query) for query in queries]
+    >>>     )
+    """
+
+    def __init__(self, session: Session, **kwargs):
+        super().__init__(session, **{**kwargs, "run_async": True})
+
+    async def _api_call(
+        self,
+        api_path: str,
+        http_verb: str = "POST",
+        upload_file: [str, bytes] = None,
+        json: dict = None,
+        data: str = None,
+        headers: dict = {},
+        params: dict = {},
+    ) -> ApiResponse:
+        await self.session.arefresh_if_expiring(self._refresh_token)
+
+        return await self._api_call_impl(
+            self.session.api_url,
+            api_path,
+            http_verb,
+            upload_file,
+            json,
+            data,
+            headers,
+            params,
+        )
+
+    async def _fhir_call(
+        self,
+        api_path: str,
+        http_verb: str = "POST",
+        upload_file: [str, bytes] = None,
+        json: dict = None,
+        data: str = None,
+        headers: dict = {},
+    ) -> ApiResponse:
+        await self.session.arefresh_if_expiring(self._refresh_token)
+
+        return await self._api_call_impl(
+            self.session.fhir_url,
+            api_path,
+            http_verb,
+            upload_file,
+            json,
+            data,
+            headers,
+        )
+
+    async def _ga4gh_call(
+        self,
+        api_path: str,
+        http_verb: str = "POST",
+        upload_file: [str, bytes] = None,
+        json: dict = None,
+        data: str = None,
+        headers: dict = {},
+    ) -> ApiResponse:
+        await self.session.arefresh_if_expiring(self._refresh_token)
+
+        return await self._api_call_impl(
+            self.session.ga4gh_url,
+            api_path,
+            http_verb,
+            upload_file,
+            json,
+            data,
+            headers,
+        )
+
+    async def _refresh_token(self) -> str:
+        "Request a new access token with the session's refresh token"
+        res = await self._api_call_impl(**self._refresh_token_args())
+
+        return res.data.get("access_token")
+
+    async def _api_call_impl(
+        self,
+        url: str,
+        api_path: str,
+        http_verb: str = "POST",
+        upload_file: [str, bytes] = None,
+        json: dict = None,
+        data: str = None,
+        headers: dict = {},
+        params: dict = {},
+    ) -> ApiResponse:
+        "Sends an API request on the running event loop"
+        return await self._send(
+            **self._build_request(
+                url,
+                api_path,
+                http_verb,
+                upload_file,
+                json,
+                data,
+                headers,
+                params,
+            )
+        )
+
+
+atexit.register(BaseClient.close_shared_pools)
@@ -1,5 +1,6 @@
 from phc.easy.audit_event import AuditEvent
 from phc.easy.auth import Auth
+from phc.easy.cache import Cache
 from phc.easy.care_plan import CarePlan
 from phc.easy.codeable import Codeable
 from phc.easy.condition import Condition
@@ -38,6 +39,7 @@ from phc.easy.specimen import Specimen
 __all__ = [
     "AuditEvent",
     "Auth",
+    "Cache",
     "CarePlan",
     "Codeable",
     "Condition",
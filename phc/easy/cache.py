@@ -0,0 +1,492 @@
+"""Lifecycle management of the API cache
+
+Every cached result is recorded in an index file in the cache directory with
+its size, when it was created and last used, and when it expires. The index is
+used to expire entries after a TTL, evict the least recently used entries once
+the cache exceeds a size budget, and invalidate entries by table or project.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Union
+
+import pandas as pd
+
+try:
+    import fcntl as _fcntl
+except ImportError:
+    _fcntl = None
+
+try:
+    import msvcrt as _msvcrt
+except ImportError:
+    _msvcrt = None
+
+DIR = "~/Downloads/phc/api-cache"
+INDEX_FILENAME = "index.json"
+LOCK_FILENAME = ".index.lock"
+# Files of cache writes that have not finished
+IN_PROGRESS_SUFFIXES = (".partial", ".schema.json", ".tmp")
+# Seconds between recorded uses of an entry so that cache hits do not rewrite
+# the index every time
+ACCESS_RESOLUTION = 60
+
+# Leaves settings of `Cache.configure` that were not given unchanged
+_UNSET = object()
+
+
+def _size(path: Path) -> int:
+    "Bytes used by a cached file (or directory of Parquet parts)"
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+    return path.stat().st_size
+
+
+def _remove(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    elif path.exists():
+        path.unlink()
+
+
+def _expires(now: float, ttls: List[Optional[float]]) -> Optional[float]:
+    "When an entry expires given the TTLs that apply to it (if any)"
+    ttls = [ttl for ttl in ttls if ttl is not None]
+
+    return None if len(ttls) == 0 else now + min(ttls)
+
+
+class _IndexLock:
+    """Serializes updates of the index between threads (reentrantly) and
+    between processes (with a lock file in the cache folder)
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+
+        if self._depth == 0:
+            try:
+                self._file = self._lock_file()
+            except BaseException:
+                self._lock.release()
+                raise
+
+        self._depth += 1
+        return self
+
+    def __exit__(self, *args):
+        self._depth -= 1
+
+        if self._depth == 0 and self._file is not None:
+            if _fcntl is not None:
+                _fcntl.flock(self._file.fileno(), _fcntl.LOCK_UN)
+            elif _msvcrt is not None:
+                self._file.seek(0)
+                _msvcrt.locking(self._file.fileno(), _msvcrt.LK_UNLCK, 1)
+
+            self._file.close()
+            self._file = None
+
+        self._lock.release()
+
+    @staticmethod
+    def _lock_file():
+        folder = Cache.folder()
+        folder.mkdir(parents=True, exist_ok=True)
+
+        file = open(folder.joinpath(LOCK_FILENAME), "a+")
+
+        if _fcntl is not None:
+            _fcntl.flock(file.fileno(), _fcntl.LOCK_EX)
+        elif _msvcrt is not None:
+            file.seek(0)
+            # Retries for about 10 seconds before raising
+            _msvcrt.locking(file.fileno(), _msvcrt.LK_LOCK, 1)
+
+        return file
+
+
+class Cache:
+    """Inspect, limit, and prune the API cache
+
+    Settings apply to every cache entry written by this process (see
+    `Cache.configure`).
+
+    Attributes
+    ----------
+    max_bytes : int
+        The size budget of the cache. Least recently used entries are evicted
+        when it is exceeded (no limit by default).
+
+    ttl : float
+        Seconds an entry may be used for after it is written (entries never
+        expire by default, except for the results of API requests such as
+        counts and aggregations, see `APICache.write_api`)
+
+    Examples
+    --------
+    >>> import phc.easy as phc
+    >>> phc.Cache.configure(max_bytes=20 * 1024 ** 3, ttl=7 * 24 * 60 * 60)
+    >>> phc.Cache.stats()
+    >>> phc.Cache.invalidate(table="observation")
+    """
+
+    max_bytes: Optional[int] = None
+    ttl: Optional[float] = None
+
+    _stats = {"hits": 0, "misses": 0, "evictions": 0}
+    _lock = _IndexLock()
+
+    @staticmethod
+    def configure(
+        max_bytes: Union[Optional[int], object] = _UNSET,
+        ttl: Union[Optional[float], object] = _UNSET,
+    ):
+        """Set the size budget and/or TTL of new entries (and prune the cache
+        to the new budget). Settings that are not given are left unchanged.
+
+        Attributes
+        ----------
+        max_bytes : int
+            The size budget of the cache (None for no limit)
+
+        ttl : float
+            Seconds an entry may be used for after it is written (None to
+            never expire)
+        """
+        if max_bytes is not _UNSET:
+            Cache.max_bytes = max_bytes
+
+        if ttl is not _UNSET:
+            Cache.ttl = ttl
+
+        Cache.prune()
+
+    @staticmethod
+    def folder() -> Path:
+        return Path(DIR).expanduser()
+
+    @staticmethod
+    def lookup(filename: str, key: Optional[str] = None) -> bool:
+        """Whether a usable entry exists for a cache file (recording a hit or
+        miss). Expired entries are removed.
+
+        An entry recorded with a different `key` (e.g. a query whose hash
+        shares the prefix in the filename) is not usable.
+        """
+        with Cache._lock:
+            index = Cache._load_index()
+            path = Cache.folder().joinpath(filename)
+            entry = index.get(filename)
+            now = time.time()
+
+            if not path.exists():
+                if entry is not None:
+                    del index[filename]
+                    Cache._save_index(index)
+
+                Cache._stats["misses"] += 1
+                return False
+
+            if entry is None:
+                # Written outside of the index (e.g. by an older version)
+                entry = Cache._untracked_entry(path)
+            elif (
+                key is not None
+                and entry.get("key") is not None
+                and entry["key"] != key
+            ):
+                Cache._stats["misses"] += 1
+                return False
+            elif entry.get("expires") is not None and entry["expires"] <= now:
+                _remove(path)
+                del index[filename]
+                Cache._save_index(index)
+
+                Cache._stats["evictions"] += 1
+                Cache._stats["misses"] += 1
+                return False
+
+            if (
+                filename not in index
+                or now - entry["accessed"] >= ACCESS_RESOLUTION
+            ):
+                index[filename] = {**entry, "accessed": now}
+                Cache._save_index(index)
+
+            Cache._stats["hits"] += 1
+            return True
+
+    @staticmethod
+    def add(
+        filename: str,
+        table: Optional[str] = None,
+        project_id: Optional[str] = None,
+        account: Optional[str] = None,
+        key: Optional[str] = None,
+        metadata: Optional[dict] = None,
+        keep: Iterable[str] = (),
+        ttl: Optional[float] = None,
+    ):
+        """Record a newly written cache file and evict entries to stay within
+        the size budget
+
+        Attributes
+        ----------
+        filename : str
+            The name of the file (or directory) in the cache folder
+
+        table : str
+            The table of the cached results (for invalidation)
+
+        project_id : str
+            The project of the cached results (for invalidation)
+
+        account : str
+            The account of the cached results
+
+        key : str
+            The full key of the cached results (see `lookup`)
+
+        metadata : dict
+            Additional details to keep with the entry (see `entry`)
+
+        keep : Iterable[str]
+            Other cache files that should not be evicted to make room (e.g.
+            written by the same retrieval)
+
+        ttl : float
+            Seconds this entry may be used for (the shorter of this and
+            `Cache.ttl` applies)
+        """
+        path = Cache.folder().joinpath(filename)
+
+        if not path.exists():
+            return
+
+        with Cache._lock:
+            index = Cache._load_index()
+            now = time.time()
+
+            index[filename] = {
+                "key": key,
+                "table": table,
+                "project_id": project_id,
+                "account": account,
+                "size": _size(path),
+                "created": now,
+                "accessed": now,
+                "expires": _expires(now, [Cache.ttl, ttl]),
+                **(metadata or {}),
+            }
+
+            Cache._save_index(index)
+            Cache.prune(keep=[filename, *keep])
+
+    @staticmethod
+    def entry(filename: str) -> Optional[dict]:
+        "The index entry of a cache file (if recorded)"
+        with Cache._lock:
+            return Cache._load_index().get(filename)
+
+    @staticmethod
+    def prune(keep: Optional[Union[str, Iterable[str]]] = None) -> int:
+        """Remove expired entries and then the least recently used entries
+        until the cache fits in `max_bytes`
+
+        Attributes
+        ----------
+        keep : str | Iterable[str]
+            Cache files that should not be evicted (e.g. just written)
+
+        Returns the number of entries removed.
+        """
+        keep = set([keep] if isinstance(keep, str) else keep or [])
+
+        with Cache._lock:
+            index = Cache._load_index()
+            now = time.time()
+
+            expired = [
+                filename
+                for filename, entry in index.items()
+                if entry.get("expires") is not None and entry["expires"] <= now
+            ]
+
+            evicted = [*expired]
+            remaining = {
+                filename: entry
+                for filename, entry in index.items()
+                if filename not in expired
+            }
+
+            if Cache.max_bytes is not None:
+                total = sum(entry["size"] for entry in remaining.values())
+
+                for filename, entry in sorted(
+                    remaining.items(), key=lambda item: item[1]["accessed"]
+                ):
+                    if total <= Cache.max_bytes:
+                        break
+
+                    if filename in keep:
+                        continue
+
+                    evicted.append(filename)
+                    total -= entry["size"]
+
+            return Cache._remove_entries(index, evicted)
+
+    @staticmethod
+    def invalidate(
+        table: Optional[str] = None, project_id: Optional[str] = None
+    ) -> int:
+        """Remove the entries for a table and/or project (or every entry if
+        neither is given)
+
+        Returns the number of entries removed.
+        """
+        with Cache._lock:
+            index = Cache._load_index()
+
+            return Cache._remove_entries(
+                index,
+                [
+                    filename
+                    for filename, entry in index.items()
+                    if (table is None or entry.get("table") == table)
+                    and (
+                        project_id is None
+                        or entry.get("project_id") == project_id
+                    )
+                ],
+                count_as_evictions=False,
+            )
+
+    @staticmethod
+    def clear() -> int:
+        "Remove every entry"
+        return Cache.invalidate()
+
+    @staticmethod
+    def entries() -> pd.DataFrame:
+        "The cache entries (most recently used first)"
+        with Cache._lock:
+            index = Cache._load_index()
+
+        columns = [
+            "filename",
+            "key",
+            "table",
+            "project_id",
+            "account",
+            "size",
+            "created",
+            "accessed",
+            "expires",
+        ]
+
+        df = pd.DataFrame(
+            [{"filename": name, **entry} for name, entry in index.items()],
+            columns=columns,
+        )
+
+        for column in ["created", "accessed", "expires"]:
+            df[column] = pd.to_datetime(df[column], unit="s")
+
+        return df.sort_values("accessed", ascending=False).reset_index(
+            drop=True
+        )
+
+    @staticmethod
+    def stats() -> Dict[str, int]:
+        """Hits, misses, and evictions by this process along with the number
+        of entries and bytes used by the cache
+        """
+        with Cache._lock:
+            index = Cache._load_index()
+
+            return {
+                **Cache._stats,
+                "entries": len(index),
+                "bytes": sum(entry["size"] for entry in index.values()),
+            }
+
+    @staticmethod
+    def _remove_entries(
+        index: dict, filenames: List[str], count_as_evictions: bool = True
+    ) -> int:
+        for filename in filenames:
+            _remove(Cache.folder().joinpath(filename))
+            index.pop(filename, None)
+
+        if len(filenames) > 0:
+            Cache._save_index(index)
+
+        if count_as_evictions:
+            Cache._stats["evictions"] += len(filenames)
+
+        return len(filenames)
+
+    @staticmethod
+    def _untracked_entry(path: Path) -> dict:
+        modified = path.stat().st_mtime
+
+        return {
+            "key": None,
+            "table": None,
+            "project_id": None,
+            "account": None,
+            "size": _size(path),
+            "created": modified,
+            "accessed": modified,
+            "expires": None,
+        }
+
+    @staticmethod
+    def _load_index() -> Dict[str, dict]:
+        folder = Cache.folder()
+        index_path = folder.joinpath(INDEX_FILENAME)
+
+        if index_path.exists():
+            try:
+                with open(index_path, "r") as f:
+                    return json.load(f)
+            except ValueError:
+                # Rebuilt below if the index was corrupted (e.g. interrupted)
+                pass
+
+        if not folder.exists():
+            return {}
+
+        # Adopt files cached before the index existed so they can be pruned
+        return {
+            path.name: Cache._untracked_entry(path)
+            for path in folder.iterdir()
+            if path.name != INDEX_FILENAME
+            and not path.name.startswith(".")
+            and not path.name.endswith(IN_PROGRESS_SUFFIXES)
+        }
+
+    @staticmethod
+    def _save_index(index: Dict[str, dict]):
+        folder = Cache.folder()
+        folder.mkdir(parents=True, exist_ok=True)
+
+        # Replaced atomically so readers never see a partially written index
+        partial_path = folder.joinpath(f".{INDEX_FILENAME}.{os.getpid()}")
+
+        with open(partial_path, "w") as f:
+            json.dump(index, f)
+
+        os.replace(partial_path, folder.joinpath(INDEX_FILENAME))
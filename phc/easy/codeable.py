@@ -1,6 +1,8 @@
+import json
 import math
 import re
 from functools import reduce
+from typing import Dict, Optional
 
 import pandas as pd
 
@@ -167,14 +169,93 @@ def generic_codeable_to_dict(codeable, prefix=""):
     return result
 
 
+def _cell_key(codeable):
+    "Hashable key for memoizing identical cells (or None if not possible)"
+    if isinstance(codeable, (dict, list)):
+        try:
+            return json.dumps(codeable)
+        except (TypeError, ValueError):
+            return None
+
+    try:
+        hash(codeable)
+    except TypeError:
+        return None
+
+    return (type(codeable), codeable)
+
+
+def expand_codeable_values(
+    values, memo: Optional[dict] = None, max_memo_size: Optional[int] = None
+) -> Dict[str, list]:
+    """Flatten codeable values into columns of equal length (missing values
+    are NaN)
+
+    Identical cells (e.g. the same meta tags or code on every record) are only
+    flattened once. Passing the same memo for several batches carries this
+    across batches (up to `max_memo_size` distinct cells).
+    """
+    memo = {} if memo is None else memo
+    positions = {}
+    column_values = {}
+
+    for index, codeable in enumerate(values):
+        key = _cell_key(codeable)
+        flattened = memo.get(key) if key is not None else None
+
+        if flattened is None:
+            flattened = generic_codeable_to_dict(codeable)
+            if key is not None and (
+                max_memo_size is None or len(memo) < max_memo_size
+            ):
+                memo[key] = flattened
+
+        for column, value in flattened.items():
+            if column not in positions:
+                positions[column] = []
+                column_values[column] = []
+
+            positions[column].append(index)
+            column_values[column].append(value)
+
+    def build_column(column):
+        column_positions = positions[column]
+        if len(column_positions) == len(values):
+            return column_values[column]
+
+        result = [math.nan] * len(values)
+        for index, value in zip(column_positions, column_values[column]):
+            result[index] = value
+
+        return result
+
+    return {column: build_column(column) for column in positions}
+
+
 class Codeable:
     @staticmethod
-    def expand_column(codeable_col: pd.Series):
+    def expand_column(
+        codeable_col: pd.Series,
+        memo: Optional[dict] = None,
+        max_memo_size: Optional[int] = None,
+    ):
         """Convert a pandas dictionary column with codeable data into a data frame
 
         Attributes
         ----------
         codeable_col : pd.Series
             A pandas column that contains codeable data (FHIR resources)
+
+        memo : dict
+            Flattened cells to reuse (e.g. from previous batches of the same
+            column)
+
+        max_memo_size : int
+            The maximum number of distinct cells to keep in the memo
         """
-        return pd.DataFrame(map(generic_codeable_to_dict, codeable_col.values))
+        values = codeable_col.values
+
+        return pd.DataFrame(
+            expand_codeable_values(values, memo, max_memo_size),
+            index=pd.RangeIndex(len(values)),
+        )
@@ -1,5 +1,9 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
 from toolz import curry
-from typing import Callable, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 
 import re
 import pandas as pd
@@ -38,6 +42,210 @@ def column_to_frame(frame: pd.DataFrame, column_name: str, expand_func):
     return pd.DataFrame([])
 
 
+def _expand_codeable_like_column(column: pd.Series, column_name: str):
+    return Codeable.expand_column(column).add_prefix(f"{column_name}.")
+
+
+def _expand_json_normalize_column(column: pd.Series, column_name: str):
+    return pd.json_normalize(column).add_prefix(f"{column_name}.")
+
+
+class ExpansionPlan:
+    """Expansion state that is reused across the batches of a single
+    retrieval (e.g. every page of a scroll for one resource type)
+
+    The column layout of the expanded batches is compiled once from the
+    columns the resource declares (the code, date, and custom columns its
+    `transform_results` passes to `Frame.expand`) and from the projection
+    (when only some fields are retrieved). Every expanded batch is conformed
+    to it (see `conform`) so writers see the same columns in the same order:
+
+    - Declared date columns and projected fields are always present (empty
+      when a batch has no values for them)
+    - Columns expanded from a code or custom column are kept together in that
+      column's place. Their names depend on the values (e.g. the coding
+      systems), so they are added as batches produce them.
+    - Columns the layout does not declare are appended as they are found
+
+    Flattened codeable cells are also remembered so values repeated across
+    batches (e.g. the same codes and meta tags) are only flattened once.
+
+    When batches are expanded with workers, the plan also owns the process
+    pool so it is only started once per retrieval (close the plan or use it as
+    a context manager to shut the pool down).
+
+    While a plan is active (see `ExpansionPlan.active`), `Frame.expand` uses
+    it (and its `workers`) for any batch it is not given a plan for.
+
+    Attributes
+    ----------
+    max_memo_size : int
+        The maximum number of distinct cells remembered per code column
+
+    workers : int
+        The number of processes to expand batches in (if not given to
+        `Frame.expand`)
+
+    projection : List[str]
+        The fields retrieved for each record (see `columns` of
+        `build_query`), if not whole records
+    """
+
+    def __init__(
+        self,
+        max_memo_size: int = 10000,
+        workers: Optional[int] = None,
+        projection: Optional[List[str]] = None,
+    ):
+        self.max_memo_size = max_memo_size
+        self.workers = workers
+        self.projection = projection
+        self.columns: List[str] = []
+        # Declared columns (and whether each is a code or custom column whose
+        # expanded columns are found in the values)
+        self._layout: Optional[List[Tuple[str, bool]]] = None
+        self._expanded_columns: Dict[str, List[str]] = {}
+        self._found_columns: List[str] = []
+        self._known_columns = set()
+        self._memos = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_workers = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @contextmanager
+    def active(self):
+        "Use this plan for every expansion in the block"
+        token = _active_plan.set(self)
+
+        try:
+            yield self
+        finally:
+            _active_plan.reset(token)
+
+    def executor(self, workers: int) -> ProcessPoolExecutor:
+        "The process pool shared by every batch (started on first use)"
+        if self._executor is None or self._executor_workers != workers:
+            self.close()
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+            self._executor_workers = workers
+
+        return self._executor
+
+    def close(self):
+        "Shut down the process pool (if started)"
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def memo(self, column_name: str) -> dict:
+        "The flattened cells remembered for a code column"
+        return self._memos.setdefault(column_name, {})
+
+    def compile(
+        self,
+        code_columns: List[str],
+        date_columns: List[str],
+        custom_columns: List[Tuple[str, Callable[[pd.Series], pd.DataFrame]]],
+    ):
+        """Build the column layout from the columns the resource declares
+        (the arguments of `Frame.expand`) unless it has already been built
+        """
+        if self._layout is not None:
+            return
+
+        expanded = [
+            *[key for key, _func in custom_columns],
+            *CODE_COLUMNS,
+            *code_columns,
+        ]
+        all_date_columns = [*DATE_COLUMNS, *date_columns]
+
+        def parsed(column: str):
+            return [(f"{column}.tz", False), (f"{column}.local", False)]
+
+        if self.projection is None:
+            # Only dates declared for this resource (not the shared ones that
+            # most resources do not have)
+            layout = [
+                ("id", False),
+                *[(column, True) for column in expanded],
+                *[entry for column in date_columns for entry in parsed(column)],
+            ]
+        else:
+            fields = dict.fromkeys(
+                ["id", *[column.split(".")[0] for column in self.projection]]
+            )
+            layout = []
+
+            for field in fields:
+                if field in all_date_columns:
+                    layout.extend(parsed(field))
+                elif field in expanded:
+                    layout.append((field, True))
+                    layout.extend(
+                        entry
+                        for column in all_date_columns
+                        if column.startswith(f"{field}.")
+                        for entry in parsed(column)
+                    )
+                else:
+                    layout.append((field, False))
+
+        self._layout = list(dict.fromkeys(layout))
+
+    def conform(self, frame: pd.DataFrame) -> pd.DataFrame:
+        "Reindex an expanded batch to the layout of all previous batches"
+        if not frame.columns.is_unique:
+            return frame
+
+        layout = self._layout or []
+        declared = set(name for name, is_expanded in layout if not is_expanded)
+        prefixes = sorted(
+            (f"{name}." for name, is_expanded in layout if is_expanded),
+            key=len,
+            reverse=True,
+        )
+
+        for column in frame.columns:
+            if column in self._known_columns or column in declared:
+                continue
+
+            self._known_columns.add(column)
+            prefix = next((p for p in prefixes if column.startswith(p)), None)
+
+            if prefix is not None:
+                self._expanded_columns.setdefault(prefix, []).append(column)
+            else:
+                self._found_columns.append(column)
+
+        self.columns = [
+            *[
+                column
+                for name, is_expanded in layout
+                for column in (
+                    self._expanded_columns.get(f"{name}.", [])
+                    if is_expanded
+                    else [name]
+                )
+            ],
+            *self._found_columns,
+        ]
+
+        if list(frame.columns) == self.columns:
+            return frame
+
+        return frame.reindex(columns=self.columns)
+
+
+# The plan of the retrieval being expanded (see ExpansionPlan.active)
+_active_plan = ContextVar("active_expansion_plan", default=None)
+
+
 class Frame:
     @staticmethod
     @curry
@@ -57,11 +265,20 @@ class Frame:
     @staticmethod
     def codeable_like_column_expander(column_name: str):
         """Codeable expansion with prefix for passing to Frame.expand#custom_columns"""
+        return (
+            column_name,
+            partial(_expand_codeable_like_column, column_name=column_name),
+        )
 
-        def _expander(column):
-            return Codeable.expand_column(column).add_prefix(f"{column_name}.")
-
-        return (column_name, _expander)
+    @staticmethod
+    def json_normalize_column_expander(column_name: str):
+        """Normalized JSON expansion with prefix for passing to
+        Frame.expand#custom_columns
+        """
+        return (
+            column_name,
+            partial(_expand_json_normalize_column, column_name=column_name),
+        )
 
     @staticmethod
     def expand(
@@ -71,6 +288,8 @@ class Frame:
         custom_columns: List[
             Tuple[str, Callable[[pd.Series], pd.DataFrame]]
         ] = [],
+        workers: Optional[int] = None,
+        plan: Optional[ExpansionPlan] = None,
     ):
         """Expand a data frame with FHIR codes, nested JSON structures, etc into a full,
         tabular data frame that can much more easily be wrangled
@@ -91,110 +310,216 @@ class Frame:
             column to a data frame. This will get merged index-wise into the
             combined frame
 
+        workers : int
+            The number of processes to expand chunks of rows in (the frame is
+            expanded in this process if not specified). Custom column
+            functions must be picklable (e.g. not lambdas) to use workers.
+
+        plan : ExpansionPlan
+            Expansion state shared with other batches of the same retrieval
+            (compiled from the declared columns on first use, see
+            `ExpansionPlan.conform` for a stable column layout). With
+            workers, the plan's process pool is reused and each worker
+            remembers flattened cells across the batches it expands. Defaults
+            to the active plan (see `ExpansionPlan.active`).
+
         """
-        all_code_columns = [*CODE_COLUMNS, *code_columns]
-        all_date_columns = [*DATE_COLUMNS, *date_columns]
+        plan = plan or _active_plan.get()
 
-        codeable_column_names = [
-            key for key in all_code_columns if key in frame.columns
-        ]
+        if plan is not None:
+            plan.compile(code_columns, date_columns, custom_columns)
 
-        custom_names = [
-            key for key, _func in custom_columns if key in frame.columns
-        ]
+        if workers is None and plan is not None:
+            workers = plan.workers
 
-        progress = (
-            tqdm(
-                total=(
-                    len(codeable_column_names)
-                    + len(all_date_columns)
-                    + len(custom_names)
-                ),
-                # If doing many batches, we don't want to pollute with boatloads
-                # of progress indicators around.
-                leave=False,
+        if workers is not None and workers > 1 and len(frame) > 1:
+            return _expand_in_processes(
+                frame, code_columns, date_columns, custom_columns, workers, plan
             )
-            if tqdm
-            else None
+
+        return _expand(
+            frame, code_columns, date_columns, custom_columns, plan=plan
         )
 
-        code_frames = [
+
+def _expand(
+    frame: pd.DataFrame,
+    code_columns: List[str],
+    date_columns: List[str],
+    custom_columns: List[Tuple[str, Callable[[pd.Series], pd.DataFrame]]],
+    show_progress: bool = True,
+    plan: Optional[ExpansionPlan] = None,
+):
+    all_code_columns = [*CODE_COLUMNS, *code_columns]
+    all_date_columns = [*DATE_COLUMNS, *date_columns]
+
+    codeable_column_names = [
+        key for key in all_code_columns if key in frame.columns
+    ]
+
+    custom_names = [
+        key for key, _func in custom_columns if key in frame.columns
+    ]
+
+    progress = (
+        tqdm(
+            total=(
+                len(codeable_column_names)
+                + len(all_date_columns)
+                + len(custom_names)
+            ),
+            # If doing many batches, we don't want to pollute with boatloads
+            # of progress indicators around.
+            leave=False,
+        )
+        if tqdm and show_progress
+        else None
+    )
+
+    code_frames = [
+        (
+            update_progress(progress, 1, col_name)
+            and Codeable.expand_column(
+                frame[col_name],
+                memo=plan.memo(col_name) if plan else None,
+                max_memo_size=plan.max_memo_size if plan else None,
+            ).add_prefix(f"{col_name}.")
+        )
+        for col_name in codeable_column_names
+    ]
+
+    columns = [
+        frame.drop([*codeable_column_names, *custom_names], axis=1),
+        *[
             (
-                update_progress(progress, 1, col_name)
-                and Codeable.expand_column(frame[col_name]).add_prefix(
-                    f"{col_name}."
-                )
+                update_progress(progress, 1, key)
+                and column_to_frame(frame, key, func)
+            )
+            for key, func in custom_columns
+        ],
+        *code_frames,
+    ]
+
+    combined = pd.concat(columns, axis=1)
+
+    date_column_names = list(
+        filter(lambda k: k in combined.columns, all_date_columns)
+    )
+
+    # Jump past date_columns not in expanded column
+    update_progress(
+        progress,
+        len(all_date_columns) - len(date_column_names),
+        "Parsing dates...",
+    )
+
+    # Mutate data frame to parse date columns
+    for column_key in date_column_names:
+        update_progress(progress, 1, column_key)
+        local_key = f"{column_key}.local"
+        tz_key = f"{column_key}.tz"
+
+        try:
+            utc = pd.to_datetime(combined[column_key], utc=True)
+
+            # Cleverness: Use regex to remove TZ and parse as utc=True to
+            # produce local datetime. The column name will have ".local" as
+            # suffix so it'll be clear what's happening.
+            localized = pd.to_datetime(
+                combined[column_key].str.replace(TZ_REGEX, "", regex=True),
+                utc=True,
+            )
+        except pd.errors.OutOfBoundsDatetime as ex:
+            print(
+                "[WARNING]: OutOfBoundsDatetime encountered. Casting to NaT.",
+                ex,
+            )
+            utc = pd.to_datetime(
+                combined[column_key], utc=True, errors="coerce"
+            )
+            localized = pd.to_datetime(
+                combined[column_key].str.replace(TZ_REGEX, "", regex=True),
+                utc=True,
+                errors="coerce",
             )
-            for col_name in codeable_column_names
-        ]
 
-        columns = [
-            frame.drop([*codeable_column_names, *custom_names], axis=1),
-            *[
-                (
-                    update_progress(progress, 1, key)
-                    and column_to_frame(frame, key, func)
-                )
-                for key, func in custom_columns
-            ],
-            *code_frames,
-        ]
+        combined[tz_key] = (localized - utc).dt.total_seconds() / 3600
+        combined[local_key] = localized
 
-        combined = pd.concat(columns, axis=1)
+    update_progress(progress, 0, "Finishing expansion...")
 
-        date_column_names = list(
-            filter(lambda k: k in combined.columns, all_date_columns)
-        )
+    if progress:
+        progress.close()
 
-        # Jump past date_columns not in expanded column
-        update_progress(
-            progress,
-            len(all_date_columns) - len(date_column_names),
-            "Parsing dates...",
-        )
+    # Sort columns by original order (where possible)
+    return combined.reindex(
+        sorted(
+            [c for c in combined.columns if c not in date_column_names],
+            key=Frame._find_index_of_similar(frame.columns),
+        ),
+        axis="columns",
+    )
 
-        # Mutate data frame to parse date columns
-        for column_key in date_column_names:
-            update_progress(progress, 1, column_key)
-            local_key = f"{column_key}.local"
-            tz_key = f"{column_key}.tz"
 
-            try:
-                utc = pd.to_datetime(combined[column_key], utc=True)
+# The plan of a worker process (so cells are remembered across the batches of
+# a retrieval that the worker expands)
+_worker_plan: Optional[ExpansionPlan] = None
 
-                # Cleverness: Use regex to remove TZ and parse as utc=True to
-                # produce local datetime. The column name will have ".local" as
-                # suffix so it'll be clear what's happening.
-                localized = pd.to_datetime(
-                    combined[column_key].str.replace(TZ_REGEX, ""), utc=True
-                )
-            except pd.errors.OutOfBoundsDatetime as ex:
-                print(
-                    "[WARNING]: OutOfBoundsDatetime encountered. Casting to NaT.",
-                    ex,
-                )
-                utc = pd.to_datetime(
-                    combined[column_key], utc=True, errors="coerce"
-                )
-                localized = pd.to_datetime(
-                    combined[column_key].str.replace(TZ_REGEX, ""),
-                    utc=True,
-                    errors="coerce",
-                )
 
-            combined[tz_key] = (localized - utc).dt.total_seconds() / 3600
-            combined[local_key] = localized
+def _expand_chunk(args):
+    "Expand a chunk of rows in a worker process (without progress)"
+    global _worker_plan
 
-        update_progress(progress, 0, "Finishing expansion...")
+    *expand_args, max_memo_size = args
 
-        if progress:
-            progress.close()
+    if max_memo_size is None:
+        return _expand(*expand_args, show_progress=False)
 
-        # Sort columns by original order (where possible)
-        return combined.reindex(
-            sorted(
-                [c for c in combined.columns if c not in date_column_names],
-                key=Frame._find_index_of_similar(frame.columns),
-            ),
-            axis="columns",
+    if _worker_plan is None or _worker_plan.max_memo_size != max_memo_size:
+        _worker_plan = ExpansionPlan(max_memo_size=max_memo_size)
+
+    return _expand(*expand_args, show_progress=False, plan=_worker_plan)
+
+
+def _expand_in_processes(
+    frame: pd.DataFrame,
+    code_columns: List[str],
+    date_columns: List[str],
+    custom_columns: List[Tuple[str, Callable[[pd.Series], pd.DataFrame]]],
+    workers: int,
+    plan: Optional[ExpansionPlan] = None,
+):
+    chunk_count = min(workers, len(frame))
+    bounds = [
+        (len(frame) * i // chunk_count, len(frame) * (i + 1) // chunk_count)
+        for i in range(chunk_count)
+    ]
+
+    # Expanded columns are aligned to a range index so each chunk starts at 0
+    chunks = [
+        (
+            frame.iloc[start:end].reset_index(drop=True),
+            code_columns,
+            date_columns,
+            custom_columns,
+            plan.max_memo_size if plan else None,
         )
+        for start, end in bounds
+    ]
+
+    if plan is not None:
+        expanded = list(plan.executor(workers).map(_expand_chunk, chunks))
+    else:
+        with ProcessPoolExecutor(max_workers=chunk_count) as executor:
+            expanded = list(executor.map(_expand_chunk, chunks))
+
+    combined = pd.concat(expanded, ignore_index=True, sort=False)
+    combined.index = frame.index
+
+    # Chunks may have found different columns so sort the union again
+    return combined.reindex(
+        sorted(
+            combined.columns, key=Frame._find_index_of_similar(frame.columns)
+        ),
+        axis="columns",
+    )
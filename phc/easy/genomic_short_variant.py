@@ -198,6 +198,7 @@ class GenomicShortVariant(PagingApiItem):
         max_pages: Optional[int] = None,
         page_size: Optional[int] = None,
         log: bool = False,
+        ignore_cache: bool = False,
         **kw_args,
     ):
         """Execute a request for genomic short variants
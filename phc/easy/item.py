@@ -1,10 +1,15 @@
-from typing import List, Optional, Union
+from contextlib import contextmanager
+from datetime import date
+from typing import Generator, List, Optional, Union
 
 import pandas as pd
 
 from phc.easy.auth import Auth
+from phc.easy.frame import ExpansionPlan
 from phc.easy.query import Query
 from phc.easy.util import without_keys
+from phc.easy.util.api_cache import APICache
+from phc.version import __version__
 
 
 class Item:
@@ -40,6 +45,42 @@ class Item:
         "Transform data frame batch"
         return data_frame
 
+    @classmethod
+    @contextmanager
+    def _batch_transform(
+        cls, expand_args: dict, columns: Optional[List[str]] = None
+    ):
+        """Provide a transform that expands every batch of a single retrieval
+        with the same plan so all batches share one column layout (and one
+        process pool when expanding with workers)
+        """
+        with ExpansionPlan(
+            workers=expand_args.get("workers"), projection=columns
+        ) as plan:
+
+            def transform(df: pd.DataFrame):
+                # Every Frame.expand of transform_results uses the plan
+                with plan.active():
+                    return plan.conform(
+                        cls.transform_results(df, **expand_args)
+                    )
+
+            yield transform
+
+    @classmethod
+    def _transform_key(cls, expand_args: dict) -> str:
+        """Identifies how results are expanded so cached results are expanded
+        again (from their cached raw hits) when that changes
+        """
+        return APICache.fingerprint(
+            {
+                "item": f"{cls.__module__}.{cls.__qualname__}",
+                "transform_results": cls.transform_results,
+                "expand_args": without_keys(expand_args, ["workers"]),
+                "version": __version__,
+            }
+        )
+
     @classmethod
     def get_data_frame(
         cls,
@@ -52,6 +93,14 @@ class Item:
         ignore_cache: bool = False,
         expand_args: dict = {},
         log: bool = False,
+        parallelism: Optional[int] = None,
+        prefetch: int = 0,
+        columns: Optional[List[str]] = None,
+        since: Optional[Union[str, date]] = None,
+        until: Optional[Union[str, date]] = None,
+        date_field: str = "meta.lastUpdated",
+        partitions: Optional[int] = None,
+        incremental: bool = False,
         # Codes
         code: Optional[Union[str, List[str]]] = None,
         display: Optional[Union[str, List[str]]] = None,
@@ -91,6 +140,42 @@ class Item:
         log : bool = False
             Whether to log some diagnostic statements for debugging
 
+        parallelism : int
+            The number of slices to scroll through concurrently when retrieving
+            all results (record order is not preserved)
+
+        prefetch : int = 0
+            The number of pages to fetch ahead while the current page is
+            expanded and cached (0 disables prefetching)
+
+        columns : List[str]
+            Only retrieve these fields of each record (e.g. ["subject",
+            "code", "valueQuantity"]) to reduce the size of each page and the
+            work of expanding it. Nested paths retrieve their top-level field.
+
+        since : str | datetime
+            Only retrieve records with a `date_field` on or after this date
+            (e.g. records updated since the last nightly job)
+
+        until : str | datetime
+            Only retrieve records with a `date_field` before this date
+
+        date_field : str = "meta.lastUpdated"
+            The date to filter by with since and until (e.g.
+            "effectiveDateTime")
+
+        partitions : int
+            Split the dates from since to until into about this many windows
+            with similar record counts that are scrolled concurrently (up to
+            `parallelism` at once) and combined in date order when retrieving
+            all results
+
+        incremental : bool = False
+            Update cached results with only the records updated since they
+            were retrieved (by meta.lastUpdated) instead of using them as is.
+            Deleted records are not removed, and `columns` must include
+            "meta" for cached results to be updated.
+
         code : str | List[str]
             Adds where clause for code value(s)
 
@@ -121,26 +206,165 @@ class Item:
 
         code_fields = [*cls.code_fields(), *code_fields]
 
-        def transform(df: pd.DataFrame):
-            return cls.transform_results(df, **expand_args)
-
-        return Query.execute_fhir_dsl_with_options(
-            query,
-            transform,
-            all_results,
-            raw,
-            query_overrides,
-            auth_args,
-            ignore_cache,
-            page_size=page_size,
-            max_pages=max_pages,
-            log=log,
-            # Codes
-            code_fields=code_fields,
-            code=code,
-            display=display,
-            system=system,
-        )
+        with cls._batch_transform(expand_args, columns) as transform:
+            return Query.execute_fhir_dsl_with_options(
+                query,
+                transform,
+                all_results,
+                raw,
+                query_overrides,
+                auth_args,
+                ignore_cache,
+                page_size=page_size,
+                max_pages=max_pages,
+                log=log,
+                parallelism=parallelism,
+                prefetch=prefetch,
+                columns=columns,
+                since=since,
+                until=until,
+                date_field=date_field,
+                partitions=partitions,
+                incremental=incremental,
+                transform_key=cls._transform_key(expand_args),
+                # Codes
+                code_fields=code_fields,
+                code=code,
+                display=display,
+                system=system,
+            )
+
+    @classmethod
+    def iter_data_frame(
+        cls,
+        raw: bool = False,
+        page_size: Union[int, None] = None,
+        max_pages: Union[int, None] = None,
+        query_overrides: dict = {},
+        auth_args=Auth.shared(),
+        expand_args: dict = {},
+        log: bool = False,
+        columns: Optional[List[str]] = None,
+        since: Optional[Union[str, date]] = None,
+        until: Optional[Union[str, date]] = None,
+        date_field: str = "meta.lastUpdated",
+        # Codes
+        code: Optional[Union[str, List[str]]] = None,
+        display: Optional[Union[str, List[str]]] = None,
+        system: Optional[Union[str, List[str]]] = None,
+        code_fields: List[str] = [],
+    ) -> Generator[pd.DataFrame, None, None]:
+        """Lazily iterate through all records one transformed batch at a time
+
+        The next page is only fetched once the current batch has been consumed
+        so the entire set of records is never held in memory (or cached).
+
+        See arguments for `phc.easy.item.Item.get_data_frame`
+
+        Examples
+        --------
+        >>> import phc.easy as phc
+        >>> phc.Auth.set({'account': '<your-account-name>'})
+        >>> phc.Project.set_current('My Project Name')
+        >>>
+        >>> for df in phc.Goal.iter_data_frame():
+        >>>     df.to_csv("goals.csv", mode="a")
+        """
+        query = {
+            "type": "select",
+            "columns": "*",
+            "from": [{"table": cls.table_name()}],
+        }
+
+        code_fields = [*cls.code_fields(), *code_fields]
+
+        with cls._batch_transform(expand_args, columns) as transform:
+            yield from Query.iter_fhir_dsl_with_options(
+                query,
+                transform,
+                raw,
+                query_overrides,
+                auth_args,
+                page_size=page_size,
+                max_pages=max_pages,
+                log=log,
+                columns=columns,
+                since=since,
+                until=until,
+                date_field=date_field,
+                # Codes
+                code_fields=code_fields,
+                code=code,
+                display=display,
+                system=system,
+            )
+
+    @classmethod
+    async def aget_data_frame(
+        cls,
+        all_results: bool = False,
+        raw: bool = False,
+        page_size: Union[int, None] = None,
+        max_pages: Union[int, None] = None,
+        query_overrides: dict = {},
+        auth_args=Auth.shared(),
+        ignore_cache: bool = False,
+        expand_args: dict = {},
+        log: bool = False,
+        columns: Optional[List[str]] = None,
+        since: Optional[Union[str, date]] = None,
+        until: Optional[Union[str, date]] = None,
+        date_field: str = "meta.lastUpdated",
+        # Codes
+        code: Optional[Union[str, List[str]]] = None,
+        display: Optional[Union[str, List[str]]] = None,
+        system: Optional[Union[str, List[str]]] = None,
+        code_fields: List[str] = [],
+    ):
+        """Retrieve records on the running event loop (e.g. to retrieve
+        several tables concurrently)
+
+        See arguments for `phc.easy.item.Item.get_data_frame`
+
+        Examples
+        --------
+        >>> import phc.easy as phc
+        >>> phc.Auth.set({'account': '<your-account-name>'})
+        >>> phc.Project.set_current('My Project Name')
+        >>>
+        >>> await phc.Goal.aget_data_frame(all_results=True)
+        """
+        query = {
+            "type": "select",
+            "columns": "*",
+            "from": [{"table": cls.table_name()}],
+        }
+
+        code_fields = [*cls.code_fields(), *code_fields]
+
+        with cls._batch_transform(expand_args, columns) as transform:
+            return await Query.aexecute_fhir_dsl_with_options(
+                query,
+                transform,
+                all_results,
+                raw,
+                query_overrides,
+                auth_args,
+                ignore_cache,
+                page_size=page_size,
+                max_pages=max_pages,
+                log=log,
+                columns=columns,
+                since=since,
+                until=until,
+                date_field=date_field,
+                transform_key=cls._transform_key(expand_args),
+                # Codes
+                code_fields=code_fields,
+                code=code,
+                display=display,
+                system=system,
+            )
 
     @classmethod
     def get_codes(
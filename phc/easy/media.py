@@ -25,9 +25,6 @@ class Media(PatientItem):
             custom_columns=[
                 *expand_args.get("custom_columns", []),
                 Frame.codeable_like_column_expander("subject"),
-                (
-                    "content",
-                    lambda r: pd.json_normalize(r).add_prefix("content."),
-                ),
+                Frame.json_normalize_column_expander("content"),
             ],
         )
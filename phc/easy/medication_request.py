@@ -32,11 +32,6 @@ class MedicationRequest(PatientItem):
                 Frame.codeable_like_column_expander("subject"),
                 Frame.codeable_like_column_expander("context"),
                 Frame.codeable_like_column_expander("note"),
-                (
-                    "dispenseRequest",
-                    lambda r: pd.json_normalize(r).add_prefix(
-                        "dispenseRequest."
-                    ),
-                ),
+                Frame.json_normalize_column_expander("dispenseRequest"),
             ],
         )
@@ -1,4 +1,5 @@
-from typing import List, Optional, Union
+from datetime import date
+from typing import Generator, List, Optional, Union
 
 import pandas as pd
 
@@ -34,6 +35,14 @@ class PatientItem(Item):
         ignore_cache: bool = False,
         expand_args: dict = {},
         log: bool = False,
+        parallelism: Optional[int] = None,
+        prefetch: int = 0,
+        columns: Optional[List[str]] = None,
+        since: Optional[Union[str, date]] = None,
+        until: Optional[Union[str, date]] = None,
+        date_field: str = "meta.lastUpdated",
+        partitions: Optional[int] = None,
+        incremental: bool = False,
         # Codes
         code: Optional[Union[str, List[str]]] = None,
         display: Optional[Union[str, List[str]]] = None,
@@ -55,7 +64,9 @@ class PatientItem(Item):
             Find records for a given patient_id
 
         patient_ids : List[str]
-            Find records for given patient_ids
+            Find records for given patient_ids (large lists are split into
+            chunks of `PATIENT_IDS_CHUNK_SIZE` that are queried concurrently
+            and merged without duplicates)
 
         page_size : int
             The number of records to fetch per page
@@ -79,6 +90,43 @@ class PatientItem(Item):
         log : bool = False
             Whether to log some diagnostic statements for debugging
 
+        parallelism : int
+            The number of slices (or chunks of patient_ids) to scroll through
+            concurrently when retrieving all results (record order is not
+            preserved)
+
+        prefetch : int = 0
+            The number of pages to fetch ahead while the current page is
+            expanded and cached (0 disables prefetching)
+
+        columns : List[str]
+            Only retrieve these fields of each record (e.g. ["subject",
+            "code", "valueQuantity"]) to reduce the size of each page and the
+            work of expanding it. Nested paths retrieve their top-level field.
+
+        since : str | datetime
+            Only retrieve records with a `date_field` on or after this date
+            (e.g. records updated since the last nightly job)
+
+        until : str | datetime
+            Only retrieve records with a `date_field` before this date
+
+        date_field : str = "meta.lastUpdated"
+            The date to filter by with since and until (e.g.
+            "effectiveDateTime")
+
+        partitions : int
+            Split the dates from since to until into about this many windows
+            with similar record counts that are scrolled concurrently (up to
+            `parallelism` at once) and combined in date order when retrieving
+            all results
+
+        incremental : bool = False
+            Update cached results with only the records updated since they
+            were retrieved (by meta.lastUpdated) instead of using them as is.
+            Deleted records are not removed, and `columns` must include
+            "meta" for cached results to be updated.
+
         code : str | List[str]
             Adds where clause for code value(s)
 
@@ -109,30 +157,108 @@ class PatientItem(Item):
 
         code_fields = [*cls.code_fields(), *code_fields]
 
-        def transform(df: pd.DataFrame):
-            return cls.transform_results(df, **expand_args)
-
-        return Query.execute_fhir_dsl_with_options(
-            query,
-            transform,
-            all_results,
-            raw,
-            query_overrides,
-            auth_args,
-            ignore_cache,
-            patient_id=patient_id,
-            patient_ids=patient_ids,
-            page_size=page_size,
-            max_pages=max_pages,
-            patient_key=cls.patient_key(),
-            log=log,
-            patient_id_prefixes=cls.patient_id_prefixes(),
-            # Codes
-            code_fields=code_fields,
-            code=code,
-            display=display,
-            system=system,
-        )
+        with cls._batch_transform(expand_args, columns) as transform:
+            return Query.execute_fhir_dsl_with_options(
+                query,
+                transform,
+                all_results,
+                raw,
+                query_overrides,
+                auth_args,
+                ignore_cache,
+                patient_id=patient_id,
+                patient_ids=patient_ids,
+                page_size=page_size,
+                max_pages=max_pages,
+                patient_key=cls.patient_key(),
+                log=log,
+                parallelism=parallelism,
+                prefetch=prefetch,
+                patient_id_prefixes=cls.patient_id_prefixes(),
+                columns=columns,
+                since=since,
+                until=until,
+                date_field=date_field,
+                partitions=partitions,
+                incremental=incremental,
+                transform_key=cls._transform_key(expand_args),
+                # Codes
+                code_fields=code_fields,
+                code=code,
+                display=display,
+                system=system,
+            )
+
+    @classmethod
+    def iter_data_frame(
+        cls,
+        raw: bool = False,
+        patient_id: Union[None, str] = None,
+        patient_ids: List[str] = [],
+        page_size: Union[int, None] = None,
+        max_pages: Union[int, None] = None,
+        query_overrides: dict = {},
+        auth_args=Auth.shared(),
+        expand_args: dict = {},
+        log: bool = False,
+        columns: Optional[List[str]] = None,
+        since: Optional[Union[str, date]] = None,
+        until: Optional[Union[str, date]] = None,
+        date_field: str = "meta.lastUpdated",
+        # Codes
+        code: Optional[Union[str, List[str]]] = None,
+        display: Optional[Union[str, List[str]]] = None,
+        system: Optional[Union[str, List[str]]] = None,
+        code_fields: List[str] = [],
+    ) -> Generator[pd.DataFrame, None, None]:
+        """Lazily iterate through all records one transformed batch at a time
+
+        The next page is only fetched once the current batch has been consumed
+        so the entire set of records is never held in memory (or cached).
+
+        See arguments for `phc.easy.patient_item.PatientItem.get_data_frame`
+
+        Examples
+        --------
+        >>> import phc.easy as phc
+        >>> phc.Auth.set({'account': '<your-account-name>'})
+        >>> phc.Project.set_current('My Project Name')
+        >>>
+        >>> for df in phc.Observation.iter_data_frame(patient_ids=ids):
+        >>>     df.to_csv("observations.csv", mode="a")
+        """
+        query = {
+            "type": "select",
+            "columns": "*",
+            "from": [{"table": cls.table_name()}],
+        }
+
+        code_fields = [*cls.code_fields(), *code_fields]
+
+        with cls._batch_transform(expand_args, columns) as transform:
+            yield from Query.iter_fhir_dsl_with_options(
+                query,
+                transform,
+                raw,
+                query_overrides,
+                auth_args,
+                patient_id=patient_id,
+                patient_ids=patient_ids,
+                page_size=page_size,
+                max_pages=max_pages,
+                patient_key=cls.patient_key(),
+                log=log,
+                patient_id_prefixes=cls.patient_id_prefixes(),
+                columns=columns,
+                since=since,
+                until=until,
+                date_field=date_field,
+                # Codes
+                code_fields=code_fields,
+                code=code,
+                display=display,
+                system=system,
+            )
 
     @classmethod
     def get_count_by_patient(cls, **kwargs):
@@ -158,3 +284,76 @@ class PatientItem(Item):
         df[patient_key] = df[patient_key].str.replace("Patient/", "")
 
         return df.groupby(patient_key).sum()
+
+    @classmethod
+    async def aget_data_frame(
+        cls,
+        all_results: bool = False,
+        raw: bool = False,
+        patient_id: Union[None, str] = None,
+        patient_ids: List[str] = [],
+        page_size: Union[int, None] = None,
+        max_pages: Union[int, None] = None,
+        query_overrides: dict = {},
+        auth_args=Auth.shared(),
+        ignore_cache: bool = False,
+        expand_args: dict = {},
+        log: bool = False,
+        columns: Optional[List[str]] = None,
+        since: Optional[Union[str, date]] = None,
+        until: Optional[Union[str, date]] = None,
+        date_field: str = "meta.lastUpdated",
+        # Codes
+        code: Optional[Union[str, List[str]]] = None,
+        display: Optional[Union[str, List[str]]] = None,
+        system: Optional[Union[str, List[str]]] = None,
+        code_fields: List[str] = [],
+    ):
+        """Retrieve records on the running event loop (e.g. to retrieve
+        several tables concurrently)
+
+        See arguments for `phc.easy.patient_item.PatientItem.get_data_frame`
+
+        Examples
+        --------
+        >>> import phc.easy as phc
+        >>> phc.Auth.set({'account': '<your-account-name>'})
+        >>> phc.Project.set_current('My Project Name')
+        >>>
+        >>> await phc.Observation.aget_data_frame(patient_id='<patient-id>')
+        """
+        query = {
+            "type": "select",
+            "columns": "*",
+            "from": [{"table": cls.table_name()}],
+        }
+
+        code_fields = [*cls.code_fields(), *code_fields]
+
+        with cls._batch_transform(expand_args, columns) as transform:
+            return await Query.aexecute_fhir_dsl_with_options(
+                query,
+                transform,
+                all_results,
+                raw,
+                query_overrides,
+                auth_args,
+                ignore_cache,
+                patient_id=patient_id,
+                patient_ids=patient_ids,
+                page_size=page_size,
+                max_pages=max_pages,
+                patient_key=cls.patient_key(),
+                patient_id_prefixes=cls.patient_id_prefixes(),
+                log=log,
+                columns=columns,
+                since=since,
+                until=until,
+                date_field=date_field,
+                transform_key=cls._transform_key(expand_args),
+                # Codes
+                code_fields=code_fields,
+                code=code,
+                display=display,
+                system=system,
+            )
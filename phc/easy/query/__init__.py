@@ -1,27 +1,275 @@
 import json
 import math
-from typing import Any, Callable, List, Optional, Tuple, Union
+from urllib.parse import urlparse
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
 import pandas as pd
 from phc.base_client import BaseClient
 from phc.easy.auth import Auth
-from phc.easy.query.api_paging import recursive_paging_api_call
+from phc.easy.query.api_paging import clean_params, fetch_paging_api_items
 from phc.easy.query.fhir_aggregation import FhirAggregation
 from phc.easy.query.fhir_dsl import (
+    DEFAULT_CHUNK_CONCURRENCY,
     DEFAULT_SCROLL_SIZE,
     MAX_RESULT_SIZE,
+    aexecute_chunked_fhir_dsl,
+    aexecute_paged_fhir_dsl,
+    aexecute_single_fhir_dsl,
+    aiter_fhir_dsl_pages,
+    execute_chunked_fhir_dsl,
     execute_single_fhir_dsl,
-    recursive_execute_fhir_dsl,
+    execute_paged_fhir_dsl,
+    execute_sliced_fhir_dsl,
+    iter_fhir_dsl_pages,
     tqdm,
     with_progress,
 )
-from phc.easy.query.fhir_dsl_query import build_query
-from phc.easy.query.ga4gh import recursive_execute_ga4gh
-from phc.easy.util import extract_codes
+from phc.easy.query.date_partition import partition_date_range
+from phc.easy.query.fhir_dsl_query import (
+    LAST_UPDATED_FIELD,
+    build_query,
+    chunk_patient_ids,
+    patient_id_chunks_can_overlap,
+)
+from phc.easy.query.pagination import iter_pages
+from phc.easy.query.ga4gh import execute_paged_ga4gh
+from phc.easy.util import awith_progress, extract_codes
 from phc.services import Fhir
 from phc.easy.util.api_cache import APICache
 
 
+def _scroll_query(query: dict) -> dict:
+    "Add the default scroll window to a query (unless it has a limit)"
+    return {
+        "limit": [
+            {"type": "number", "value": 0},
+            # Make window size smaller than maximum to reduce pressure on API
+            {"type": "number", "value": DEFAULT_SCROLL_SIZE},
+        ],
+        **query,
+    }
+
+
+def _chunk_queries(query: dict, chunks: List[dict], all_results: bool):
+    "Build a query for each chunk of `build_query` arguments"
+    queries = [build_query(query, **query_kwargs) for query_kwargs in chunks]
+
+    return [_scroll_query(q) if all_results else q for q in queries]
+
+
+def _chunk_args(
+    query: dict,
+    query_kwargs: dict,
+    all_results: bool,
+    max_pages: Union[int, None],
+    parallelism: Union[int, None],
+    partitions: Union[int, None] = None,
+):
+    "Arguments for executing the chunks of a query"
+    return {
+        "scroll": all_results,
+        "concurrency": parallelism or DEFAULT_CHUNK_CONCURRENCY,
+        # Only retrieve a sample (a single page of each chunk) unless
+        # retrieving all results
+        "max_pages": max_pages if all_results else 1,
+        "adaptive_page_size": all_results and "limit" not in query,
+        # Date windows are stitched back together in chronological order
+        "ordered": partitions is not None,
+        # A record updated during retrieval can move into the last (open) date
+        # window
+        "dedupe": partitions is not None
+        or patient_id_chunks_can_overlap(query_kwargs),
+    }
+
+
+def _partition_by_date(
+    query: dict,
+    query_kwargs: dict,
+    chunks: List[dict],
+    all_results: bool,
+    partitions: Union[int, None],
+    auth_args: Auth,
+):
+    """Split each chunk of `build_query` arguments into date windows with
+    roughly equal counts (when partitioning all results)
+    """
+    if not all_results or partitions is None or partitions <= 1:
+        return chunks
+
+    if query_kwargs.get("since") is None:
+        raise ValueError("A since date is required to partition by date")
+
+    def count(since, until):
+        return Query.find_count_of_dsl_query(
+            build_query(
+                query, **{**query_kwargs, "since": since, "until": until}
+            ),
+            auth_args=auth_args,
+        )
+
+    windows = partition_date_range(
+        count, query_kwargs["since"], query_kwargs.get("until"), partitions
+    )
+
+    return [
+        {**chunk, "since": since, "until": until}
+        for since, until in windows
+        for chunk in chunks
+    ]
+
+
+def _cache_context(auth_args: Auth) -> dict:
+    """The account, project, and environment that cached results belong to
+    (so the same query in another project is cached separately)
+    """
+    auth = Auth(auth_args)
+
+    try:
+        project_id = auth.project_id
+    except ValueError:
+        project_id = None
+
+    try:
+        environment = urlparse(auth.session().api_url).netloc
+    except Exception:
+        # No (decodable) token to determine the environment from
+        environment = None
+
+    return {
+        "account": auth.account,
+        "project_id": project_id,
+        "environment": environment,
+    }
+
+
+def _should_use_cache(
+    query: dict,
+    all_results: bool,
+    raw: bool,
+    ignore_cache: bool,
+    max_pages: Union[int, None],
+):
+    return (
+        (not ignore_cache)
+        and (not raw)
+        and (all_results or FhirAggregation.is_aggregation_query(query))
+        and (max_pages is None)
+    )
+
+
+def _cache_contexts(
+    query: dict, auth_args: Auth, transform_key: Optional[str]
+) -> Tuple[dict, dict]:
+    """The contexts of cached results (including how they were transformed)
+    and of the raw hits they were transformed from
+    """
+    raw_context = _cache_context(auth_args)
+
+    if transform_key is None or FhirAggregation.is_aggregation_query(query):
+        return raw_context, raw_context
+
+    return {**raw_context, "transform": transform_key}, raw_context
+
+
+def _has_cached_results(
+    query: dict,
+    transform: Callable[[pd.DataFrame], pd.DataFrame],
+    context: dict,
+    raw_context: dict,
+) -> bool:
+    """Whether the results of a query are cached (expanding its cached raw
+    hits again if only those are, e.g. after the transform changed)
+    """
+    if APICache.does_cache_for_fhir_dsl_exist(query, context):
+        return True
+
+    if not APICache.does_raw_cache_for_fhir_dsl_exist(query, raw_context):
+        return False
+
+    APICache.expand_raw_cache_for_fhir_dsl(
+        query, transform, context, raw_context
+    )
+
+    # Nothing is cached if the transform left no columns
+    return APICache.does_cache_for_fhir_dsl_exist(query, context)
+
+
+def _incremental_high_water(
+    query: dict, query_kwargs: dict, context: Optional[dict]
+) -> Optional[str]:
+    """The point to sync a cached query from (or None if the cache cannot be
+    synced incrementally)
+    """
+    if FhirAggregation.is_aggregation_query(query) or (
+        query_kwargs.get("until") is not None
+        or query_kwargs.get("date_field", LAST_UPDATED_FIELD)
+        != LAST_UPDATED_FIELD
+    ):
+        # Records outside of these results may have been updated
+        return None
+
+    return APICache.high_water_for_fhir_dsl(query, context)
+
+
+def _with_api_cache(
+    kind: str,
+    name: str,
+    request: dict,
+    use_cache: bool,
+    auth_args: Auth,
+    execute: Callable[[], Any],
+):
+    "Load the results of an API request from the cache or execute and cache it"
+    if not use_cache:
+        return execute()
+
+    context = _cache_context(auth_args)
+
+    if APICache.does_cache_for_api_exist(kind, name, request, context):
+        return APICache.load_cache_for_api(kind, name, request, context)
+
+    results = execute()
+    APICache.write_api(kind, name, request, results, context)
+
+    return results
+
+
+def _finish_with_options(
+    query: dict,
+    results: Any,
+    transform: Callable[[pd.DataFrame], pd.DataFrame],
+    raw: bool,
+    use_cache: bool,
+    context: Optional[dict] = None,
+):
+    "Convert results of a query with options to an aggregation or data frame"
+    if isinstance(results, FhirAggregation):
+        # Cache isn't written in batches so we need to explicitly do it here
+        if use_cache:
+            APICache.write_agg(query, results, context)
+
+        return results
+
+    if isinstance(results, pd.DataFrame):
+        return results
+
+    df = pd.DataFrame(map(lambda r: r["_source"], results))
+
+    if raw:
+        return df
+
+    return transform(df)
+
+
 class Query:
     @staticmethod
     def find_count_of_dsl_query(query: dict, auth_args: Auth = Auth.shared()):
@@ -68,6 +316,8 @@ class Query:
         callback: Union[Callable[[Any, bool], None], None] = None,
         max_pages: Union[int, None] = None,
         log: bool = False,
+        parallelism: Union[int, None] = None,
+        prefetch: int = 0,
         **query_kwargs,
     ):
         """Execute a FHIR query with the DSL
@@ -105,6 +355,15 @@ class Query:
         log : bool = False
             Whether to log the elasticsearch query sent to the server
 
+        parallelism : int
+            The number of Elasticsearch slices to scroll through concurrently
+            when retrieving all results. Batches are returned (or passed to the
+            callback) in the order they arrive.
+
+        prefetch : int = 0
+            The number of pages to fetch ahead in a background thread while
+            the callback processes the current page (0 disables prefetching)
+
         query_kwargs : dict
             Arguments to pass to build_query such as patient_id, patient_ids,
             and patient_key. (See phc.easy.query.fhir_dsl_query.build_query)
@@ -133,27 +392,174 @@ class Query:
             return FhirAggregation.from_response(response)
 
         if all_results:
+            scroll_query = _scroll_query(query)
+            # Tune the page size unless it was explicitly requested
+            adaptive_page_size = "limit" not in query
+
+            if parallelism is not None and parallelism > 1:
+                return with_progress(
+                    lambda: tqdm(total=MAX_RESULT_SIZE),
+                    lambda progress: execute_sliced_fhir_dsl(
+                        scroll_query,
+                        parallelism=parallelism,
+                        progress=progress,
+                        callback=callback,
+                        auth_args=auth_args,
+                        max_pages=max_pages,
+                    ),
+                )
+
             return with_progress(
                 lambda: tqdm(total=MAX_RESULT_SIZE),
-                lambda progress: recursive_execute_fhir_dsl(
-                    {
-                        "limit": [
-                            {"type": "number", "value": 0},
-                            # Make window size smaller than maximum to reduce
-                            # pressure on API
-                            {"type": "number", "value": DEFAULT_SCROLL_SIZE},
-                        ],
-                        **query,
-                    },
+                lambda progress: execute_paged_fhir_dsl(
+                    scroll_query,
+                    scroll=all_results,
+                    progress=progress,
+                    callback=callback,
+                    auth_args=auth_args,
+                    max_pages=max_pages,
+                    prefetch=prefetch,
+                    adaptive_page_size=adaptive_page_size,
+                ),
+            )
+
+        return execute_paged_fhir_dsl(
+            query,
+            scroll=all_results,
+            callback=callback,
+            auth_args=auth_args,
+            max_pages=max_pages,
+        )
+
+    @staticmethod
+    def iter_fhir_dsl(
+        query: dict,
+        auth_args: Auth = Auth.shared(),
+        max_pages: Union[int, None] = None,
+        log: bool = False,
+        **query_kwargs,
+    ) -> Generator[List[dict], None, None]:
+        """Lazily iterate through batches of hits for a FHIR query with the DSL
+
+        Each page is only requested once the previous batch has been consumed,
+        so the full result set is never held in memory.
+
+        See https://docs.us.lifeomic.com/development/fhir-service/dsl/
+
+        Attributes
+        ----------
+        query : dict
+            The FHIR query to run (is a superset of elasticsearch)
+
+        auth_args : Auth, dict
+            Additional arguments for authentication
+
+        max_pages : int
+            The number of pages to retrieve (useful if working with tons of records)
+
+        log : bool = False
+            Whether to log the elasticsearch query sent to the server
+
+        query_kwargs : dict
+            Arguments to pass to build_query such as patient_id, patient_ids,
+            and patient_key. (See phc.easy.query.fhir_dsl_query.build_query)
+
+        Examples
+        --------
+        >>> import phc.easy as phc
+        >>> phc.Auth.set({ 'account': '<your-account-name>' })
+        >>> phc.Project.set_current('My Project Name')
+        >>> for batch in phc.Query.iter_fhir_dsl({
+          "type": "select",
+          "columns": "*",
+          "from": [
+              {"table": "patient"}
+          ],
+        }):
+        >>>     print(len(batch))
+        """
+        query = build_query(query, **query_kwargs)
+
+        if log:
+            print(json.dumps(query, indent=4))
+
+        if FhirAggregation.is_aggregation_query(query):
+            raise ValueError(
+                "Iterating is not supported for aggregation queries."
+            )
+
+        progress = tqdm(total=MAX_RESULT_SIZE) if tqdm else None
+
+        try:
+            for page in iter_fhir_dsl_pages(
+                _scroll_query(query),
+                scroll=True,
+                progress=progress,
+                auth_args=auth_args,
+                max_pages=max_pages,
+                adaptive_page_size="limit" not in query,
+            ):
+                if len(page.items) > 0:
+                    yield page.items
+        finally:
+            if progress is not None:
+                progress.close()
+
+    @staticmethod
+    async def aexecute_fhir_dsl(
+        query: dict,
+        all_results: bool = False,
+        auth_args: Auth = Auth.shared(),
+        callback: Union[Callable[[Any, bool], None], None] = None,
+        max_pages: Union[int, None] = None,
+        log: bool = False,
+        **query_kwargs,
+    ):
+        """Execute a FHIR query with the DSL on the running event loop
+
+        See arguments for `phc.easy.query.Query.execute_fhir_dsl` (slices and
+        prefetching are not supported since other coroutines can run while
+        pages are requested)
+
+        Examples
+        --------
+        >>> import phc.easy as phc
+        >>> phc.Auth.set({ 'account': '<your-account-name>' })
+        >>> phc.Project.set_current('My Project Name')
+        >>> await phc.Query.aexecute_fhir_dsl({
+          "type": "select",
+          "columns": "*",
+          "from": [
+              {"table": "patient"}
+          ],
+        }, all_results=True)
+        """
+        query = build_query(query, **query_kwargs)
+
+        if log:
+            print(json.dumps(query, indent=4))
+
+        if FhirAggregation.is_aggregation_query(query):
+            response = await aexecute_single_fhir_dsl(
+                query, auth_args=auth_args
+            )
+            return FhirAggregation.from_response(response)
+
+        if all_results:
+            return await awith_progress(
+                lambda: tqdm(total=MAX_RESULT_SIZE),
+                lambda progress: aexecute_paged_fhir_dsl(
+                    _scroll_query(query),
                     scroll=all_results,
                     progress=progress,
                     callback=callback,
                     auth_args=auth_args,
                     max_pages=max_pages,
+                    adaptive_page_size="limit" not in query,
                 ),
             )
 
-        return recursive_execute_fhir_dsl(
+        return await aexecute_paged_fhir_dsl(
             query,
             scroll=all_results,
             callback=callback,
@@ -161,6 +567,57 @@ class Query:
             max_pages=max_pages,
         )
 
+    @staticmethod
+    async def aiter_fhir_dsl(
+        query: dict,
+        auth_args: Auth = Auth.shared(),
+        max_pages: Union[int, None] = None,
+        log: bool = False,
+        **query_kwargs,
+    ) -> AsyncGenerator[List[dict], None]:
+        """Asynchronously iterate through batches of hits for a FHIR query
+        with the DSL
+
+        See arguments for `phc.easy.query.Query.iter_fhir_dsl`
+
+        Examples
+        --------
+        >>> async for batch in phc.Query.aiter_fhir_dsl({
+          "type": "select",
+          "columns": "*",
+          "from": [
+              {"table": "patient"}
+          ],
+        }):
+        >>>     print(len(batch))
+        """
+        query = build_query(query, **query_kwargs)
+
+        if log:
+            print(json.dumps(query, indent=4))
+
+        if FhirAggregation.is_aggregation_query(query):
+            raise ValueError(
+                "Iterating is not supported for aggregation queries."
+            )
+
+        progress = tqdm(total=MAX_RESULT_SIZE) if tqdm else None
+
+        try:
+            async for page in aiter_fhir_dsl_pages(
+                _scroll_query(query),
+                scroll=True,
+                progress=progress,
+                auth_args=auth_args,
+                max_pages=max_pages,
+                adaptive_page_size="limit" not in query,
+            ):
+                if len(page.items) > 0:
+                    yield page.items
+        finally:
+            if progress is not None:
+                progress.close()
+
     @staticmethod
     def execute_paging_api(
         path: str,
@@ -171,6 +628,7 @@ class Query:
         max_pages: Optional[int] = None,
         page_size: Optional[int] = None,
         log: bool = False,
+        ignore_cache: bool = False,
     ):
         """Execute a API query that pages through results
 
@@ -204,6 +662,10 @@ class Query:
         log : bool = False
             Whether to log some diagnostic statements for debugging
 
+        ignore_cache : bool = False
+            Bypass the caching system that auto-saves results to a JSON file.
+            Caching only occurs when all results are being retrieved.
+
         Examples
         --------
         >>> import phc.easy as phc
@@ -216,19 +678,37 @@ class Query:
                 }
             )
         """
-        return with_progress(
-            lambda: tqdm(),
-            lambda progress: recursive_paging_api_call(
+        # The page size does not change the results so it isn't part of the key
+        request = {
+            "path": path,
+            "params": clean_params(params),
+            "http_verb": http_verb.upper(),
+        }
+
+        return pd.DataFrame(
+            _with_api_cache(
+                "paging_api",
                 path,
-                params=params,
-                http_verb=http_verb,
-                scroll=all_results,
-                max_pages=max_pages,
-                page_size=page_size,
-                log=log,
+                request,
+                use_cache=(not ignore_cache)
+                and all_results
+                and (max_pages is None),
                 auth_args=auth_args,
-                progress=progress,
-            ),
+                execute=lambda: with_progress(
+                    lambda: tqdm(),
+                    lambda progress: fetch_paging_api_items(
+                        path,
+                        params=params,
+                        http_verb=http_verb,
+                        scroll=all_results,
+                        max_pages=max_pages,
+                        page_size=page_size,
+                        log=log,
+                        auth_args=auth_args,
+                        progress=progress,
+                    ),
+                ),
+            )
         )
 
     @staticmethod
@@ -242,53 +722,222 @@ class Query:
         ignore_cache: bool,
         max_pages: Union[int, None],
         log: bool = False,
+        parallelism: Union[int, None] = None,
+        prefetch: int = 0,
+        partitions: Union[int, None] = None,
+        incremental: bool = False,
+        transform_key: Optional[str] = None,
         **query_kwargs,
     ):
-        query = build_query({**query, **query_overrides}, **query_kwargs)
+        base_query = {**query, **query_overrides}
+        query = build_query(base_query, **query_kwargs)
 
         if log:
             print(json.dumps(query, indent=4))
 
-        use_cache = (
-            (not ignore_cache)
-            and (not raw)
-            and (all_results or FhirAggregation.is_aggregation_query(query))
-            and (max_pages is None)
+        use_cache = _should_use_cache(
+            query, all_results, raw, ignore_cache, max_pages
+        )
+
+        context, raw_context = (
+            _cache_contexts(query, auth_args, transform_key)
+            if use_cache
+            else (None, None)
         )
 
-        if use_cache and APICache.does_cache_for_fhir_dsl_exist(query):
-            return APICache.load_cache_for_fhir_dsl(query)
+        if use_cache and _has_cached_results(
+            query, transform, context, raw_context
+        ):
+            high_water = (
+                _incremental_high_water(query, query_kwargs, context)
+                if incremental
+                else None
+            )
+
+            if high_water is None:
+                return APICache.load_cache_for_fhir_dsl(query, context=context)
+
+            # Only retrieve what changed since the cache was last synced
+            updated = Query.execute_fhir_dsl_with_options(
+                base_query,
+                transform,
+                all_results=True,
+                raw=True,
+                query_overrides={},
+                auth_args=auth_args,
+                ignore_cache=True,
+                max_pages=None,
+                parallelism=parallelism,
+                **{
+                    **query_kwargs,
+                    "since": high_water,
+                    "date_field": LAST_UPDATED_FIELD,
+                },
+            )
+
+            return APICache.upsert_fhir_dsl(
+                query, updated, transform, context, raw_context
+            )
 
         callback = (
-            APICache.build_cache_fhir_dsl_callback(query, transform)
+            APICache.build_cache_fhir_dsl_callback(
+                query, transform, context, raw_context
+            )
             if use_cache
             else None
         )
 
-        results = Query.execute_fhir_dsl(
-            query,
-            all_results,
-            auth_args,
-            callback=callback,
-            max_pages=max_pages,
+        chunks = (
+            [query_kwargs]
+            if FhirAggregation.is_aggregation_query(query)
+            else _partition_by_date(
+                base_query,
+                query_kwargs,
+                chunk_patient_ids(query_kwargs),
+                all_results,
+                partitions,
+                auth_args,
+            )
         )
 
-        if isinstance(results, FhirAggregation):
-            # Cache isn't written in batches so we need to explicitly do it here
-            if use_cache:
-                APICache.write_agg(query, results)
+        if len(chunks) > 1:
+            results = with_progress(
+                lambda: tqdm(total=MAX_RESULT_SIZE),
+                lambda progress: execute_chunked_fhir_dsl(
+                    _chunk_queries(base_query, chunks, all_results),
+                    progress=progress,
+                    auth_args=auth_args,
+                    callback=callback,
+                    **_chunk_args(
+                        query,
+                        query_kwargs,
+                        all_results,
+                        max_pages,
+                        parallelism,
+                        partitions,
+                    ),
+                ),
+            )
+        else:
+            results = Query.execute_fhir_dsl(
+                query,
+                all_results,
+                auth_args,
+                callback=callback,
+                max_pages=max_pages,
+                parallelism=parallelism,
+                prefetch=prefetch,
+            )
 
-            return results
+        return _finish_with_options(
+            query, results, transform, raw, use_cache, context
+        )
 
-        if isinstance(results, pd.DataFrame):
-            return results
+    @staticmethod
+    def iter_fhir_dsl_with_options(
+        query: dict,
+        transform: Callable[[pd.DataFrame], pd.DataFrame],
+        raw: bool,
+        query_overrides: dict,
+        auth_args: Auth,
+        max_pages: Union[int, None],
+        log: bool = False,
+        **query_kwargs,
+    ) -> Generator[pd.DataFrame, None, None]:
+        chunks = chunk_patient_ids(query_kwargs)
+        dedupe = len(chunks) > 1 and patient_id_chunks_can_overlap(query_kwargs)
+        seen_ids = set()
+
+        # Chunks are retrieved one after another to keep memory bounded
+        for chunk_kwargs in chunks:
+            chunk_query = build_query(
+                {**query, **query_overrides}, **chunk_kwargs
+            )
+
+            for batch in Query.iter_fhir_dsl(
+                chunk_query, auth_args=auth_args, max_pages=max_pages, log=log
+            ):
+                if dedupe:
+                    batch = [hit for hit in batch if hit["_id"] not in seen_ids]
+                    seen_ids.update(hit["_id"] for hit in batch)
+
+                if len(batch) == 0:
+                    continue
+
+                df = pd.DataFrame(map(lambda r: r["_source"], batch))
+
+                yield df if raw else transform(df)
+
+    @staticmethod
+    async def aexecute_fhir_dsl_with_options(
+        query: dict,
+        transform: Callable[[pd.DataFrame], pd.DataFrame],
+        all_results: bool,
+        raw: bool,
+        query_overrides: dict,
+        auth_args: Auth,
+        ignore_cache: bool,
+        max_pages: Union[int, None],
+        log: bool = False,
+        transform_key: Optional[str] = None,
+        **query_kwargs,
+    ):
+        base_query = {**query, **query_overrides}
+        query = build_query(base_query, **query_kwargs)
+
+        if log:
+            print(json.dumps(query, indent=4))
+
+        use_cache = _should_use_cache(
+            query, all_results, raw, ignore_cache, max_pages
+        )
+
+        context, raw_context = (
+            _cache_contexts(query, auth_args, transform_key)
+            if use_cache
+            else (None, None)
+        )
+
+        if use_cache and _has_cached_results(
+            query, transform, context, raw_context
+        ):
+            return APICache.load_cache_for_fhir_dsl(query, context=context)
+
+        callback = (
+            APICache.build_cache_fhir_dsl_callback(
+                query, transform, context, raw_context
+            )
+            if use_cache
+            else None
+        )
 
-        df = pd.DataFrame(map(lambda r: r["_source"], results))
+        chunks = chunk_patient_ids(query_kwargs)
 
-        if raw:
-            return df
+        if len(chunks) > 1 and not FhirAggregation.is_aggregation_query(query):
+            results = await awith_progress(
+                lambda: tqdm(total=MAX_RESULT_SIZE),
+                lambda progress: aexecute_chunked_fhir_dsl(
+                    _chunk_queries(base_query, chunks, all_results),
+                    progress=progress,
+                    auth_args=auth_args,
+                    callback=callback,
+                    **_chunk_args(
+                        query, query_kwargs, all_results, max_pages, None
+                    ),
+                ),
+            )
+        else:
+            results = await Query.aexecute_fhir_dsl(
+                query,
+                all_results,
+                auth_args,
+                callback=callback,
+                max_pages=max_pages,
+            )
 
-        return transform(df)
+        return _finish_with_options(
+            query, results, transform, raw, use_cache, context
+        )
 
     @staticmethod
     def get_codes(
@@ -483,6 +1132,7 @@ class Query:
         log: bool = False,
         auth_args: Auth = Auth.shared(),
         max_pages: Union[int, None] = None,
+        ignore_cache: bool = False,
         **query_kwargs,
     ):
         """Count records by multiple fields
@@ -540,6 +1190,10 @@ class Query:
         max_pages : int
             The number of pages to retrieve (useful if working with tons of records)
 
+        ignore_cache : bool = False
+            Bypass the caching system that auto-saves results to a JSON file.
+            Caching only occurs when all pages are being retrieved.
+
         query_kwargs : dict
             Arguments to pass to build_query such as patient_id, patient_ids,
             and patient_key. See :func:`~phc.easy.query.fhir_dsl_query.build_query`.
@@ -564,18 +1218,33 @@ class Query:
         if len(key_sources_pairs) == 0:
             raise ValueError("No aggregate composite terms specified.")
 
-        return with_progress(
-            tqdm,
-            lambda progress: Query._recursive_execute_composite_aggregations(
-                table_name=table_name,
-                key_sources_pairs=key_sources_pairs,
-                batch_size=batch_size,
-                progress=progress,
-                log=log,
-                auth_args=auth_args,
-                query_overrides=query_overrides,
-                max_pages=max_pages,
-                **query_kwargs,
+        # The batch size does not change the results so it isn't part of the key
+        request = {
+            "table_name": table_name,
+            "key_sources_pairs": key_sources_pairs,
+            "query_overrides": query_overrides,
+            "query_kwargs": query_kwargs,
+        }
+
+        return _with_api_cache(
+            "composite_agg",
+            table_name,
+            request,
+            use_cache=(not ignore_cache) and (max_pages is None),
+            auth_args=auth_args,
+            execute=lambda: with_progress(
+                tqdm,
+                lambda progress: Query._execute_paged_composite_aggregations(
+                    table_name=table_name,
+                    key_sources_pairs=key_sources_pairs,
+                    batch_size=batch_size,
+                    progress=progress,
+                    log=log,
+                    auth_args=auth_args,
+                    query_overrides=query_overrides,
+                    max_pages=max_pages,
+                    **query_kwargs,
+                ),
             ),
         )
 
@@ -674,7 +1343,10 @@ class Query:
 
     @staticmethod
     def execute_ga4gh(
-        query: dict, all_results: bool = False, auth_args: dict = Auth.shared()
+        query: dict,
+        all_results: bool = False,
+        auth_args: dict = Auth.shared(),
+        ignore_cache: bool = False,
     ) -> pd.DataFrame:
         auth = Auth(auth_args)
         client = BaseClient(auth.session())
@@ -688,18 +1360,25 @@ class Query:
             },
         }
 
-        return recursive_execute_ga4gh(
-            auth=auth,
-            client=client,
-            path=path,
-            http_verb=http_verb,
-            results_key=results_key,
-            params=params,
-            scroll=all_results,
+        return _with_api_cache(
+            "ga4gh",
+            path,
+            {"path": path, "http_verb": http_verb.upper(), "params": params},
+            use_cache=(not ignore_cache) and all_results,
+            auth_args=auth_args,
+            execute=lambda: execute_paged_ga4gh(
+                auth=auth,
+                client=client,
+                path=path,
+                http_verb=http_verb,
+                results_key=results_key,
+                params=params,
+                scroll=all_results,
+            ),
         )
 
     @staticmethod
-    def _recursive_execute_composite_aggregations(
+    def _execute_paged_composite_aggregations(
         table_name: str,
         key_sources_pairs: List[Tuple[str, List[dict]]],
         batch_size: int = 100,
@@ -708,81 +1387,75 @@ class Query:
         log: bool = False,
         auth_args: Auth = Auth.shared(),
         max_pages: Union[int, None] = None,
-        _current_page: int = 1,
-        _prev_results: dict = {},
-        _after_keys: dict = {},
         **query_kwargs,
     ):
-        aggregation = Query.execute_fhir_dsl(
-            {
-                "type": "select",
-                "columns": [
-                    {
-                        "type": "elasticsearch",
-                        "aggregations": {
-                            key: {
-                                "composite": {
-                                    "sources": sources,
-                                    "size": batch_size,
-                                    **(
-                                        {"after": _after_keys[key]}
-                                        if key in _after_keys
-                                        else {}
-                                    ),
+        def fetch_page(after_keys: dict):
+            aggregation = Query.execute_fhir_dsl(
+                {
+                    "type": "select",
+                    "columns": [
+                        {
+                            "type": "elasticsearch",
+                            "aggregations": {
+                                key: {
+                                    "composite": {
+                                        "sources": sources,
+                                        "size": batch_size,
+                                        **(
+                                            {"after": after_keys[key]}
+                                            if key in after_keys
+                                            else {}
+                                        ),
+                                    }
                                 }
-                            }
-                            for key, sources in key_sources_pairs
-                            if (len(_after_keys) == 0) or (key in _after_keys)
-                        },
-                    }
-                ],
-                "from": [{"table": table_name}],
-                **query_overrides,
-            },
-            auth_args=auth_args,
-            log=log,
-            **query_kwargs,
-        )
+                                for key, sources in key_sources_pairs
+                                if (len(after_keys) == 0) or (key in after_keys)
+                            },
+                        }
+                    ],
+                    "from": [{"table": table_name}],
+                    **query_overrides,
+                },
+                auth_args=auth_args,
+                log=log,
+                **query_kwargs,
+            )
 
-        current_results = aggregation.data
-        results = FhirAggregation.reduce_composite_results(
-            _prev_results, current_results
-        )
+            current_results = aggregation.data
 
-        if (progress is not None) and (_current_page == 1) and max_pages:
-            progress.reset(max_pages)
+            if progress is not None:
+                # Update by count or pages (if max_pages specified)
+                progress.update(
+                    1
+                    if max_pages
+                    else FhirAggregation.count_composite_results(
+                        current_results
+                    )
+                )
 
-        if progress is not None:
-            # Update by count or pages (if max_pages specified)
-            progress.update(
-                1
-                if max_pages
-                else FhirAggregation.count_composite_results(current_results)
+            next_after_keys = FhirAggregation.find_composite_after_keys(
+                current_results, batch_size
             )
 
-        after_keys = FhirAggregation.find_composite_after_keys(
-            current_results, batch_size
-        )
-
-        if len(after_keys) == 0 or (
-            (max_pages is not None) and (_current_page >= max_pages)
-        ):
-            print(
-                f"Retrieved {FhirAggregation.count_composite_results(results)} results"
+            return (
+                current_results,
+                next_after_keys if len(next_after_keys) > 0 else None,
+                None,
             )
-            return results
 
-        return Query._recursive_execute_composite_aggregations(
-            table_name=table_name,
-            key_sources_pairs=key_sources_pairs,
-            batch_size=batch_size,
-            progress=progress,
-            query_overrides=query_overrides,
-            log=log,
-            auth_args=auth_args,
-            max_pages=max_pages,
-            _current_page=_current_page + 1,
-            _prev_results=results,
-            _after_keys=after_keys,
-            **query_kwargs,
+        if (progress is not None) and max_pages:
+            progress.reset(max_pages)
+
+        # Buckets are extended in place so that each page is only copied once
+        results = {}
+
+        for page in iter_pages(fetch_page, cursor={}, max_pages=max_pages):
+            for key, value in page.items.items():
+                results.setdefault(key, {"buckets": []})["buckets"].extend(
+                    value.get("buckets", [])
+                )
+
+        print(
+            f"Retrieved {FhirAggregation.count_composite_results(results)} results"
         )
+        return results
@@ -2,8 +2,9 @@ import json
 import pandas as pd
 from urllib.parse import urljoin
 from phc.base_client import BaseClient
-from typing import List, Union, Optional
+from typing import Generator, List, Union, Optional
 from phc.easy.auth import Auth
+from phc.easy.query.pagination import Page, iter_pages
 from phc.easy.util import tqdm
 
 MAX_RESULT_SIZE = 999
@@ -17,7 +18,7 @@ def clean_params(params: dict):
     }
 
 
-def recursive_paging_api_call(
+def iter_paging_api_pages(
     path: str,
     params: dict = {},
     http_verb: str = "GET",
@@ -27,17 +28,11 @@ def recursive_paging_api_call(
     max_pages: Optional[int] = None,
     page_size: Optional[int] = None,
     log: bool = False,
-    _current_page: int = 1,
-    _prev_results: List[dict] = [],
-    _next_page_token: Optional[str] = None,
-    _count: Optional[Union[float, int]] = None,
-):
+) -> Generator[Page, None, None]:
+    "Iterate through the pages of items from a paging API"
     auth = Auth(auth_args)
     client = BaseClient(auth.session())
 
-    if _next_page_token:
-        params = {**params, "nextPageToken": _next_page_token}
-
     if page_size:
         params = {**params, "pageSize": page_size}
 
@@ -50,72 +45,122 @@ def recursive_paging_api_call(
     actual_path = path.replace(":project_id", auth.project_id)
 
     # Compute count and add to progress
-    if _count is None and len(_prev_results) == 0:
-        count_response = client._api_call(
-            actual_path,
-            http_verb=http_verb,
-            # Use minimum pageSize in case this endpoint doesn't support count
-            params={**params, "include": "count", "pageSize": 1},
+    count_response = client._api_call(
+        actual_path,
+        http_verb=http_verb,
+        # Use minimum pageSize in case this endpoint doesn't support count
+        params={**params, "include": "count", "pageSize": 1},
+    )
+
+    count = count_response.get("count")
+    # Count appears to only go up to 999
+    if count == MAX_RESULT_SIZE:
+        print(f"Results are {count}+.")
+        count = None
+
+    if count and (progress is not None):
+        progress.reset(count)
+
+    def fetch_page(next_page_token: Optional[str]):
+        page_params = (
+            {**params, "nextPageToken": next_page_token}
+            if next_page_token
+            else params
         )
 
-        _count = count_response.get("count")
-        # Count appears to only go up to 999
-        if _count == 999:
-            print(f"Results are {_count}+.")
-            _count = None
-
-        if _count and (progress is not None):
-            progress.reset(_count)
-
-    if log:
-        print(
-            json.dumps(
-                {
-                    "url": urljoin(client.session.api_url, actual_path),
-                    "method": http_verb,
-                    "params": params,
-                },
-                indent=4,
+        if log:
+            print(
+                json.dumps(
+                    {
+                        "url": urljoin(client.session.api_url, actual_path),
+                        "method": http_verb,
+                        "params": page_params,
+                    },
+                    indent=4,
+                )
             )
-        )
 
-    response = client._api_call(actual_path, http_verb=http_verb, params=params)
+        response = client._api_call(
+            actual_path, http_verb=http_verb, params=page_params
+        )
 
-    current_results = response.data.get("items", [])
-    results = [*_prev_results, *current_results]
+        current_results = response.data.get("items", [])
 
-    if progress is not None:
-        progress.update(len(current_results))
+        if progress is not None:
+            progress.update(len(current_results))
 
-    is_last_batch = (
-        (scroll is False)
-        or ((max_pages is not None) and (_current_page >= max_pages))
         # Using the next link is the only completely reliable way to tell if a
         # next page exists
-        or (response.data.get("links", {}).get("next") is None)
-    )
-
-    if is_last_batch:
-        if progress is not None:
-            progress.close()
+        has_next = response.data.get("links", {}).get("next") is not None
 
-        print(
-            f"Retrieved {len(results)}{f'/{_count}' if _count else ''} results"
+        return (
+            current_results,
+            response.data.get("nextPageToken") if has_next else None,
+            count,
         )
-        return pd.DataFrame(results)
 
-    return recursive_paging_api_call(
+    return iter_pages(fetch_page, max_pages=max_pages)
+
+
+def fetch_paging_api_items(
+    path: str,
+    params: dict = {},
+    http_verb: str = "GET",
+    scroll: bool = False,
+    progress: Optional[tqdm] = None,
+    auth_args: Optional[Auth] = Auth.shared(),
+    max_pages: Optional[int] = None,
+    page_size: Optional[int] = None,
+    log: bool = False,
+) -> List[dict]:
+    "Retrieve the items of every page from a paging API"
+    pages = iter_paging_api_pages(
         path,
         params=params,
         http_verb=http_verb,
+        scroll=scroll,
         progress=progress,
         auth_args=auth_args,
         max_pages=max_pages,
         page_size=page_size,
         log=log,
-        scroll=scroll,
-        _current_page=_current_page + 1,
-        _prev_results=results,
-        _next_page_token=response.data.get("nextPageToken"),
-        _count=_count,
+    )
+
+    results = []
+    count = None
+
+    for page in pages:
+        results.extend(page.items)
+        count = page.total
+
+    if progress is not None:
+        progress.close()
+
+    print(f"Retrieved {len(results)}{f'/{count}' if count else ''} results")
+    return results
+
+
+def execute_paging_api_call(
+    path: str,
+    params: dict = {},
+    http_verb: str = "GET",
+    scroll: bool = False,
+    progress: Optional[tqdm] = None,
+    auth_args: Optional[Auth] = Auth.shared(),
+    max_pages: Optional[int] = None,
+    page_size: Optional[int] = None,
+    log: bool = False,
+):
+    return pd.DataFrame(
+        fetch_paging_api_items(
+            path,
+            params=params,
+            http_verb=http_verb,
+            scroll=scroll,
+            progress=progress,
+            auth_args=auth_args,
+            max_pages=max_pages,
+            page_size=page_size,
+            log=log,
+        )
     )
@@ -0,0 +1,73 @@
+from datetime import date, timedelta
+from typing import Callable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+# Windows are not split any further once they are this short
+MIN_WINDOW = timedelta(seconds=1)
+
+
+def _now(tz) -> pd.Timestamp:
+    "The current time in a time zone (or in UTC without a time zone)"
+    now = pd.Timestamp.now(tz="UTC")
+
+    return now.tz_convert(tz) if tz is not None else now.tz_localize(None)
+
+
+def partition_date_range(
+    count: Callable[[pd.Timestamp, pd.Timestamp], int],
+    since: Union[str, date],
+    until: Optional[Union[str, date]],
+    partitions: int,
+) -> List[Tuple[pd.Timestamp, Optional[pd.Timestamp]]]:
+    """Split a date range into consecutive windows of roughly equal record
+    counts (in chronological order)
+
+    Windows are halved until each holds at most 1/`partitions` of the records
+    in the range, so there may be more windows than `partitions` when records
+    are unevenly spread over time. Windows without records are left out.
+
+    Attributes
+    ----------
+    count : Callable[[pd.Timestamp, pd.Timestamp], int]
+        Counts the records from a date (inclusive) to a date (exclusive)
+
+    since : str | datetime
+        The start of the range (dates without a time zone are in UTC, as the
+        server reads them)
+
+    until : str | datetime
+        The end of the range (defaults to now, with the last window left open
+        so records updated during retrieval are included)
+
+    partitions : int
+        The number of windows to aim for
+    """
+    start = pd.Timestamp(since)
+    end = pd.Timestamp(until) if until is not None else _now(start.tz)
+
+    total = count(start, end)
+    target = max(1, -(-total // partitions))
+    windows = []
+
+    def split(window_start, window_end, window_count):
+        if window_count <= 0:
+            return
+
+        if window_count <= target or window_end - window_start <= MIN_WINDOW:
+            windows.append((window_start, window_end))
+            return
+
+        middle = window_start + (window_end - window_start) / 2
+        left_count = count(window_start, middle)
+
+        split(window_start, middle, left_count)
+        split(middle, window_end, window_count - left_count)
+
+    split(start, end, total)
+
+    if until is None:
+        last_start = windows[-1][0] if len(windows) > 0 else start
+        windows = [*windows[:-1], (last_start, None)]
+
+    return windows
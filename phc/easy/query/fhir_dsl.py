@@ -1,12 +1,21 @@
-from typing import Any, Callable, List, Union
+from typing import Any, AsyncGenerator, Callable, Generator, List, Tuple, Union
 from lenses import lens
 
+import asyncio
 import math
+import time
 import pandas as pd
 
 from phc.easy.auth import Auth
-from phc.services import Fhir
+from phc.services import AsyncFhir, Fhir
 from phc.easy.util import with_progress, tqdm
+from phc.easy.query.page_size import PageSizeController
+from phc.easy.query.pagination import (
+    Page,
+    aiter_pages,
+    iter_pages,
+    prefetch_pages,
+)
 from phc.easy.query.fhir_dsl_query import (
     MAX_RESULT_SIZE,
     DEFAULT_SCROLL_SIZE,
@@ -16,6 +25,8 @@ from phc.easy.query.fhir_dsl_query import (
 )
 
 MAX_RETRY_BACKOFF = 3
+# The number of chunked queries (e.g. of patient_ids) executed at once
+DEFAULT_CHUNK_CONCURRENCY = 4
 
 
 def query_allows_scrolling(query):
@@ -27,6 +38,45 @@ def query_allows_scrolling(query):
     return isinstance(lower, int) and isinstance(upper, int)
 
 
+def _should_retry(err: Exception, retry_backoff: bool, _retry_time: int):
+    return (
+        (_retry_time < MAX_RETRY_BACKOFF)
+        and retry_backoff
+        and ("Internal server error" in str(err))
+    )
+
+
+def _page_size_controller(query: dict, scroll: bool, adaptive: bool):
+    if adaptive and scroll and query_allows_scrolling(query):
+        return PageSizeController.for_query(query)
+
+    return None
+
+
+def _backoff_query(query: dict, record_count: Union[int, None]):
+    "Shrink the page size of a query after a server error"
+    if record_count is not None:
+        # Base first retry attempt on record count
+        def backoff_limit(limit: int):
+            return min(
+                (get_limit(query) or DEFAULT_SCROLL_SIZE) / 2,
+                math.pow(record_count, 0.85),
+            )
+
+    else:
+
+        def backoff_limit(limit: int):
+            return math.pow(limit, 0.85)
+
+    new_query = update_limit(query, backoff_limit)
+
+    print(
+        f"Received server error. Retrying with page_size={get_limit(new_query)}"
+    )
+
+    return new_query
+
+
 def execute_single_fhir_dsl(
     query: dict,
     scroll_id: str = "",
@@ -40,35 +90,17 @@ def execute_single_fhir_dsl(
     try:
         return fhir.dsl(auth.project_id, query, scroll_id)
     except Exception as err:
-        if (
-            (_retry_time >= MAX_RETRY_BACKOFF)
-            or (retry_backoff is False)
-            or ("Internal server error" not in str(err))
-        ):
+        if not _should_retry(err, retry_backoff, _retry_time):
             raise err
 
         if _retry_time == 1:
-            # Base first retry attempt on record count
             record_count = fhir.dsl(
                 auth.project_id, build_query(query, page_size=1), scroll="true"
             ).data["hits"]["total"]["value"]
-
-            def backoff_limit(limit: int):
-                return min(
-                    (get_limit(query) or DEFAULT_SCROLL_SIZE) / 2,
-                    math.pow(record_count, 0.85),
-                )
-
         else:
+            record_count = None
 
-            def backoff_limit(limit: int):
-                return math.pow(limit, 0.85)
-
-        new_query = update_limit(query, backoff_limit)
-
-        print(
-            f"Received server error. Retrying with page_size={get_limit(new_query)}"
-        )
+        new_query = _backoff_query(query, record_count)
 
         return execute_single_fhir_dsl(
             new_query,
@@ -79,63 +111,516 @@ def execute_single_fhir_dsl(
         )
 
 
-def recursive_execute_fhir_dsl(
+def _execute_adaptive_fhir_dsl(
+    controller: PageSizeController, query: dict, scroll_id: str, auth_args: Auth
+):
+    "Execute a scroll request with the controller's page size (and tune it)"
+    for retry_time in range(1, MAX_RETRY_BACKOFF + 1):
+        started = time.monotonic()
+
+        try:
+            response = execute_single_fhir_dsl(
+                controller.apply(query),
+                scroll_id=scroll_id,
+                auth_args=auth_args,
+            )
+        except Exception as err:
+            if not _should_retry(err, True, retry_time):
+                raise err
+
+            controller.failed()
+            print(
+                f"Received server error. Retrying with page_size={controller.size}"
+            )
+            continue
+
+        controller.observe(
+            len(response.data.get("hits").get("hits")),
+            time.monotonic() - started,
+            response.size,
+        )
+
+        return response
+
+
+def _parse_page(
+    response, scroll_id: str, scroll: bool, progress: Union[None, tqdm]
+):
+    "Extract the hits, next scroll id, and total count from a DSL response"
+    current_results = response.data.get("hits").get("hits")
+    actual_count = response.data["hits"]["total"]["value"]
+
+    if scroll_id == "true" and progress:
+        progress.reset(actual_count)
+
+    if progress:
+        progress.update(len(current_results))
+
+    next_scroll_id = (
+        response.data.get("_scroll_id", "")
+        if scroll and len(current_results) > 0
+        else None
+    )
+
+    return current_results, next_scroll_id, actual_count
+
+
+def iter_fhir_dsl_pages(
     query: dict,
     scroll: bool = False,
     progress: Union[None, tqdm] = None,
     auth_args: Auth = Auth.shared(),
-    callback: Union[Callable[[Any, bool], None], None] = None,
     max_pages: Union[int, None] = None,
-    _current_page: int = 1,
-    _scroll_id: str = "true",
-    _prev_hits: List = [],
-):
+    adaptive_page_size: bool = False,
+) -> Generator[Page, None, None]:
+    """Iterate through the pages of hits for a FHIR DSL query
+
+    With `adaptive_page_size`, the page size of a scroll is tuned from the
+    latency and size of each page (see `PageSizeController`).
+    """
     will_scroll = query_allows_scrolling(query) and scroll
+    controller = _page_size_controller(query, scroll, adaptive_page_size)
+
+    def fetch_page(scroll_id: str):
+        if controller is not None:
+            response = _execute_adaptive_fhir_dsl(
+                controller, query, scroll_id, auth_args
+            )
+        else:
+            response = execute_single_fhir_dsl(
+                query,
+                scroll_id=scroll_id if will_scroll else "",
+                retry_backoff=will_scroll,
+                auth_args=auth_args,
+            )
+
+        return _parse_page(response, scroll_id, scroll, progress)
+
+    return iter_pages(fetch_page, cursor="true", max_pages=max_pages)
 
-    response = execute_single_fhir_dsl(
+
+def execute_paged_fhir_dsl(
+    query: dict,
+    scroll: bool = False,
+    progress: Union[None, tqdm] = None,
+    auth_args: Auth = Auth.shared(),
+    callback: Union[Callable[[Any, bool], None], None] = None,
+    max_pages: Union[int, None] = None,
+    prefetch: int = 0,
+    adaptive_page_size: bool = False,
+):
+    pages = iter_fhir_dsl_pages(
         query,
-        scroll_id=_scroll_id if will_scroll else "",
-        retry_backoff=will_scroll,
+        scroll=scroll,
+        progress=progress,
         auth_args=auth_args,
+        max_pages=max_pages,
+        adaptive_page_size=adaptive_page_size,
     )
 
-    is_first_iteration = _scroll_id == "true"
-    current_results = response.data.get("hits").get("hits")
-    _scroll_id = response.data.get("_scroll_id", "")
-    actual_count = response.data["hits"]["total"]["value"]
-    current_result_count = len(current_results)
+    if prefetch > 0:
+        # Fetch the next pages while the callback transforms the current one
+        pages = prefetch_pages(pages, size=prefetch)
 
-    if is_first_iteration and progress:
-        progress.reset(actual_count)
+    if callback:
+        for page in pages:
+            if page.is_last:
+                return callback(page.items, True)
 
-    if progress:
-        progress.update(current_result_count)
+            callback(page.items, False)
+
+    results = []
+    actual_count = 0
+
+    for page in pages:
+        results.extend(page.items)
+        actual_count = page.total
+
+    suffix = "+" if actual_count == MAX_RESULT_SIZE else ""
+    print(f"Retrieved {len(results)}/{actual_count}{suffix} results")
+
+    return results
+
+
+def execute_sliced_fhir_dsl(
+    query: dict,
+    parallelism: int,
+    progress: Union[None, tqdm] = None,
+    auth_args: Auth = Auth.shared(),
+    callback: Union[Callable[[Any, bool], None], None] = None,
+    max_pages: Union[int, None] = None,
+):
+    """Scroll through a query with `parallelism` Elasticsearch slices fetched
+    concurrently. Batches are passed to the callback (or collected) in the
+    order they arrive, so results are not sorted across slices.
+
+    Pages that fail with a server error are retried with a smaller page size
+    (like `execute_single_fhir_dsl`), which the slice keeps using for the rest
+    of its scroll. `max_pages` is shared by all of the slices.
+    """
+    auth = Auth(auth_args)
+    fhir = Fhir(auth.session(), run_async=True)
+
+    hits = []
+    state = {"pages": 0, "total": 0}
 
-    is_last_batch = (
-        (current_result_count == 0)
-        or (scroll is False)
-        or ((max_pages is not None) and (_current_page >= max_pages))
+    def is_capped():
+        return (max_pages is not None) and (state["pages"] >= max_pages)
+
+    async def scroll_slice(slice_id: int):
+        slice_query = {**query, "slice": {"id": slice_id, "max": parallelism}}
+        scroll_id = "true"
+
+        while not is_capped():
+            # Reserve the page before awaiting so concurrent slices respect
+            # max_pages
+            state["pages"] += 1
+            response, slice_query = await _aexecute_backoff_fhir_dsl(
+                slice_query,
+                scroll_id=scroll_id,
+                retry_backoff=True,
+                auth_args=auth_args,
+            )
+
+            current_results = response.data.get("hits").get("hits")
+
+            if scroll_id == "true":
+                state["total"] += response.data["hits"]["total"]["value"]
+
+                if progress:
+                    progress.total = state["total"]
+                    progress.refresh()
+
+            if progress:
+                progress.update(len(current_results))
+
+            if len(current_results) == 0:
+                return
+
+            if callback:
+                callback(current_results, False)
+            else:
+                hits.extend(current_results)
+
+            scroll_id = response.data.get("_scroll_id", "")
+
+    fhir._event_loop.run_until_complete(
+        asyncio.gather(*[scroll_slice(i) for i in range(parallelism)])
     )
-    results = [] if callback else [*_prev_hits, *current_results]
 
-    if callback and not is_last_batch:
-        callback(current_results, False)
-    elif callback and is_last_batch:
-        return callback(current_results, True)
-    elif is_last_batch:
-        suffix = "+" if actual_count == MAX_RESULT_SIZE else ""
-        print(f"Retrieved {len(results)}/{actual_count}{suffix} results")
+    if callback:
+        return callback([], True)
+
+    print(f"Retrieved {len(hits)}/{state['total']} results")
+
+    return hits
+
+
+async def aexecute_single_fhir_dsl(
+    query: dict,
+    scroll_id: str = "",
+    retry_backoff: bool = False,
+    auth_args: Auth = Auth.shared(),
+):
+    "Coroutine version of `execute_single_fhir_dsl`"
+    response, _query = await _aexecute_backoff_fhir_dsl(
+        query,
+        scroll_id=scroll_id,
+        retry_backoff=retry_backoff,
+        auth_args=auth_args,
+    )
+
+    return response
+
+
+async def _aexecute_backoff_fhir_dsl(
+    query: dict,
+    scroll_id: str = "",
+    retry_backoff: bool = False,
+    auth_args: Auth = Auth.shared(),
+    _retry_time: int = 1,
+) -> Tuple[Any, dict]:
+    """Execute a FHIR DSL request (shrinking the page size after server
+    errors) and return the response with the query that succeeded
+    """
+    auth = Auth(auth_args)
+    fhir = AsyncFhir(auth.session())
+
+    try:
+        return await fhir.dsl(auth.project_id, query, scroll_id), query
+    except Exception as err:
+        if not _should_retry(err, retry_backoff, _retry_time):
+            raise err
+
+        if _retry_time == 1:
+            record_count = (
+                await fhir.dsl(
+                    auth.project_id,
+                    build_query(query, page_size=1),
+                    scroll="true",
+                )
+            ).data["hits"]["total"]["value"]
+        else:
+            record_count = None
 
-        return results
+        return await _aexecute_backoff_fhir_dsl(
+            _backoff_query(query, record_count),
+            scroll_id=scroll_id,
+            retry_backoff=True,
+            auth_args=auth_args,
+            _retry_time=_retry_time + 1,
+        )
 
-    return recursive_execute_fhir_dsl(
+
+async def _aexecute_adaptive_fhir_dsl(
+    controller: PageSizeController, query: dict, scroll_id: str, auth_args: Auth
+):
+    "Coroutine version of `_execute_adaptive_fhir_dsl`"
+    for retry_time in range(1, MAX_RETRY_BACKOFF + 1):
+        started = time.monotonic()
+
+        try:
+            response = await aexecute_single_fhir_dsl(
+                controller.apply(query),
+                scroll_id=scroll_id,
+                auth_args=auth_args,
+            )
+        except Exception as err:
+            if not _should_retry(err, True, retry_time):
+                raise err
+
+            controller.failed()
+            print(
+                f"Received server error. Retrying with page_size={controller.size}"
+            )
+            continue
+
+        controller.observe(
+            len(response.data.get("hits").get("hits")),
+            time.monotonic() - started,
+            response.size,
+        )
+
+        return response
+
+
+def aiter_fhir_dsl_pages(
+    query: dict,
+    scroll: bool = False,
+    progress: Union[None, tqdm] = None,
+    auth_args: Auth = Auth.shared(),
+    max_pages: Union[int, None] = None,
+    adaptive_page_size: bool = False,
+) -> AsyncGenerator[Page, None]:
+    """Asynchronously iterate through the pages of hits for a FHIR DSL query
+    (see `iter_fhir_dsl_pages`)
+    """
+    will_scroll = query_allows_scrolling(query) and scroll
+    controller = _page_size_controller(query, scroll, adaptive_page_size)
+
+    async def fetch_page(scroll_id: str):
+        if controller is not None:
+            response = await _aexecute_adaptive_fhir_dsl(
+                controller, query, scroll_id, auth_args
+            )
+        else:
+            response = await aexecute_single_fhir_dsl(
+                query,
+                scroll_id=scroll_id if will_scroll else "",
+                retry_backoff=will_scroll,
+                auth_args=auth_args,
+            )
+
+        return _parse_page(response, scroll_id, scroll, progress)
+
+    return aiter_pages(fetch_page, cursor="true", max_pages=max_pages)
+
+
+async def aexecute_paged_fhir_dsl(
+    query: dict,
+    scroll: bool = False,
+    progress: Union[None, tqdm] = None,
+    auth_args: Auth = Auth.shared(),
+    callback: Union[Callable[[Any, bool], None], None] = None,
+    max_pages: Union[int, None] = None,
+    adaptive_page_size: bool = False,
+):
+    "Coroutine version of `execute_paged_fhir_dsl` (without prefetching)"
+    pages = aiter_fhir_dsl_pages(
         query,
-        scroll=True,
+        scroll=scroll,
         progress=progress,
         auth_args=auth_args,
-        callback=callback,
         max_pages=max_pages,
-        _current_page=_current_page + 1,
-        _scroll_id=_scroll_id,
-        _prev_hits=results,
+        adaptive_page_size=adaptive_page_size,
+    )
+
+    if callback:
+        async for page in pages:
+            if page.is_last:
+                return callback(page.items, True)
+
+            callback(page.items, False)
+
+    results = []
+    actual_count = 0
+
+    async for page in pages:
+        results.extend(page.items)
+        actual_count = page.total
+
+    suffix = "+" if actual_count == MAX_RESULT_SIZE else ""
+    print(f"Retrieved {len(results)}/{actual_count}{suffix} results")
+
+    return results
+
+
+async def aexecute_chunked_fhir_dsl(
+    queries: List[dict],
+    scroll: bool = False,
+    concurrency: int = DEFAULT_CHUNK_CONCURRENCY,
+    progress: Union[None, tqdm] = None,
+    auth_args: Auth = Auth.shared(),
+    callback: Union[Callable[[Any, bool], None], None] = None,
+    max_pages: Union[int, None] = None,
+    adaptive_page_size: bool = False,
+    ordered: bool = False,
+    dedupe: bool = True,
+):
+    """Execute several queries (e.g. chunks of a large patient_ids filter)
+    with at most `concurrency` running at once
+
+    Hits are passed to the callback (or collected) in the order pages arrive.
+    With `ordered`, the hits of each query are instead passed on in the order
+    of `queries` (holding back pages of later queries until the earlier ones
+    finish). Queries then only start within `concurrency` of the first
+    unfinished one, so at most that many queries are held back. `max_pages`
+    limits the pages of each query.
+
+    With `dedupe`, hits that were already passed on for another query are
+    skipped. This keeps the id of every hit in memory, so it should only be
+    used when the queries can match the same records.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    seen_ids = set()
+    hits = []
+    state = {"total": 0, "head": 0}
+    held_back = [[] for _ in queries]
+    finished = [False for _ in queries]
+    head_moved = asyncio.Condition()
+
+    def pass_on(items: List[dict]):
+        new_hits = items
+
+        if dedupe:
+            new_hits = [hit for hit in items if hit["_id"] not in seen_ids]
+            seen_ids.update(hit["_id"] for hit in new_hits)
+
+        if len(new_hits) == 0:
+            return
+
+        if callback:
+            callback(new_hits, False)
+        else:
+            hits.extend(new_hits)
+
+    def add_page(index: int, page: Page):
+        if page.number == 1:
+            state["total"] += page.total or 0
+
+            if progress:
+                progress.total = state["total"]
+                progress.refresh()
+
+        if progress:
+            progress.update(len(page.items))
+
+        if ordered and index != state["head"]:
+            held_back[index].append(page.items)
+        else:
+            pass_on(page.items)
+
+    def finish(index: int):
+        finished[index] = True
+
+        # Release pages held back for the queries that are now first in line
+        while state["head"] < len(queries) and finished[state["head"]]:
+            state["head"] += 1
+
+            if state["head"] < len(queries):
+                for items in held_back[state["head"]]:
+                    pass_on(items)
+
+                held_back[state["head"]] = []
+
+    async def run_query(index: int, query: dict):
+        if ordered:
+            # Bound the pages held back behind a slow query
+            async with head_moved:
+                await head_moved.wait_for(
+                    lambda: index < state["head"] + concurrency
+                )
+
+        async with semaphore:
+            pages = aiter_fhir_dsl_pages(
+                query,
+                scroll=scroll,
+                auth_args=auth_args,
+                max_pages=max_pages,
+                adaptive_page_size=adaptive_page_size,
+            )
+
+            try:
+                async for page in pages:
+                    add_page(index, page)
+            finally:
+                await pages.aclose()
+
+        finish(index)
+
+        if ordered:
+            async with head_moved:
+                head_moved.notify_all()
+
+    await asyncio.gather(
+        *[run_query(index, query) for index, query in enumerate(queries)]
+    )
+
+    if callback:
+        return callback([], True)
+
+    print(f"Retrieved {len(hits)}/{state['total']} results")
+
+    return hits
+
+
+def execute_chunked_fhir_dsl(
+    queries: List[dict],
+    scroll: bool = False,
+    concurrency: int = DEFAULT_CHUNK_CONCURRENCY,
+    progress: Union[None, tqdm] = None,
+    auth_args: Auth = Auth.shared(),
+    callback: Union[Callable[[Any, bool], None], None] = None,
+    max_pages: Union[int, None] = None,
+    adaptive_page_size: bool = False,
+    ordered: bool = False,
+    dedupe: bool = True,
+):
+    "Blocking version of `aexecute_chunked_fhir_dsl`"
+    auth = Auth(auth_args)
+    fhir = Fhir(auth.session(), run_async=True)
+
+    return fhir._event_loop.run_until_complete(
+        aexecute_chunked_fhir_dsl(
+            queries,
+            scroll=scroll,
+            concurrency=concurrency,
+            progress=progress,
+            auth_args=auth_args,
+            callback=callback,
+            max_pages=max_pages,
+            adaptive_page_size=adaptive_page_size,
+            ordered=ordered,
+            dedupe=dedupe,
+        )
     )
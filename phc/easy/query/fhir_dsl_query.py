@@ -1,3 +1,4 @@
+from datetime import date
 from functools import partial
 from typing import Callable, List, Optional, Union
 
@@ -8,6 +9,15 @@ from phc.easy.util import add_prefixes
 
 MAX_RESULT_SIZE = 10000
 DEFAULT_SCROLL_SIZE = int(MAX_RESULT_SIZE * 0.9)
+# Each ID is sent both with and without its prefixes so a chunk of patient IDs
+# produces (at least) twice as many terms
+PATIENT_IDS_CHUNK_SIZE = 1000
+# Patient keys that reference a single patient (so each record matches only one
+# chunk of patient IDs)
+SINGLE_PATIENT_KEYS = ["subject.reference", "patient.reference"]
+LAST_UPDATED_FIELD = "meta.lastUpdated"
+# Prefixes that patient IDs are sent with (see PatientItem.patient_id_prefixes)
+PATIENT_ID_PREFIXES = ["Patient/", "urn:uuid:"]
 
 FHIR_WHERE = lens.Get("where", {})
 FHIR_WHERE_TYPE = FHIR_WHERE.Get("type", "")
@@ -93,6 +103,110 @@ def _patient_ids_adder(
     )
 
 
+def chunk_patient_ids(
+    query_kwargs: dict, chunk_size: int = PATIENT_IDS_CHUNK_SIZE
+) -> List[dict]:
+    """Split the patient_id(s) of `build_query` arguments into separate
+    arguments with at most `chunk_size` (unique) patient IDs each
+
+    The arguments are returned unchanged (as the only item) when they do not
+    need to be split.
+    """
+    patient_id = query_kwargs.get("patient_id")
+    patient_ids = list(
+        dict.fromkeys(
+            [
+                *query_kwargs.get("patient_ids", []),
+                *([patient_id] if patient_id else []),
+            ]
+        )
+    )
+
+    if len(patient_ids) <= chunk_size:
+        return [query_kwargs]
+
+    return [
+        {
+            **query_kwargs,
+            "patient_id": None,
+            "patient_ids": patient_ids[start : start + chunk_size],
+        }
+        for start in range(0, len(patient_ids), chunk_size)
+    ]
+
+
+def patient_id_chunks_can_overlap(query_kwargs: dict) -> bool:
+    """Whether a record can match several chunks of `chunk_patient_ids` (when
+    its patient key can reference more than one patient)
+    """
+    return (
+        query_kwargs.get("patient_key", "subject.reference")
+        not in SINGLE_PATIENT_KEYS
+    )
+
+
+def _is_prefixed_id(value, ids: set) -> bool:
+    "Whether a value is one of the IDs with a patient ID prefix"
+    return isinstance(value, str) and any(
+        value.startswith(prefix) and value[len(prefix) :] in ids
+        for prefix in PATIENT_ID_PREFIXES
+    )
+
+
+def _canonical_terms(field: str, values: list) -> list:
+    unique = set(values)
+
+    # Prefixed patient IDs (see _patient_ids_adder) match the same records as
+    # the bare IDs that are sent along with them. Other fields are left alone.
+    if field.endswith("reference.keyword"):
+        unique = {
+            value for value in unique if not _is_prefixed_id(value, unique)
+        }
+
+    return sorted(unique, key=lambda value: (type(value).__name__, str(value)))
+
+
+def canonicalize_query(query: dict) -> dict:
+    """A copy of a query where equivalent queries are equal (e.g. to use as a
+    cache key)
+
+    Keys are sorted, `terms` values are sorted and deduplicated, and prefixed
+    patient IDs in reference fields are dropped when the bare ID is also
+    present.
+    """
+
+    def canonical_terms(clause):
+        if not isinstance(clause, dict):
+            return canonical(clause)
+
+        return {
+            field: (
+                _canonical_terms(field, values)
+                if isinstance(values, list)
+                else values
+            )
+            for field, values in sorted(clause.items())
+        }
+
+    def canonical(value):
+        if isinstance(value, dict):
+            return {
+                key: (
+                    canonical_terms(value[key])
+                    if key == "terms"
+                    else canonical(value[key])
+                )
+                for key in sorted(value.keys())
+            }
+
+        if isinstance(value, list):
+            return [canonical(v) for v in value]
+
+        return value
+
+    return canonical(query)
+
+
 def _term_adder(term: Optional[dict]):
     if term is None:
         return identity
@@ -100,6 +214,29 @@ def _term_adder(term: Optional[dict]):
     return partial(and_query_clause, query_clause={"term": term})
 
 
+def _format_date(value: Union[str, date]) -> str:
+    return value if isinstance(value, str) else value.isoformat()
+
+
+def _date_range_adder(
+    date_field: str,
+    since: Optional[Union[str, date]],
+    until: Optional[Union[str, date]],
+):
+    bounds = {
+        key: _format_date(value)
+        for key, value in [("gte", since), ("lt", until)]
+        if value is not None
+    }
+
+    if len(bounds) == 0:
+        return identity
+
+    return partial(
+        and_query_clause, query_clause={"range": {date_field: bounds}}
+    )
+
+
 def _code_adder(
     attribute: Union[str],
     code_fields: List[str],
@@ -123,6 +260,21 @@ def _code_adder(
     )
 
 
+def _columns_adder(columns: Optional[List[str]]):
+    if columns is None:
+        return identity
+
+    # Only top-level fields can be projected (and id is always kept)
+    names = list(dict.fromkeys(["id", *[c.split(".")[0] for c in columns]]))
+
+    return lambda query: {
+        **query,
+        "columns": [
+            {"expr": {"type": "column_ref", "column": name}} for name in names
+        ],
+    }
+
+
 def _limit_adder(page_size: Union[int, None]):
     if page_size is None:
         return identity
@@ -138,6 +290,10 @@ def build_query(
     patient_id_prefixes: List[str] = ["Patient/"],
     page_size: Optional[int] = None,
     term: Optional[dict] = None,
+    columns: Optional[List[str]] = None,
+    since: Optional[Union[str, date]] = None,
+    until: Optional[Union[str, date]] = None,
+    date_field: str = LAST_UPDATED_FIELD,
     # Codes
     code_fields: List[str] = [],
     code: Optional[Union[str, List[str]]] = None,
@@ -172,6 +328,21 @@ def build_query(
     page_size: int
         The number of records to fetch per page
 
+    columns : List[str]
+        Only retrieve these fields of each record instead of the entire
+        resource (nested paths such as "code.coding" retrieve their top-level
+        field and id is always retrieved)
+
+    since : str | datetime
+        Only find records with a `date_field` on or after this date
+
+    until : str | datetime
+        Only find records with a `date_field` before this date
+
+    date_field : str
+        The date to filter by with since and until (default:
+        "meta.lastUpdated")
+
     code_fields : List[str]
         A list of paths to find FHIR codes in
 
@@ -194,10 +365,12 @@ def build_query(
             patient_id_prefixes=patient_id_prefixes,
         ),
         _term_adder(term),
+        _date_range_adder(date_field, since, until),
         _code_adder(attribute="code", code_fields=code_fields, value=code),
         _code_adder(
             attribute="display", code_fields=code_fields, value=display
         ),
         _code_adder(attribute="system", code_fields=code_fields, value=system),
+        _columns_adder(columns),
         _limit_adder(page_size),
     )
@@ -1,12 +1,12 @@
-from typing import List, Union
+from typing import Generator, Union
 from phc.easy.auth import Auth
 from phc.base_client import BaseClient
+from phc.easy.query.pagination import Page, iter_pages
 
 PAGE_SIZE = 50
 
 
-def recursive_execute_ga4gh(
-    auth: Auth,
+def iter_ga4gh_pages(
     client: BaseClient,
     path: str,
     http_verb: str,
@@ -14,31 +14,50 @@ def recursive_execute_ga4gh(
     params: dict,
     scroll: bool = False,
     next_page_token: Union[str, None] = None,
-    _prev_results: List[dict] = [],
-):
+) -> Generator[Page, None, None]:
+    "Iterate through the pages of results from a GA4GH endpoint"
     page_size = params.get("pageSize", PAGE_SIZE)
 
-    response = client._ga4gh_call(
-        path, http_verb=http_verb, json={**params, "pageToken": next_page_token}
-    )
+    def fetch_page(page_token: Union[str, None]):
+        response = client._ga4gh_call(
+            path, http_verb=http_verb, json={**params, "pageToken": page_token}
+        )
+
+        current_results = response.data[results_key]
+
+        is_last_batch = len(current_results) < page_size or scroll is False
 
-    current_results = response.data[results_key]
-    results = [*_prev_results, *current_results]
+        return (
+            current_results,
+            None if is_last_batch else response.data["nextPageToken"],
+            None,
+        )
 
-    is_last_batch = len(current_results) < page_size or scroll is False
+    return iter_pages(fetch_page, cursor=next_page_token)
 
-    if is_last_batch:
-        print(f"Retrieved {len(results)} results")
-        return results
 
-    return recursive_execute_ga4gh(
-        auth=auth,
+def execute_paged_ga4gh(
+    auth: Auth,
+    client: BaseClient,
+    path: str,
+    http_verb: str,
+    results_key: str,
+    params: dict,
+    scroll: bool = False,
+    next_page_token: Union[str, None] = None,
+):
+    results = []
+
+    for page in iter_ga4gh_pages(
         client=client,
         path=path,
         http_verb=http_verb,
         results_key=results_key,
         params=params,
         scroll=scroll,
-        next_page_token=response.data["nextPageToken"],
-        _prev_results=results,
-    )
+        next_page_token=next_page_token,
+    ):
+        results.extend(page.items)
+
+    print(f"Retrieved {len(results)} results")
+    return results
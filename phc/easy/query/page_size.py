@@ -0,0 +1,139 @@
+import threading
+from typing import Dict, Tuple
+
+from phc.easy.query.fhir_dsl_query import (
+    DEFAULT_SCROLL_SIZE,
+    get_limit,
+    update_limit,
+)
+
+# Page sizes tuned by earlier scrolls keyed by the queried tables and projected
+# columns so that the next scroll of the same resource type (and projection)
+# starts at a size that worked
+_tuned_sizes: Dict[Tuple[Tuple[str, ...], ...], int] = {}
+_tuned_sizes_lock = threading.Lock()
+
+
+def _tables(query: dict) -> Tuple[str, ...]:
+    return tuple(sorted(d.get("table", "") for d in query.get("from", [])))
+
+
+def _columns(query: dict) -> Tuple[str, ...]:
+    "The projected columns of a query (empty when selecting whole records)"
+    columns = query.get("columns", "*")
+
+    if not isinstance(columns, list):
+        return ()
+
+    return tuple(
+        sorted(str(c.get("expr", {}).get("column", "")) for c in columns)
+    )
+
+
+def _key(query: dict) -> Tuple[Tuple[str, ...], ...]:
+    # A projection returns much smaller records than the whole resources, so
+    # it is tuned separately
+    return (_tables(query), _columns(query))
+
+
+class PageSizeController:
+    """Tunes the page size of a scroll from the latency and response size of
+    each page
+
+    The size is set so a page is expected to take `target_latency` seconds
+    and stay under `max_bytes`, growing by at most `growth` per page and
+    shrinking as far as needed at once (or like the server error backoff when
+    a page fails).
+
+    Attributes
+    ----------
+    initial_size : int
+        The page size to start with
+
+    min_size : int
+        The smallest page size to use
+
+    max_size : int
+        The largest page size to use
+
+    target_latency : float
+        The seconds a page should take to retrieve
+
+    max_bytes : int
+        The largest response (in bytes) a page should produce
+
+    growth : float
+        The largest factor the size is increased by after a single page
+
+    key : Tuple[Tuple[str, ...], ...]
+        Where the tuned size is remembered for later scrolls (if provided)
+    """
+
+    def __init__(
+        self,
+        initial_size: int = DEFAULT_SCROLL_SIZE,
+        min_size: int = 10,
+        max_size: int = DEFAULT_SCROLL_SIZE,
+        target_latency: float = 5,
+        max_bytes: int = 50 * 1024 * 1024,
+        growth: float = 1.5,
+        key: Tuple[Tuple[str, ...], ...] = None,
+    ):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self.growth = growth
+        self.key = key
+        self.size = self._clamp(initial_size)
+
+    @staticmethod
+    def for_query(query: dict, **kwargs):
+        """Build a controller that starts at the size last tuned for the
+        query's tables and projection (or the query's limit)
+        """
+        key = _key(query)
+
+        with _tuned_sizes_lock:
+            initial_size = _tuned_sizes.get(key)
+
+        return PageSizeController(
+            initial_size=initial_size
+            or get_limit(query)
+            or DEFAULT_SCROLL_SIZE,
+            key=key,
+            **kwargs,
+        )
+
+    def apply(self, query: dict) -> dict:
+        "The query with the current page size"
+        return update_limit(query, lambda _limit: self.size)
+
+    def observe(self, count: int, latency: float, size_in_bytes: int):
+        "Adjust the page size after a page of `count` records was retrieved"
+        if count == 0:
+            return
+
+        ideal = self.size * self.growth
+
+        if latency > 0:
+            ideal = min(ideal, count * self.target_latency / latency)
+
+        if size_in_bytes > 0:
+            ideal = min(ideal, count * self.max_bytes / size_in_bytes)
+
+        self._set(ideal)
+
+    def failed(self):
+        "Shrink the page size after a server error"
+        self._set(self.size ** 0.85)
+
+    def _clamp(self, size: float) -> int:
+        return int(max(self.min_size, min(self.max_size, size)))
+
+    def _set(self, size: float):
+        self.size = self._clamp(size)
+
+        if self.key is not None:
+            with _tuned_sizes_lock:
+                _tuned_sizes[self.key] = self.size
@@ -0,0 +1,163 @@
+import asyncio
+import queue
+import threading
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Generator,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from phc.base_client import BaseClient
+
+
+class Page(NamedTuple):
+    "A single page of results from a paginated API"
+    items: List[Any]
+    number: int
+    is_last: bool
+    total: Optional[int] = None
+
+
+def iter_pages(
+    fetch_page: Callable[[Any], Tuple[List[Any], Optional[Any], Optional[int]]],
+    cursor: Any = None,
+    max_pages: Optional[int] = None,
+) -> Generator[Page, None, None]:
+    """Iterate through pages of an API without recursion
+
+    Attributes
+    ----------
+    fetch_page : Callable[[Any], Tuple[List[Any], Optional[Any], Optional[int]]]
+        Fetches the page for a cursor (e.g. a scroll id or next page token)
+        and returns the items, the cursor for the next page, and the total
+        record count (if known). A next cursor of None signals that this is
+        the last page.
+
+    cursor : Any
+        The cursor for the first page
+
+    max_pages : int
+        The number of pages to retrieve before stopping
+    """
+    number = 1
+
+    while True:
+        items, next_cursor, total = fetch_page(cursor)
+
+        is_last = (next_cursor is None) or (
+            (max_pages is not None) and (number >= max_pages)
+        )
+
+        yield Page(items=items, number=number, is_last=is_last, total=total)
+
+        if is_last:
+            return
+
+        cursor = next_cursor
+        number += 1
+
+
+async def aiter_pages(
+    fetch_page: Callable[
+        [Any], Awaitable[Tuple[List[Any], Optional[Any], Optional[int]]]
+    ],
+    cursor: Any = None,
+    max_pages: Optional[int] = None,
+) -> AsyncGenerator[Page, None]:
+    """Iterate through pages of an API with a coroutine for fetching each
+    page (see `iter_pages`)
+    """
+    number = 1
+
+    while True:
+        items, next_cursor, total = await fetch_page(cursor)
+
+        is_last = (next_cursor is None) or (
+            (max_pages is not None) and (number >= max_pages)
+        )
+
+        yield Page(items=items, number=number, is_last=is_last, total=total)
+
+        if is_last:
+            return
+
+        cursor = next_cursor
+        number += 1
+
+
+def _close_thread_event_loop():
+    "Release the event loop (and its connections) created by a worker thread"
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        return
+
+    BaseClient.close_shared_pools(loop)
+    loop.close()
+
+
+def prefetch_pages(
+    pages: Iterator[Page], size: int = 1
+) -> Generator[Page, None, None]:
+    """Fetch pages in a background thread while the current page is being
+    processed
+
+    Attributes
+    ----------
+    pages : Iterator[Page]
+        The pages to fetch (e.g. from `iter_pages`)
+
+    size : int
+        The number of fetched pages allowed to wait in the queue before the
+        background thread pauses
+    """
+    buffer = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+    finished = object()
+
+    def put(entry):
+        while not stopped.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def produce():
+        try:
+            for page in pages:
+                if not put((page, None)):
+                    return
+
+            put((finished, None))
+        except Exception as err:
+            put((finished, err))
+        finally:
+            _close_thread_event_loop()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            page, err = buffer.get()
+
+            if err is not None:
+                raise err
+
+            if page is finished:
+                return
+
+            yield page
+    finally:
+        stopped.set()
+        thread.join()
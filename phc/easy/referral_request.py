@@ -22,9 +22,6 @@ class ReferralRequest(PatientItem):
                 *expand_args.get("custom_columns", []),
                 Frame.codeable_like_column_expander("subject"),
                 Frame.codeable_like_column_expander("context"),
-                (
-                    "requester",
-                    lambda r: pd.json_normalize(r).add_prefix("requester."),
-                ),
+                Frame.json_normalize_column_expander("requester"),
             ],
         )
@@ -1,6 +1,6 @@
 import math
-from functools import reduce, wraps
-from typing import Callable, List, Union
+from functools import wraps
+from typing import Any, Awaitable, Callable, List, Union
 
 import pandas as pd
 from funcy import lmapcat
@@ -38,24 +38,24 @@ def prefix_dict_keys(dictionary, prefix: Union[str, int]):
 def concat_dicts(dicts, prefix: Union[str, int] = ""):
     "Concatenate list of dictionaries"
 
-    def bump_key_index(key, existing_dict, start=1):
+    def bump_key_index(key, existing_dict):
         "Prefix with _1 until index not in existing dictionary"
         if key not in existing_dict:
             return key
 
-        new_key = f"{key}_{start}"
-        if new_key in existing_dict:
-            return bump_key_index(key, existing_dict, start + 1)
+        start = 1
+        while f"{key}_{start}" in existing_dict:
+            start += 1
 
-        return new_key
+        return f"{key}_{start}"
 
-    def reduce_two_dicts(acc, dictionary):
-        return {
-            **acc,
-            **{bump_key_index(k, acc): v for k, v in dictionary.items()},
-        }
+    # Mutate a single accumulator (instead of rebuilding it for each
+    # dictionary) while still bumping keys against the previous dictionaries
+    acc = {}
+    for dictionary in dicts:
+        acc.update({bump_key_index(k, acc): v for k, v in dictionary.items()})
 
-    return prefix_dict_keys(reduce(reduce_two_dicts, dicts, {}), prefix)
+    return prefix_dict_keys(acc, prefix)
 
 
 def defaultprop(fn):
@@ -91,6 +91,21 @@ def with_progress(
     return func(None)
 
 
+async def awith_progress(
+    init_progress: Callable[[], tqdm],
+    func: Callable[[Union[None, tqdm]], Awaitable[Any]],
+):
+    "Coroutine version of `with_progress`"
+    if _has_tqdm:
+        progress = init_progress()
+        try:
+            return await func(progress)
+        finally:
+            progress.close()
+
+    return await func(None)
+
+
 def update_progress(progress: tqdm, n: int, description: str = ""):
     """Update progress if available (Returns True to allow `and` chaining):
 
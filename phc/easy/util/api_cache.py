@@ -1,28 +1,150 @@
 import hashlib
+import inspect
 import json
 import os
-from pathlib import Path
-from typing import Callable
+import re
+from functools import partial
+from typing import Callable, Iterable, List, Optional
 
 import numpy as np
 import pandas as pd
 
+from phc.easy.cache import DIR, Cache
 from phc.easy.query.fhir_aggregation import FhirAggregation
+from phc.easy.query.fhir_dsl_query import canonicalize_query
+from phc.util import json_codec
 from phc.util.csv_writer import CSVWriter
+from phc.util.ndjson_writer import NDJSONWriter
+from phc.util.parquet_writer import ParquetWriter
 
-DIR = "~/Downloads/phc/api-cache"
 DATE_FORMAT_REGEX = (
     r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{3})?([-+]\d{4}|Z)"
 )
+CACHE_FORMATS = ["csv", "parquet"]
+RAW_EXTENSION = "ndjson.gz"
+# Seconds that results of paging API, GA4GH, and composite aggregation requests
+# are reused for (counts and aggregations go stale as records are added)
+API_TTL = 60 * 60
+
+
+def _last_updated(sources: Iterable[dict]) -> Optional[str]:
+    "The latest meta.lastUpdated of some FHIR resources (if any)"
+    dates = pd.to_datetime(
+        pd.Series(
+            [
+                source.get("meta", {}).get("lastUpdated")
+                for source in sources
+                if isinstance(source.get("meta"), dict)
+            ],
+            dtype=object,
+        ),
+        utc=True,
+        errors="coerce",
+    ).dropna()
+
+    return None if len(dates) == 0 else dates.max().isoformat()
+
+
+def _later(first: Optional[str], second: Optional[str]) -> Optional[str]:
+    if first is None or second is None:
+        return first or second
+
+    return max(first, second, key=pd.Timestamp)
+
+
+def _without_missing(record: dict) -> dict:
+    "A record from a data frame without the columns it did not have"
+    return {
+        key: value
+        for key, value in record.items()
+        if not (isinstance(value, float) and np.isnan(value))
+    }
+
+
+def _describe(value):
+    "A description of a value (e.g. an expander) that is stable across runs"
+    if isinstance(value, partial):
+        return [_describe(value.func), value.args, value.keywords]
+
+    if callable(value):
+        try:
+            source = inspect.getsource(value)
+        except (OSError, TypeError):
+            source = ""
+
+        return [
+            getattr(value, "__module__", None),
+            getattr(value, "__qualname__", type(value).__qualname__),
+            hashlib.sha256(source.encode("utf-8")).hexdigest(),
+        ]
+
+    return repr(value)
+
+
+def _table_name(query: dict) -> str:
+    return ",".join(d.get("table", "") for d in query.get("from", []))
 
 
 class APICache:
+    format = "csv"
+    # Whether the raw hits of FHIR DSL queries are cached (compressed) as well
+    # so results can be expanded again without retrieving them. Off by default
+    # since it roughly doubles the disk used (and the time spent writing).
+    store_raw = False
+
+    @staticmethod
+    def set_format(format: str):
+        """Set the storage format for cached results ("csv" or "parquet")
+
+        Parquet preserves column types (including time zone aware dates) and
+        loads much faster, but requires pyarrow to be installed.
+        """
+        if format not in CACHE_FORMATS:
+            raise ValueError(
+                f"Unknown cache format {format} (expected one of {CACHE_FORMATS})"
+            )
+
+        APICache.format = format
+
+    @staticmethod
+    def key_for_fhir_dsl(query: dict, context: Optional[dict] = None) -> str:
+        """Hash of the canonical form of a query and the context (e.g.
+        account, project, and environment) it is run in
+
+        The page size of a scroll does not change its results so it is left
+        out of the key for all but aggregation queries.
+        """
+        canonical = canonicalize_query(query)
+
+        if not FhirAggregation.is_aggregation_query(query):
+            canonical.pop("limit", None)
+
+        return hashlib.sha256(
+            json.dumps(
+                {"query": canonical, "context": context or {}}, sort_keys=True
+            ).encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def fingerprint(value) -> str:
+        """Hash of a value (such as how results are transformed) including
+        the code of any functions in it
+        """
+        return hashlib.sha256(
+            json.dumps(value, sort_keys=True, default=_describe).encode("utf-8")
+        ).hexdigest()
+
     @staticmethod
-    def filename_for_fhir_dsl(query: dict):
-        "Descriptive filename with hash of query for easy retrieval"
+    def filename_for_fhir_dsl(
+        query: dict, context: Optional[dict] = None, raw: bool = False
+    ):
+        """Descriptive filename with hash of query for easy retrieval (of the
+        results or of their raw hits)
+        """
         is_aggregation = FhirAggregation.is_aggregation_query(query)
 
         agg_description = "agg" if is_aggregation else ""
+        raw_description = "raw" if raw else ""
 
         column_description = (
             f"{len(query.get('columns', []))}col"
@@ -32,87 +154,444 @@ class APICache:
 
         where_description = "where" if query.get("where") else ""
 
-        unique_hash = hashlib.sha256(
-            json.dumps(query).encode("utf-8")
-        ).hexdigest()[0:8]
+        unique_hash = APICache.key_for_fhir_dsl(query, context)[0:8]
 
         components = [
             "fhir",
             "dsl",
             *[d.get("table", "") for d in query.get("from", [])],
             agg_description,
+            raw_description,
             column_description,
             where_description,
             unique_hash,
         ]
 
-        extension = "json" if is_aggregation else "csv"
+        extension = (
+            "json"
+            if is_aggregation
+            else RAW_EXTENSION
+            if raw
+            else APICache.format
+        )
 
         return "_".join([c for c in components if len(c) > 0]) + "." + extension
 
     @staticmethod
-    def does_cache_for_fhir_dsl_exist(query: dict) -> bool:
-        return (
-            Path(DIR)
-            .expanduser()
-            .joinpath(APICache.filename_for_fhir_dsl(query))
-            .exists()
+    def does_cache_for_fhir_dsl_exist(
+        query: dict, context: Optional[dict] = None
+    ) -> bool:
+        "Whether an unexpired cache exists (recorded as a cache hit or miss)"
+        return Cache.lookup(
+            APICache.filename_for_fhir_dsl(query, context),
+            key=APICache.key_for_fhir_dsl(query, context),
         )
 
     @staticmethod
-    def load_cache_for_fhir_dsl(query: dict) -> pd.DataFrame:
+    def does_raw_cache_for_fhir_dsl_exist(
+        query: dict, context: Optional[dict] = None
+    ) -> bool:
+        """Whether the raw hits of a query are cached (recorded as a cache hit
+        or miss)
+        """
+        if FhirAggregation.is_aggregation_query(query):
+            return False
+
+        return Cache.lookup(
+            APICache.filename_for_fhir_dsl(query, context, raw=True),
+            key=APICache.key_for_fhir_dsl(query, context),
+        )
+
+    @staticmethod
+    def expand_raw_cache_for_fhir_dsl(
+        query: dict,
+        transform: Callable[[pd.DataFrame], pd.DataFrame],
+        context: Optional[dict] = None,
+        raw_context: Optional[dict] = None,
+    ) -> pd.DataFrame:
+        """Cache the results of a query by transforming its cached raw hits
+        (instead of retrieving them again)
+
+        Attributes
+        ----------
+        context : dict
+            The context of the results (including the transform)
+
+        raw_context : dict
+            The context of the raw hits
+        """
+        filename = str(
+            Cache.folder().joinpath(
+                APICache.filename_for_fhir_dsl(query, raw_context, raw=True)
+            )
+        )
+        print(f'[CACHE] Expanding raw hits from "{filename}"')
+
+        callback = APICache.build_cache_fhir_dsl_callback(
+            query, transform, context
+        )
+
+        for batch in NDJSONWriter.read_batches(filename):
+            callback([{"_source": source} for source in batch], False)
+
+        return callback([], True)
+
+    @staticmethod
+    def load_cache_for_fhir_dsl(
+        query: dict,
+        columns: Optional[List[str]] = None,
+        context: Optional[dict] = None,
+    ) -> pd.DataFrame:
         filename = str(
-            Path(DIR)
-            .expanduser()
-            .joinpath(APICache.filename_for_fhir_dsl(query))
+            Cache.folder().joinpath(
+                APICache.filename_for_fhir_dsl(query, context)
+            )
         )
         print(f'[CACHE] Loading from "{filename}"')
 
         if FhirAggregation.is_aggregation_query(query):
             with open(filename, "r") as f:
-                return FhirAggregation(json.load(f))
+                return FhirAggregation(json_codec.load(f))
 
-        return APICache.read_csv(filename)
+        return APICache.read(filename, columns=columns)
 
     @staticmethod
     def build_cache_fhir_dsl_callback(
-        query: dict, transform: Callable[[pd.DataFrame], pd.DataFrame]
+        query: dict,
+        transform: Callable[[pd.DataFrame], pd.DataFrame],
+        context: Optional[dict] = None,
+        raw_context: Optional[dict] = None,
     ):
-        "Build a CSV callback (not used for aggregations)"
-        folder = Path(DIR).expanduser()
+        """Build a CSV callback (not used for aggregations) that also caches
+        the raw hits when `raw_context` is given
+        """
+        folder = Cache.folder()
         folder.mkdir(parents=True, exist_ok=True)
 
-        filename = str(folder.joinpath(APICache.filename_for_fhir_dsl(query)))
+        name = APICache.filename_for_fhir_dsl(query, context)
+        filename = str(folder.joinpath(name))
 
-        writer = CSVWriter(filename)
+        writer = (
+            ParquetWriter(filename)
+            if filename.endswith(".parquet")
+            else CSVWriter(filename)
+        )
+
+        raw_name = (
+            APICache.filename_for_fhir_dsl(query, raw_context, raw=True)
+            if raw_context is not None and APICache.store_raw
+            else None
+        )
+        raw_writer = (
+            NDJSONWriter(str(folder.joinpath(raw_name)))
+            if raw_name is not None
+            else None
+        )
+
+        # The latest update retrieved so the cache can be synced incrementally
+        state = {"high_water": None}
 
         def handle_batch(batch, is_finished):
+            if is_finished and raw_writer is not None:
+                raw_writer.finalize()
+                APICache._add_entry(
+                    raw_name,
+                    query,
+                    raw_context,
+                    high_water=state["high_water"],
+                    keep=[name],
+                )
+
+            if is_finished:
+                writer.finalize()
+                # Both files of the retrieval are kept when pruning
+                APICache._add_entry(
+                    name,
+                    query,
+                    context,
+                    high_water=state["high_water"],
+                    keep=[] if raw_name is None else [raw_name],
+                )
+
             if is_finished and not os.path.exists(filename):
                 return pd.DataFrame()
 
             if is_finished:
                 print(f'Loading data frame from "{filename}"')
-                return APICache.read_csv(filename)
+                return APICache.read(filename)
+
+            sources = [r["_source"] for r in batch]
+            state["high_water"] = _later(
+                state["high_water"], _last_updated(sources)
+            )
 
-            df = pd.DataFrame(map(lambda r: r["_source"], batch))
-            writer.write(transform(df))
+            if raw_writer is not None:
+                raw_writer.write(sources)
+
+            writer.write(transform(pd.DataFrame(sources)))
 
         return handle_batch
 
     @staticmethod
-    def write_agg(query: dict, agg: FhirAggregation):
-        folder = Path(DIR).expanduser()
+    def high_water_for_fhir_dsl(
+        query: dict, context: Optional[dict] = None
+    ) -> Optional[str]:
+        """The latest meta.lastUpdated in the cache of a query (if the cache
+        can be synced incrementally)
+        """
+        entry = Cache.entry(APICache.filename_for_fhir_dsl(query, context))
+
+        return None if entry is None else entry.get("high_water")
+
+    @staticmethod
+    def upsert_fhir_dsl(
+        query: dict,
+        sources: pd.DataFrame,
+        transform: Callable[[pd.DataFrame], pd.DataFrame],
+        context: Optional[dict] = None,
+        raw_context: Optional[dict] = None,
+    ) -> pd.DataFrame:
+        """Replace (or add) records in the cache of a query (and its raw hits
+        when `raw_context` is given) by id with resources updated since it
+        was written
+
+        Attributes
+        ----------
+        query : dict
+            The query that was cached
+
+        sources : pd.DataFrame
+            The updated resources (the raw `_source` of each hit)
+
+        transform : Callable[[pd.DataFrame], pd.DataFrame]
+            The transform the cached records went through
+        """
+        name = APICache.filename_for_fhir_dsl(query, context)
+        filename = str(Cache.folder().joinpath(name))
+
+        cached = APICache.read(filename)
+
+        if len(sources) == 0:
+            return cached
+
+        updated = transform(sources)
+        combined = pd.concat(
+            [cached[~cached["id"].isin(updated["id"])], updated],
+            ignore_index=True,
+            sort=False,
+        )
+
+        print(f'Updating {len(updated)} records in "{filename}"')
+
+        writer = (
+            ParquetWriter(filename)
+            if filename.endswith(".parquet")
+            else CSVWriter(filename)
+        )
+        writer.write(combined)
+        writer.finalize()
+
+        records = [_without_missing(r) for r in sources.to_dict("records")]
+        high_water = _later(
+            (Cache.entry(name) or {}).get("high_water"), _last_updated(records)
+        )
+
+        APICache._add_entry(name, query, context, high_water=high_water)
+
+        if raw_context is not None:
+            APICache._upsert_raw_fhir_dsl(
+                query, records, raw_context, high_water, keep=[name]
+            )
+
+        return APICache.read(filename)
+
+    @staticmethod
+    def _upsert_raw_fhir_dsl(
+        query: dict,
+        records: List[dict],
+        raw_context: dict,
+        high_water: Optional[str],
+        keep: Iterable[str] = (),
+    ):
+        name = APICache.filename_for_fhir_dsl(query, raw_context, raw=True)
+        filename = str(Cache.folder().joinpath(name))
+
+        if not os.path.exists(filename):
+            return
+
+        updated_ids = set(record.get("id") for record in records)
+
+        # Streamed into a new file so the raw hits are never loaded at once
+        writer = NDJSONWriter(filename)
+
+        for batch in NDJSONWriter.read_batches(filename):
+            writer.write(
+                [hit for hit in batch if hit.get("id") not in updated_ids]
+            )
+
+        writer.write(records)
+        writer.finalize()
+
+        APICache._add_entry(
+            name, query, raw_context, high_water=high_water, keep=keep
+        )
+
+    @staticmethod
+    def write_agg(
+        query: dict, agg: FhirAggregation, context: Optional[dict] = None
+    ):
+        folder = Cache.folder()
         folder.mkdir(parents=True, exist_ok=True)
 
-        filename = str(folder.joinpath(APICache.filename_for_fhir_dsl(query)))
+        name = APICache.filename_for_fhir_dsl(query, context)
+        filename = str(folder.joinpath(name))
 
         print(f'Writing aggregation to "{filename}"')
         with open(filename, "w") as file:
-            json.dump(agg.data, file, indent=2)
+            json_codec.dump(agg.data, file, indent=2)
+
+        APICache._add_entry(name, query, context)
+
+    @staticmethod
+    def key_for_api(request: dict, context: Optional[dict] = None) -> str:
+        """Hash of an API request (e.g. path, method, and params) and the
+        context (e.g. account, project, and environment) it is run in
+        """
+        return hashlib.sha256(
+            json.dumps(
+                {"request": request, "context": context or {}},
+                sort_keys=True,
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    @staticmethod
+    def filename_for_api(
+        kind: str, name: str, request: dict, context: Optional[dict] = None
+    ) -> str:
+        """Descriptive filename with hash of an API request for easy retrieval
+
+        Attributes
+        ----------
+        kind : str
+            The type of request (e.g. "paging_api" or "ga4gh")
+
+        name : str
+            What is requested (e.g. the API path or table)
+        """
+        description = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+        unique_hash = APICache.key_for_api(request, context)[0:8]
+
+        components = [kind, description, unique_hash]
+
+        return "_".join([c for c in components if len(c) > 0]) + ".json"
 
     @staticmethod
-    def read_csv(filename: str) -> pd.DataFrame:
-        df = pd.read_csv(filename)
+    def does_cache_for_api_exist(
+        kind: str, name: str, request: dict, context: Optional[dict] = None
+    ) -> bool:
+        "Whether an unexpired cache exists (recorded as a cache hit or miss)"
+        return Cache.lookup(
+            APICache.filename_for_api(kind, name, request, context),
+            key=APICache.key_for_api(request, context),
+        )
+
+    @staticmethod
+    def load_cache_for_api(
+        kind: str, name: str, request: dict, context: Optional[dict] = None
+    ):
+        "The cached results of an API request (as written by `write_api`)"
+        filename = str(
+            Cache.folder().joinpath(
+                APICache.filename_for_api(kind, name, request, context)
+            )
+        )
+        print(f'[CACHE] Loading from "{filename}"')
+
+        with open(filename, "r") as f:
+            return json_codec.load(f)
+
+    @staticmethod
+    def write_api(
+        kind: str,
+        name: str,
+        request: dict,
+        results,
+        context: Optional[dict] = None,
+        table: Optional[str] = None,
+        ttl: Optional[float] = API_TTL,
+    ):
+        """Cache the (JSON serializable) results of an API request
+
+        Attributes
+        ----------
+        table : str
+            The table or resource of the results (for invalidation)
+
+        ttl : float
+            Seconds the results may be used for (limited by `Cache.ttl`)
+        """
+        folder = Cache.folder()
+        folder.mkdir(parents=True, exist_ok=True)
+
+        filename = APICache.filename_for_api(kind, name, request, context)
+        path = folder.joinpath(filename)
+        partial_path = folder.joinpath(filename + ".partial")
+
+        print(f'Writing results to "{path}"')
+        with open(partial_path, "w") as file:
+            json_codec.dump(results, file)
+
+        # Moved into place so an interrupted write is never loaded
+        os.replace(partial_path, path)
+
+        context = context or {}
+
+        Cache.add(
+            filename,
+            table=table or name,
+            project_id=context.get("project_id"),
+            account=context.get("account"),
+            key=APICache.key_for_api(request, context),
+            ttl=ttl,
+        )
+
+    @staticmethod
+    def _add_entry(
+        name: str,
+        query: dict,
+        context: Optional[dict],
+        high_water: Optional[str] = None,
+        keep: Iterable[str] = (),
+    ):
+        context = context or {}
+
+        Cache.add(
+            name,
+            table=_table_name(query),
+            project_id=context.get("project_id"),
+            account=context.get("account"),
+            key=APICache.key_for_fhir_dsl(query, context),
+            metadata={"high_water": high_water},
+            keep=keep,
+        )
+
+    @staticmethod
+    def read(filename: str, columns: Optional[List[str]] = None):
+        "Read a cached data frame in the format given by its extension"
+        if filename.endswith(".parquet"):
+            return ParquetWriter.read(filename, columns=columns)
+
+        return APICache.read_csv(filename, columns=columns)
+
+    @staticmethod
+    def read_csv(
+        filename: str, columns: Optional[List[str]] = None
+    ) -> pd.DataFrame:
+        df = pd.read_csv(
+            filename,
+            usecols=None if columns is None else (lambda c: c in columns),
+        )
         min_count = max(min(int(len(df) / 3), 5), 1)
 
         # Columns are considered dates if enough examples of that format are found
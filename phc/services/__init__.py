@@ -2,13 +2,13 @@
 Contains services for accessing different parts of the PHC platform.
 """
 
-from phc.services.accounts import Accounts
+from phc.services.accounts import AsyncAccounts, Accounts
 from phc.services.analytics import Analytics
-from phc.services.fhir import Fhir
-from phc.services.projects import Projects
-from phc.services.files import Files
-from phc.services.cohorts import Cohorts
-from phc.services.genomics import Genomics
+from phc.services.fhir import AsyncFhir, Fhir
+from phc.services.projects import AsyncProjects, Projects
+from phc.services.files import AsyncFiles, Files
+from phc.services.cohorts import AsyncCohorts, Cohorts
+from phc.services.genomics import AsyncGenomics, Genomics
 
 
 __all__ = [
@@ -19,6 +19,12 @@ __all__ = [
     "Files",
     "Cohorts",
     "Genomics",
+    "AsyncAccounts",
+    "AsyncFhir",
+    "AsyncProjects",
+    "AsyncFiles",
+    "AsyncCohorts",
+    "AsyncGenomics",
 ]
 
 __pdoc__ = {
@@ -1,6 +1,6 @@
 """A Python Module for Accounts"""
 
-from phc.base_client import BaseClient
+from phc.base_client import AsyncBaseClient, BaseClient
 from phc import ApiResponse
 
 
@@ -28,3 +28,7 @@ class Accounts(BaseClient):
             The list accounts response
         """
         return self._api_call("accounts", http_verb="GET")
+
+
+class AsyncAccounts(AsyncBaseClient, Accounts):
+    """Provides acccess to PHC accounts with coroutines (see `Accounts`)"""
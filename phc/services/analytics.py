@@ -27,6 +27,9 @@ class Analytics(BaseClient):
         Operation timeout (default is 30)
     trust_env: bool
         Get proxies information from HTTP_PROXY / HTTPS_PROXY environment variables if the parameter is True (False by default)
+    share_pool: bool
+        Reuse the connection pool shared with other clients (True by default).
+        Use `close()` or a `with` block to release a pool that is not shared.
     """
 
     def execute_sql(
@@ -1,6 +1,6 @@
 """A Python Module for Cohorts"""
 
-from phc.base_client import BaseClient
+from phc.base_client import AsyncBaseClient, BaseClient
 from phc import ApiResponse
 from urllib.parse import urlencode
 
@@ -120,3 +120,13 @@ class Cohorts(BaseClient):
         return self._api_call(
             f"cohorts?{urlencode(query_dict)}", http_verb="GET"
         )
+
+
+class AsyncCohorts(AsyncBaseClient, Cohorts):
+    """Provides acccess to PHC cohorts with coroutines (see `Cohorts`)"""
+
+    async def delete(self, cohort_id: str) -> bool:
+        "Delete a cohort (see `Cohorts.delete`)"
+        return (
+            await self._api_call(f"cohorts/{cohort_id}", http_verb="DELETE")
+        ).status_code == 204
@@ -2,13 +2,17 @@
 
 import warnings
 
-from phc.base_client import BaseClient
+from phc.base_client import AsyncBaseClient, BaseClient
 from phc import ApiResponse
+from phc.util.retry_policy import IDEMPOTENT_METHODS, RetryPolicy
 
 
 class Fhir(BaseClient):
     """Provides bindings to the LifeOmic FHIR Service APIs"""
 
+    # Searches are sent as POSTs but only read data so they are safe to retry
+    retry_policy = RetryPolicy(idempotent_methods=[*IDEMPOTENT_METHODS, "POST"])
+
     def dsl(self, project: str, data: dict, scroll=""):
         """Executes a LifeOmic FHIR Service DSL request
 
@@ -127,3 +131,14 @@ class Fhir(BaseClient):
             json=query,
             params={"scroll": scroll},
         )
+
+
+class AsyncFhir(AsyncBaseClient, Fhir):
+    """Provides bindings to the LifeOmic FHIR Service APIs with coroutines
+    (see `Fhir`)
+
+    Examples
+    --------
+    >>> fhir = AsyncFhir(session)
+    >>> response = await fhir.dsl(project_id, query)
+    """
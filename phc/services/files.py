@@ -2,8 +2,9 @@
 
 import os
 import math
+import aiohttp
 import backoff
-from phc.base_client import BaseClient
+from phc.base_client import AsyncBaseClient, BaseClient
 from phc import ApiResponse
 from urllib.parse import urlencode
 from urllib.request import urlretrieve
@@ -23,6 +24,9 @@ class Files(BaseClient):
         Operation timeout (default is 30)
     trust_env: bool
         Get proxies information from HTTP_PROXY / HTTPS_PROXY environment variables if the parameter is True (False by default)
+    share_pool: bool
+        Reuse the connection pool shared with other clients (True by default).
+        Use `close()` or a `with` block to release a pool that is not shared.
     """
 
     _MULTIPART_MIN_SIZE = 5 * 1024 * 1024
@@ -284,3 +288,117 @@ class Files(BaseClient):
             if e.response.status_code == 404:
                 return False
             raise e
+
+
+class AsyncFiles(AsyncBaseClient, Files):
+    """Provides acccess to PHC files with coroutines (see `Files`)"""
+
+    _DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+    async def upload(
+        self,
+        project_id: str,
+        source: str,
+        file_name: str = None,
+        overwrite: bool = False,
+    ) -> ApiResponse:
+        "Upload a file (see `Files.upload`)"
+        file_size = os.path.getsize(source)
+        body = {
+            "name": file_name
+            if file_name is not None
+            else os.path.basename(source),
+            "datasetId": project_id,
+            "overwrite": overwrite,
+        }
+        upload_headers = {
+            "Authorization": None,
+            "LifeOmic-Account": None,
+            "Content-Type": None,
+        }
+
+        if file_size <= self._MULTIPART_MIN_SIZE:
+            res = await self._api_call("files", json=body)
+            await self._api_call_impl(
+                http_verb="PUT",
+                url=res.get("uploadUrl"),
+                api_path=None,
+                upload_file=source,
+                headers={**upload_headers, "Content-Length": str(file_size)},
+            )
+            return res
+
+        res = await self._api_call("uploads", json=body)
+        upload_id = res.get("uploadId")
+        part_size = max(
+            math.ceil(file_size / self._MAX_PARTS), self._MULTIPART_MIN_SIZE
+        )
+        total_parts = math.ceil(file_size / part_size)
+
+        for part in range(1, total_parts + 1):
+            start = (part - 1) * part_size
+            end = file_size if part == total_parts else start + part_size
+            with open(source, "rb") as f:
+                f.seek(start)
+                data = f.read(end - start)
+
+            part_res = await self._api_call(
+                f"uploads/{upload_id}/parts/{part}", http_verb="GET"
+            )
+            await self._api_call_impl(
+                http_verb="PUT",
+                url=part_res.get("uploadUrl"),
+                api_path=None,
+                upload_file=data,
+                headers={**upload_headers, "Content-Length": str(end - start)},
+            )
+            print(f"Upload {part}")
+
+        await self._api_call(f"uploads/{upload_id}", http_verb="DELETE")
+        return res
+
+    @backoff.on_exception(
+        backoff.expo, OSError, max_tries=6, jitter=backoff.full_jitter
+    )
+    async def download(self, file_id: str, dest_dir: str = os.getcwd()) -> str:
+        """Download a file (see `Files.download`)
+
+        The file is streamed to disk with the client's connection pool.
+        """
+        res = await self._api_call(
+            f"files/{file_id}?include=downloadUrl", http_verb="GET"
+        )
+
+        file_path = os.path.join(dest_dir, res.get("name"))
+        target_dir = os.path.dirname(file_path)
+        if not os.path.exists(target_dir):
+            os.makedirs(target_dir)
+
+        async with self._client_session().get(
+            res.get("downloadUrl"), timeout=aiohttp.ClientTimeout(total=None)
+        ) as download:
+            download.raise_for_status()
+
+            with open(file_path, "wb") as f:
+                async for chunk in download.content.iter_chunked(
+                    self._DOWNLOAD_CHUNK_SIZE
+                ):
+                    f.write(chunk)
+
+        return file_path
+
+    async def delete(self, file_id: str) -> bool:
+        "Delete a file (see `Files.delete`)"
+        return (
+            await self._api_call(f"files/{file_id}", http_verb="DELETE")
+        ).status_code == 204
+
+    async def exists(self, file_id: str) -> bool:
+        "Check if a file exists by id (see `Files.exists`)"
+        try:
+            await self._api_call(f"files/{file_id}", http_verb="GET")
+            return True
+        except ApiError as e:
+            if e.response.status_code == 404:
+                return False
+            raise e
@@ -1,7 +1,7 @@
 """A Python Module for Genomics"""
 
 from enum import Enum
-from phc.base_client import BaseClient
+from phc.base_client import AsyncBaseClient, BaseClient
 from phc import ApiResponse
 from urllib.parse import urlencode
 from datetime import datetime
@@ -301,3 +301,26 @@ class Genomics(BaseClient):
             ).status_code
             == 204
         )
+
+
+class AsyncGenomics(AsyncBaseClient, Genomics):
+    """Provides acccess to PHC genomic resources with coroutines (see
+    `Genomics`)
+    """
+
+    async def delete_set(self, set_type: Genomics.SetType, set_id: str) -> bool:
+        "Delete a genomic set (see `Genomics.delete_set`)"
+        return (
+            await self._ga4gh_call(
+                f"{set_type.value}/{set_id}", http_verb="DELETE"
+            )
+        ).status_code == 204
+
+    async def delete_test(self, project_id: str, test_id: str) -> bool:
+        "Delete a genomic test (see `Genomics.delete_test`)"
+        return (
+            await self._ga4gh_call(
+                f"genomics/projects/{project_id}/tests/{test_id}",
+                http_verb="DELETE",
+            )
+        ).status_code == 204
@@ -1,6 +1,6 @@
 """A Python Module for Projects"""
 
-from phc.base_client import BaseClient
+from phc.base_client import AsyncBaseClient, BaseClient
 from phc import ApiResponse
 from urllib.parse import urlencode
 
@@ -133,3 +133,26 @@ class Projects(BaseClient):
         return self._api_call(
             f"projects?{urlencode(query_dict)}", http_verb="GET"
         )
+
+
+class AsyncProjects(AsyncBaseClient, Projects):
+    """Provides acccess to PHC projects with coroutines (see `Projects`)"""
+
+    async def update(
+        self, project_id: str, name: str, description: str = None
+    ) -> ApiResponse:
+        "Update a project (see `Projects.update`)"
+        json_body = {"name": name}
+        if description:
+            json_body["description"] = description
+        return (
+            await self._api_call(
+                f"projects/{project_id}", json=json_body, http_verb="PATCH"
+            )
+        ).data
+
+    async def delete(self, project_id: str) -> bool:
+        "Delete a project (see `Projects.delete`)"
+        return (
+            await self._api_call(f"projects/{project_id}", http_verb="DELETE")
+        ).status_code == 204
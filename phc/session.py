@@ -3,6 +3,9 @@
 import os
 import jwt
 import time
+import asyncio
+import threading
+from typing import Awaitable, Callable
 
 
 class Session:
@@ -13,6 +16,7 @@ class Session:
         token: str = os.environ.get("PHC_ACCESS_TOKEN"),
         refresh_token: str = os.environ.get("PHC_REFRESH_TOKEN"),
         account: str = os.environ.get("PHC_ACCOUNT"),
+        refresh_margin: float = 60,
     ):
         """Initailizes a Session with token and account credentials.
 
@@ -24,6 +28,9 @@ class Session:
             The PHC refresh token, by default os.environ.get("PHC_REFRESH_TOKEN")
         account : str, required
             The PHC account ID, by default os.environ.get("PHC_ACCOUNT")
+        refresh_margin : float, optional
+            The number of seconds before expiration that the token is
+            refreshed (if there is a refresh token), by default 60
         """
         if not token or not account:
             raise ValueError("Must provide a value for both token and account")
@@ -31,28 +38,109 @@ class Session:
         self.token = token
         self.refresh_token = refresh_token
         self.account = account
+        self.refresh_margin = refresh_margin
+        self._refresh_lock = threading.RLock()
+        self._refreshing = False
+        self._refresh_future = None
+
+        iss = self._get_decoded_token().get("iss")
         env = (
             "dev"
-            if "cognito-idp.us-east-1.amazonaws.com"
-            in self._get_decoded_token().get("iss")
-            or "api.dev.lifeomic.com" in self._get_decoded_token().get("iss")
+            if "cognito-idp.us-east-1.amazonaws.com" in iss
+            or "api.dev.lifeomic.com" in iss
             else "us"
         )
         self.api_url = f"https://api.{env}.lifeomic.com/v1/"
         self.fhir_url = f"https://fhir.{env}.lifeomic.com/{account}/dstu3/"
         self.ga4gh_url = f"https://ga4gh.{env}.lifeomic.com/{account}/v1/"
 
+    @property
+    def token(self) -> str:
+        return self._token
+
+    @token.setter
+    def token(self, token: str):
+        # Claims are decoded lazily (once) for each new token value
+        self._token = token
+        self._claims = None
+
     def _get_decoded_token(self):
-        if self.token:
-            return jwt.decode(self.token, verify=False)
-        return {}
+        if not self.token:
+            return {}
+
+        if self._claims is None:
+            self._claims = jwt.decode(
+                self.token,
+                options={
+                    "verify_signature": False,
+                    "verify_exp": False,
+                    "verify_aud": False,
+                },
+            )
 
-    def is_expired(self) -> bool:
+        return self._claims
+
+    def is_expired(self, margin: float = 0) -> bool:
         """Determines if the current access token is expired
 
+        Parameters
+        ----------
+        margin : float, optional
+            Treat the token as expired this many seconds early, by default 0
+
         Returns
         -------
         bool
             True if there is no token or the token is expired, otherwise False
         """
-        return self._get_decoded_token().get("exp", 0) < time.time()
+        return self._get_decoded_token().get("exp", 0) - margin < time.time()
+
+    def refresh_if_expiring(self, refresh: Callable[[], str]):
+        """Replaces the token with the result of `refresh` if it expires
+        within the refresh margin
+
+        Only one refresh is performed at a time. Callers waiting on an
+        in-flight refresh use its token instead of refreshing again.
+
+        Parameters
+        ----------
+        refresh : Callable[[], str]
+            Requests and returns a new access token
+        """
+        if not self.refresh_token or not self.is_expired(self.refresh_margin):
+            return
+
+        with self._refresh_lock:
+            # Re-entrant calls (e.g. other requests on the same event loop)
+            # continue with the current token while the refresh is in flight
+            if self._refreshing or not self.is_expired(self.refresh_margin):
+                return
+
+            self._refreshing = True
+            try:
+                self.token = refresh()
+            finally:
+                self._refreshing = False
+
+    async def arefresh_if_expiring(self, refresh: Callable[[], Awaitable[str]]):
+        """Replaces the token with the result of the `refresh` coroutine if it
+        expires within the refresh margin
+
+        Concurrent callers await the same in-flight refresh.
+
+        Parameters
+        ----------
+        refresh : Callable[[], Awaitable[str]]
+            Requests and returns a new access token
+        """
+        if not self.refresh_token or not self.is_expired(self.refresh_margin):
+            return
+
+        if self._refresh_future is None or self._refresh_future.done():
+
+            async def replace_token():
+                self.token = await refresh()
+
+            self._refresh_future = asyncio.ensure_future(replace_token())
+
+        await asyncio.shield(self._refresh_future)
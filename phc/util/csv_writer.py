@@ -1,63 +1,86 @@
+import json
 import os
-from io import StringIO
+import shutil
+from typing import List
+
 import pandas as pd
 
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
 
 class CSVWriter:
     """Class for progressively writing batches of pandas data frames to a CSV
     file where additional columns may be added in subsequent writes
+
+    Batches are appended to a partial file in the order of a growing column
+    superset (tracked in a sidecar schema file). Since new columns are always
+    added to the end, earlier rows simply have fewer fields. The header is
+    written once when the writer is finalized (to a temporary file that then
+    atomically replaces the final file).
     """
 
     def __init__(self, filename: str):
         self.filename = filename
-        self.bak_filename = filename + ".bak"
-        self.batch_filename = filename + ".batch.bak"
+        self.partial_filename = filename + ".partial"
+        self.schema_filename = filename + ".schema.json"
+        self.tmp_filename = filename + ".tmp"
+
+        # Discard anything left over from an interrupted write
+        for leftover in [
+            self.partial_filename,
+            self.schema_filename,
+            self.tmp_filename,
+        ]:
+            if os.path.exists(leftover):
+                os.remove(leftover)
 
     def write(self, frame: pd.DataFrame):
-        """Write a data frame to an existing CSV file without loading the entire
-        file into memory
+        """Append a data frame to the partial CSV file without reading or
+        rewriting previous batches
         """
-        if not os.path.exists(self.filename):
-            frame.to_csv(
-                self.filename, date_format="%Y-%m-%dT%H:%M:%S%z", index=False
-            )
+        if len(frame.columns) == 0:
             return
 
-        self._copy_to_backup_file_without_header()
-
-        original_columns = self._columns()
+        original_columns = self.columns()
         new_columns = [c for c in frame.columns if c not in original_columns]
-        columns_not_in_this_batch = [
-            c for c in original_columns if c not in frame.columns
-        ]
+        ordered_columns = [*original_columns, *new_columns]
 
-        # Create frame with all columns (order doesn't matter here)
-        superset_frame = pd.concat(
-            [frame, pd.DataFrame(None, columns=columns_not_in_this_batch)]
+        if len(new_columns) > 0:
+            with open(self.schema_filename, "w") as f:
+                json.dump(ordered_columns, f)
+
+        frame.reindex(columns=ordered_columns).to_csv(
+            self.partial_filename,
+            mode="a",
+            header=False,
+            index=False,
+            date_format=DATE_FORMAT,
         )
 
-        # Create ordered list to select order of values when writing to the file
-        ordered_columns = [*original_columns, *new_columns]
+    def columns(self) -> List[str]:
+        "The superset of columns written so far"
+        if not os.path.exists(self.schema_filename):
+            return []
 
-        superset_frame[ordered_columns].to_csv(self.batch_filename, index=False)
+        with open(self.schema_filename, "r") as f:
+            return json.load(f)
 
-        self._finalize()
+    def finalize(self):
+        """Write the header and all batches to the final CSV file (in a single
+        pass)
 
-    def _columns(self):
-        with open(self.filename, "r") as f:
-            header = f.readline()
+        Readers of the final file see either the previous or the new contents
+        (never a partially copied file).
+        """
+        if not os.path.exists(self.partial_filename):
+            return
 
-        return pd.read_csv(StringIO(header)).columns.tolist()
+        with open(self.tmp_filename, "w") as f:
+            pd.DataFrame(columns=self.columns()).to_csv(f, index=False)
 
-    def _copy_to_backup_file_without_header(self):
-        os.system(f"sed 1,1d {self.filename} > {self.bak_filename}")
+            with open(self.partial_filename, "r") as partial:
+                shutil.copyfileobj(partial, f)
 
-    def _finalize(self):
-        os.system(
-            f"""
-          head -n 1 {self.batch_filename} > {self.filename} && \
-            cat {self.bak_filename} >> {self.filename} && \
-            sed 1,1d {self.batch_filename} >> {self.filename} && \
-            rm {self.batch_filename} {self.bak_filename}
-        """
-        )
+        os.replace(self.tmp_filename, self.filename)
+        os.remove(self.partial_filename)
+        os.remove(self.schema_filename)
@@ -0,0 +1,124 @@
+"""JSON encoding and decoding with the fastest available library
+
+orjson or ujson is used when installed (in that order) with the standard
+library `json` module as the fallback. Values the fast library cannot handle
+(e.g. non-default separators, unsupported types, or NaN and infinite floats,
+which orjson would write as null) fall back to the standard library so the
+decoded results never depend on which library is installed. Only whitespace
+may differ.
+"""
+
+import json as _json
+import math
+from typing import IO, Any, Optional, Union
+
+try:
+    import orjson as _orjson
+except ImportError:
+    _has_orjson = False
+else:
+    _has_orjson = True
+
+try:
+    import ujson as _ujson
+except ImportError:
+    _has_ujson = False
+else:
+    _has_ujson = True
+
+
+def backend() -> str:
+    "The name of the library used for encoding and decoding"
+    if _has_orjson:
+        return "orjson"
+
+    if _has_ujson:
+        return "ujson"
+
+    return "json"
+
+
+def loads(data: Union[bytes, bytearray, str]) -> Any:
+    "Decode JSON from a string or raw (UTF-8) bytes"
+    try:
+        if _has_orjson:
+            return _orjson.loads(data)
+
+        if _has_ujson:
+            return _ujson.loads(data)
+    except ValueError:
+        # E.g. NaN or Infinity written by the standard library
+        pass
+
+    return _json.loads(data)
+
+
+def _has_non_finite(value: Any) -> bool:
+    "Whether a value contains NaN or infinite floats"
+    if isinstance(value, float):
+        return not math.isfinite(value)
+
+    if isinstance(value, dict):
+        return any(_has_non_finite(v) for v in value.values())
+
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(v) for v in value)
+
+    return False
+
+
+def _orjson_dumps(value: Any, indent: Optional[int]) -> Optional[bytes]:
+    "Encode with orjson (or None if it cannot encode the value)"
+    if not _has_orjson or indent not in (None, 2):
+        return None
+
+    try:
+        encoded = _orjson.dumps(
+            value,
+            option=_orjson.OPT_NON_STR_KEYS
+            | (_orjson.OPT_INDENT_2 if indent == 2 else 0),
+        )
+    except TypeError:
+        return None
+
+    # orjson writes non-finite floats as null (only look for them if it did)
+    if b"null" in encoded and _has_non_finite(value):
+        return None
+
+    return encoded
+
+
+def dump_bytes(value: Any, indent: Optional[int] = None) -> bytes:
+    "Encode a value as UTF-8 JSON bytes (e.g. for a request body)"
+    encoded = _orjson_dumps(value, indent)
+    if encoded is not None:
+        return encoded
+
+    return dumps(value, indent=indent).encode("utf-8")
+
+
+def dumps(value: Any, indent: Optional[int] = None) -> str:
+    "Encode a value as a JSON string"
+    encoded = _orjson_dumps(value, indent)
+    if encoded is not None:
+        return encoded.decode("utf-8")
+
+    if _has_ujson:
+        try:
+            return _ujson.dumps(
+                value, indent=indent or 0, escape_forward_slashes=False
+            )
+        except (TypeError, OverflowError):
+            pass
+
+    return _json.dumps(value, indent=indent)
+
+
+def load(file: IO) -> Any:
+    "Decode JSON from an open file"
+    return loads(file.read())
+
+
+def dump(value: Any, file: IO, indent: Optional[int] = None):
+    "Encode a value as JSON into an open (text) file"
+    file.write(dumps(value, indent=indent))
@@ -0,0 +1,66 @@
+import gzip
+import os
+from typing import Generator, Iterable, List
+
+from phc.util import json_codec
+
+
+class NDJSONWriter:
+    """Class for progressively writing batches of records to a gzip
+    compressed newline delimited JSON file
+
+    Each batch is appended to a partial file as its own gzip member (so
+    earlier batches are never rewritten) and the file is moved into place when
+    the writer is finalized.
+    """
+
+    def __init__(self, filename: str, compresslevel: int = 5):
+        self.filename = filename
+        self.partial_filename = filename + ".partial"
+        self.compresslevel = compresslevel
+
+        # Discard anything left over from an interrupted write
+        if os.path.exists(self.partial_filename):
+            os.remove(self.partial_filename)
+
+    def write(self, records: Iterable[dict]):
+        "Append records to the partial file"
+        lines = b"".join(
+            json_codec.dump_bytes(record) + b"\n" for record in records
+        )
+
+        if len(lines) == 0:
+            return
+
+        with gzip.open(
+            self.partial_filename, "ab", compresslevel=self.compresslevel
+        ) as f:
+            f.write(lines)
+
+    def finalize(self):
+        "Move the written records into place"
+        if not os.path.exists(self.partial_filename):
+            return
+
+        os.replace(self.partial_filename, self.filename)
+
+    @staticmethod
+    def read_batches(
+        filename: str, batch_size: int = 10000
+    ) -> Generator[List[dict], None, None]:
+        "Read the records in batches (without loading the whole file)"
+        batch = []
+
+        with gzip.open(filename, "rb") as f:
+            for line in f:
+                if len(line.strip()) == 0:
+                    continue
+
+                batch.append(json_codec.loads(line))
+
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+        if len(batch) > 0:
+            yield batch
@@ -0,0 +1,131 @@
+import glob
+import json
+import math
+import os
+import shutil
+from typing import List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as _pa
+    import pyarrow.parquet as _pq
+except ImportError:
+    _has_pyarrow = False
+else:
+    _has_pyarrow = True
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _stringify_object_columns(frame: pd.DataFrame):
+    "Serialize nested or mixed values that Arrow cannot infer a type for"
+
+    def stringify(value):
+        if _is_missing(value) or isinstance(value, str):
+            return value
+
+        return json.dumps(value, default=str)
+
+    frame = frame.copy()
+    for column in frame.columns[frame.dtypes == object]:
+        frame[column] = frame[column].map(stringify)
+
+    return frame
+
+
+class ParquetWriter:
+    """Class for progressively writing batches of pandas data frames to a
+    directory of Parquet files (one per batch) where additional columns may be
+    added in subsequent writes
+
+    Parts are written to a partial directory that is moved into place when the
+    writer is finalized.
+    """
+
+    PART_PATTERN = "part-*.parquet"
+
+    def __init__(self, dirname: str):
+        if not _has_pyarrow:
+            raise ImportError("pyarrow is required")
+
+        self.dirname = dirname
+        self.partial_dirname = dirname + ".partial"
+        self.tmp_dirname = dirname + ".tmp"
+        self._part = 0
+
+        # Discard anything left over from an interrupted write
+        shutil.rmtree(self.partial_dirname, ignore_errors=True)
+        shutil.rmtree(self.tmp_dirname, ignore_errors=True)
+
+    def write(self, frame: pd.DataFrame):
+        "Write a data frame as a new part without touching existing parts"
+        os.makedirs(self.partial_dirname, exist_ok=True)
+
+        try:
+            table = _pa.Table.from_pandas(frame, preserve_index=False)
+        except (
+            _pa.ArrowInvalid,
+            _pa.ArrowTypeError,
+            _pa.ArrowNotImplementedError,
+        ):
+            table = _pa.Table.from_pandas(
+                _stringify_object_columns(frame), preserve_index=False
+            )
+
+        _pq.write_table(
+            table,
+            os.path.join(
+                self.partial_dirname, f"part-{self._part:05d}.parquet"
+            ),
+        )
+        self._part += 1
+
+    def finalize(self):
+        """Move the written parts into place
+
+        A previous directory is renamed aside (rather than deleted part by
+        part) so readers never see a mix of old and new parts.
+        """
+        if not os.path.exists(self.partial_dirname):
+            return
+
+        if os.path.exists(self.dirname):
+            os.rename(self.dirname, self.tmp_dirname)
+
+        os.rename(self.partial_dirname, self.dirname)
+        shutil.rmtree(self.tmp_dirname, ignore_errors=True)
+
+    @staticmethod
+    def _part_paths(dirname: str) -> List[str]:
+        return sorted(
+            glob.glob(os.path.join(dirname, ParquetWriter.PART_PATTERN))
+        )
+
+    @staticmethod
+    def read(dirname: str, columns: Optional[List[str]] = None):
+        """Read all parts into a single data frame, only loading the given
+        columns (if specified)
+        """
+        if not _has_pyarrow:
+            raise ImportError("pyarrow is required")
+
+        frames = []
+        for path in ParquetWriter._part_paths(dirname):
+            names = _pq.read_schema(path).names
+            selected = (
+                names if columns is None else [c for c in columns if c in names]
+            )
+            frames.append(_pq.read_table(path, columns=selected).to_pandas())
+
+        if len(frames) == 0:
+            return pd.DataFrame(columns=columns)
+
+        frame = pd.concat(frames, ignore_index=True, sort=False)
+
+        if columns is None:
+            return frame
+
+        return frame[[c for c in columns if c in frame.columns]]
@@ -0,0 +1,248 @@
+"""Process-wide request throttling shared by all API clients
+
+Each host (e.g. the api, fhir, and ga4gh URLs of a `phc.Session`) has one
+`HostLimiter` that every client, thread, and event loop shares. A limiter
+combines an optional token bucket (requests per second) with an adaptive
+concurrency limit that is increased additively while requests succeed and
+halved when the server signals overload (429s, 5xx errors, connection
+failures, or latency above an optional target).
+
+Examples
+--------
+>>> from phc.util import rate_limiter
+>>> rate_limiter.configure_host_limits(
+        session.fhir_url, rate=20, max_concurrency=32
+    )
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Thread-safe token bucket that hands out delays instead of blocking
+
+    Parameters
+    ----------
+    rate : float
+        The number of tokens added per second
+    burst : int
+        The maximum number of tokens that can accumulate
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        "Take a token and return the seconds to wait before using it"
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+
+            return 0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class HostLimiter:
+    """Throttle for the requests sent to a single host
+
+    Parameters
+    ----------
+    rate : float, optional
+        Maximum requests per second (no limit by default)
+    burst : int, optional
+        Requests allowed at once before `rate` applies (defaults to `rate`)
+    initial_concurrency : int
+        The starting number of requests allowed in flight (default is 32)
+    min_concurrency : int
+        The lowest the concurrency limit can be reduced to (default is 1)
+    max_concurrency : int
+        The highest the concurrency limit can grow to (default is 100)
+    latency_target : float, optional
+        Seconds after which a successful response still counts as a sign of
+        overload (latency is ignored by default)
+    decrease_interval : float
+        Minimum seconds between decreases so a burst of failures from
+        requests that were already in flight only halves the limit once
+        (default is 1)
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        initial_concurrency: int = 32,
+        min_concurrency: int = 1,
+        max_concurrency: int = 100,
+        latency_target: Optional[float] = None,
+        decrease_interval: float = 1,
+    ):
+        self.bucket = (
+            TokenBucket(rate, burst or max(1, int(rate)))
+            if rate is not None
+            else None
+        )
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.decrease_interval = decrease_interval
+        self._limit = float(
+            min(max(initial_concurrency, min_concurrency), max_concurrency)
+        )
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        "The current number of requests allowed in flight"
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def acquire(self):
+        "Wait for a request slot (and a token if rate limited)"
+        if self.bucket is not None:
+            delay = self.bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        loop = asyncio.get_event_loop()
+
+        with self._lock:
+            if not self._waiters and self._in_flight < self.limit:
+                self._in_flight += 1
+                return
+
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    waiter = None
+
+            # The slot was granted just before cancellation
+            if (
+                waiter is not None
+                and waiter[1].done()
+                and not waiter[1].cancelled()
+            ):
+                self._release_slot()
+
+            raise
+
+    def release(self, status: Optional[int], latency: float):
+        """Release a request slot and adapt the concurrency limit
+
+        Parameters
+        ----------
+        status : int, optional
+            The response status code (None if the request failed to complete)
+        latency : float
+            The seconds the request took
+        """
+        overloaded = (
+            status is None
+            or status == 429
+            or status >= 500
+            or (
+                self.latency_target is not None
+                and latency > self.latency_target
+            )
+        )
+
+        with self._lock:
+            now = time.monotonic()
+
+            if overloaded:
+                if now - self._last_decrease >= self.decrease_interval:
+                    self._limit = max(self.min_concurrency, self._limit / 2)
+                    self._last_decrease = now
+            else:
+                self._limit = min(
+                    self.max_concurrency, self._limit + 1 / self._limit
+                )
+
+        self._release_slot()
+
+    def discard(self):
+        "Release a request slot without adapting the limit (e.g. cancelled)"
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_flight -= 1
+
+            while self._waiters and self._in_flight < self.limit:
+                loop, future = self._waiters.popleft()
+
+                try:
+                    loop.call_soon_threadsafe(self._grant, future)
+                except RuntimeError:
+                    # The waiter's event loop has been closed
+                    continue
+
+                self._in_flight += 1
+
+    def _grant(self, future: asyncio.Future):
+        if future.cancelled():
+            # Waiter gave up after its slot was handed over
+            self._release_slot()
+        else:
+            future.set_result(None)
+
+
+_limiters: Dict[str, HostLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _host(url: str) -> str:
+    return urlparse(url).netloc or url
+
+
+def configure_host_limits(url: str, **kwargs) -> HostLimiter:
+    """Replace the limiter for the host of `url` (see `HostLimiter` for
+    arguments)
+    """
+    limiter = HostLimiter(**kwargs)
+
+    with _limiters_lock:
+        _limiters[_host(url)] = limiter
+
+    return limiter
+
+
+def host_limiter(url: str) -> HostLimiter:
+    "The shared limiter for the host of `url` (created with defaults)"
+    host = _host(url)
+
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = HostLimiter()
+
+        return limiter
+
+
+def reset_host_limits():
+    "Discard all configured limiters"
+    with _limiters_lock:
+        _limiters.clear()
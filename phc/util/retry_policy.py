@@ -0,0 +1,153 @@
+"""Retry decisions for API requests
+
+A `RetryPolicy` decides whether (and after how long) a failed request is
+retried based on the response status, the HTTP method, any `Retry-After`
+header, and the total time already spent on the operation.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterable, Optional
+
+import aiohttp
+
+from phc.errors import ApiError
+
+# Statuses where the server did not process the request (safe for any method)
+REJECTED_STATUS_CODES = frozenset([429, 503])
+
+# Statuses where the request may or may not have been processed
+TRANSIENT_STATUS_CODES = frozenset([408, 500, 502, 504])
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+
+def _retry_after(err: Exception) -> Optional[float]:
+    "Seconds requested by a Retry-After header (if any)"
+    if not isinstance(err, ApiError):
+        return None
+
+    value = (err.response.headers or {}).get("Retry-After")
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Decides which failed requests are retried and when
+
+    Parameters
+    ----------
+    max_tries : int
+        The maximum number of attempts (including the first) (default is 3)
+    base_delay : float
+        The upper bound in seconds of the first (jittered) backoff delay,
+        which doubles on every retry (default is 1)
+    max_delay : float
+        The upper bound in seconds of any backoff delay (default is 30)
+    max_elapsed : float
+        The retry budget in seconds for an operation. A retry that would
+        start after this much time has passed is not attempted (default is 60)
+    idempotent_methods : Iterable[str]
+        Methods that are retried for transient errors (e.g. 500s or timeouts)
+        where the server may have already processed the request. Requests
+        with other methods are only retried when the server rejected them
+        (429 or 503) or the connection could not be made.
+    """
+
+    def __init__(
+        self,
+        max_tries: int = 3,
+        base_delay: float = 1,
+        max_delay: float = 30,
+        max_elapsed: float = 60,
+        idempotent_methods: Iterable[str] = IDEMPOTENT_METHODS,
+    ):
+        self.max_tries = max_tries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+        self.idempotent_methods = frozenset(
+            method.upper() for method in idempotent_methods
+        )
+        self._stats = {"attempts": 0, "retries": 0, "exhausted": 0}
+        self._lock = threading.Lock()
+
+    def is_retryable(self, http_verb: str, err: Exception) -> bool:
+        "Whether the error can be retried for the given method"
+        idempotent = http_verb.upper() in self.idempotent_methods
+
+        if isinstance(err, ApiError):
+            status = err.response.status_code
+
+            return status in REJECTED_STATUS_CODES or (
+                idempotent and status in TRANSIENT_STATUS_CODES
+            )
+
+        # The request was never sent if the connection could not be made
+        if isinstance(
+            err, (ConnectionRefusedError, aiohttp.ClientConnectorError)
+        ):
+            return True
+
+        return idempotent and isinstance(err, (OSError, asyncio.TimeoutError))
+
+    def retry_delay(
+        self, http_verb: str, err: Exception, tries: int, elapsed: float
+    ) -> Optional[float]:
+        """The seconds to wait before retrying (or None to give up)
+
+        Parameters
+        ----------
+        http_verb : str
+            The request method
+        err : Exception
+            The error from the latest attempt
+        tries : int
+            The number of attempts made so far
+        elapsed : float
+            The seconds spent on the operation so far
+        """
+        if tries >= self.max_tries or not self.is_retryable(http_verb, err):
+            return None
+
+        delay = random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (tries - 1))
+        )
+
+        retry_after = _retry_after(err)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        if elapsed + delay > self.max_elapsed:
+            return None
+
+        return delay
+
+    def record(self, tries: int, succeeded: bool):
+        "Record the outcome of an operation that took `tries` attempts"
+        with self._lock:
+            self._stats["attempts"] += tries
+            self._stats["retries"] += tries - 1
+
+            if not succeeded and tries > 1:
+                self._stats["exhausted"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Counts of attempts, retries, and operations that failed after
+        retrying
+        """
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,79 @@
+import asyncio
+import gzip
+import json
+import time
+
+import jwt
+
+from phc import Session
+from phc.base_client import BaseClient
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+def test_clients_share_pool_on_same_loop():
+    async def get_sessions():
+        return (
+            BaseClient("session")._client_session(),
+            BaseClient("session")._client_session(),
+            BaseClient("session", connector_limit=5)._client_session(),
+        )
+
+    first, second, third = run(get_sessions())
+
+    assert first is second
+    assert first is not third
+    assert third.connector.limit == 5
+
+
+def test_client_owned_pool_is_closed():
+    loop = asyncio.new_event_loop()
+    client = BaseClient("session", share_pool=False)
+
+    async def get_session():
+        return client._client_session()
+
+    session = loop.run_until_complete(get_session())
+    assert loop.run_until_complete(get_session()) is session
+
+    with client:
+        pass
+
+    assert session.closed
+    assert client._client_session_ptr is None
+
+
+def build_session():
+    token = jwt.encode(
+        {"exp": time.time() + 3600, "iss": "https://api.us.lifeomic.com"},
+        "a-test-key-that-is-long-enough-for-hs256",
+        algorithm="HS256",
+    )
+
+    return Session(token=token, account="account")
+
+
+def test_large_json_bodies_are_compressed():
+    client = BaseClient(build_session(), request_compression_threshold=100)
+    body = {"ids": [str(i) for i in range(100)]}
+
+    req_args = client._build_request("http://localhost/", "dsl", json=body)[
+        "req_args"
+    ]
+
+    assert req_args["headers"]["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(req_args["data"])) == body
+
+
+def test_small_json_bodies_are_not_compressed():
+    client = BaseClient(build_session(), request_compression_threshold=100)
+
+    req_args = client._build_request(
+        "http://localhost/", "dsl", json={"id": "1"}
+    )["req_args"]
+
+    assert "Content-Encoding" not in req_args["headers"]
+    assert req_args["headers"]["Accept-Encoding"] == "gzip, deflate"
+    assert json.loads(req_args["data"]) == {"id": "1"}
@@ -0,0 +1,220 @@
+import time
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from funcy import identity
+
+from phc.easy import cache
+from phc.easy.cache import Cache
+from phc.easy.util import api_cache
+from phc.easy.util.api_cache import APICache
+
+
+@pytest.fixture(autouse=True)
+def temp_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, "DIR", str(tmp_path))
+    monkeypatch.setattr(Cache, "max_bytes", None)
+    monkeypatch.setattr(Cache, "ttl", None)
+
+
+def write(filename: str, size: int, table: str = "observation"):
+    Path(cache.DIR).joinpath(filename).write_bytes(b"x" * size)
+    Cache.add(filename, table=table, project_id="project")
+
+
+def test_least_recently_used_entries_are_evicted(monkeypatch):
+    monkeypatch.setattr(Cache, "max_bytes", 250)
+    monkeypatch.setattr(cache, "ACCESS_RESOLUTION", 0)
+
+    write("a.csv", 100)
+    write("b.csv", 100)
+    time.sleep(0.01)
+    assert Cache.lookup("a.csv")
+
+    write("c.csv", 100)
+
+    assert Cache.lookup("a.csv")
+    assert not Cache.lookup("b.csv")
+    assert Cache.lookup("c.csv")
+    assert Cache.stats()["bytes"] == 200
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    monkeypatch.setattr(Cache, "ttl", -1)
+
+    write("a.csv", 10)
+
+    assert not Cache.lookup("a.csv")
+    assert not Path(cache.DIR).joinpath("a.csv").exists()
+
+
+def test_invalidate_by_table():
+
+    write("a.csv", 10, table="observation")
+    write("b.csv", 10, table="condition")
+
+    assert Cache.invalidate(table="observation") == 1
+    assert Cache.entries().filename.tolist() == ["b.csv"]
+
+
+def test_untracked_files_are_adopted():
+    Path(cache.DIR).joinpath("old.csv").write_bytes(b"x" * 10)
+    Path(cache.DIR).joinpath("new.csv.partial").write_bytes(b"x" * 10)
+
+    assert Cache.stats()["entries"] == 1
+    assert Cache.clear() == 1
+
+
+def test_upsert_replaces_updated_records():
+    query = {"type": "select", "columns": "*", "from": [{"table": "goal"}]}
+
+    def resource(id, status, last_updated):
+        return {
+            "id": id,
+            "status": status,
+            "meta": {"lastUpdated": last_updated},
+        }
+
+    callback = APICache.build_cache_fhir_dsl_callback(query, identity)
+    callback(
+        [
+            {"_source": resource("a", "proposed", "2021-01-01T00:00:00Z")},
+            {"_source": resource("b", "proposed", "2021-02-01T00:00:00Z")},
+        ],
+        False,
+    )
+    callback([], True)
+
+    assert (
+        APICache.high_water_for_fhir_dsl(query) == "2021-02-01T00:00:00+00:00"
+    )
+
+    df = APICache.upsert_fhir_dsl(
+        query,
+        pd.DataFrame(
+            [
+                resource("b", "accepted", "2021-03-01T00:00:00Z"),
+                resource("c", "proposed", "2021-03-02T00:00:00Z"),
+            ]
+        ),
+        identity,
+    )
+
+    assert df.sort_values("id").status.tolist() == [
+        "proposed",
+        "accepted",
+        "proposed",
+    ]
+    assert (
+        APICache.high_water_for_fhir_dsl(query) == "2021-03-02T00:00:00+00:00"
+    )
+
+
+def test_api_results_are_cached_per_request_and_context():
+    request = {"path": "genomics/projects/:project_id/variants", "params": {}}
+    context = {"account": "account", "project_id": "project"}
+
+    APICache.write_api(
+        "paging_api", request["path"], request, [{"id": "a"}], context
+    )
+
+    assert APICache.does_cache_for_api_exist(
+        "paging_api", request["path"], request, context
+    )
+    assert APICache.load_cache_for_api(
+        "paging_api", request["path"], request, context
+    ) == [{"id": "a"}]
+    assert not APICache.does_cache_for_api_exist(
+        "paging_api",
+        request["path"],
+        request,
+        {**context, "project_id": "other"},
+    )
+    assert Cache.invalidate(table="genomics/projects/:project_id/variants") == 1
+
+
+def test_api_results_expire_after_their_ttl(monkeypatch):
+    monkeypatch.setattr(Cache, "ttl", 7 * 24 * 60 * 60)
+    request = {"path": "genomics/projects/:project_id/variants", "params": {}}
+
+    APICache.write_api("paging_api", request["path"], request, [])
+    name = APICache.filename_for_api("paging_api", request["path"], request)
+    entry = Cache.entry(name)
+
+    assert entry["expires"] == entry["created"] + api_cache.API_TTL
+
+    APICache.write_api("paging_api", request["path"], request, [], ttl=-1)
+
+    assert not APICache.does_cache_for_api_exist(
+        "paging_api", request["path"], request
+    )
+
+
+def test_raw_hits_are_expanded_again_when_the_transform_changes(monkeypatch):
+    monkeypatch.setattr(APICache, "store_raw", True)
+    query = {"type": "select", "columns": "*", "from": [{"table": "goal"}]}
+    raw_context = {"account": "account", "project_id": "project"}
+
+    def upper(df):
+        return df.assign(status=df.status.str.upper())
+
+    callback = APICache.build_cache_fhir_dsl_callback(
+        query, identity, {**raw_context, "transform": "1"}, raw_context
+    )
+    callback([{"_source": {"id": "a", "status": "proposed"}}], False)
+    callback([], True)
+
+    context = {**raw_context, "transform": "2"}
+
+    assert not APICache.does_cache_for_fhir_dsl_exist(query, context)
+    assert APICache.does_raw_cache_for_fhir_dsl_exist(query, raw_context)
+
+    df = APICache.expand_raw_cache_for_fhir_dsl(
+        query, upper, context, raw_context
+    )
+
+    assert df.status.tolist() == ["PROPOSED"]
+    assert APICache.does_cache_for_fhir_dsl_exist(query, context)
+
+
+def test_both_files_of_a_retrieval_are_kept_when_pruning(monkeypatch):
+    monkeypatch.setattr(APICache, "store_raw", True)
+    monkeypatch.setattr(Cache, "max_bytes", 2000)
+    query = {"type": "select", "columns": "*", "from": [{"table": "goal"}]}
+    raw_context = {"account": "account"}
+
+    callback = APICache.build_cache_fhir_dsl_callback(
+        query, identity, {**raw_context, "transform": "1"}, raw_context
+    )
+    callback(
+        [
+            {"_source": {"id": str(i), "status": "proposed" * 10}}
+            for i in range(100)
+        ],
+        False,
+    )
+
+    assert len(callback([], True)) == 100
+    assert len(Cache.entries()) == 2
+
+
+def test_configure_only_changes_given_settings():
+    Cache.configure(max_bytes=100, ttl=60)
+    Cache.configure(ttl=120)
+
+    assert Cache.max_bytes == 100
+    assert Cache.ttl == 120
+
+
+def test_hits_only_record_use_after_access_resolution(monkeypatch):
+    write("a.csv", 10)
+    accessed = Cache.entry("a.csv")["accessed"]
+
+    assert Cache.lookup("a.csv")
+    assert Cache.entry("a.csv")["accessed"] == accessed
+
+    monkeypatch.setattr(cache, "ACCESS_RESOLUTION", 0)
+
+    assert Cache.lookup("a.csv")
+    assert Cache.entry("a.csv")["accessed"] > accessed
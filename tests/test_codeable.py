@@ -167,3 +167,20 @@ def test_not_creating_extraneous_columns():
     frame = pd.DataFrame([{"a": "value"}, {"b": math.nan}])
 
     assert len(Codeable.expand_column(frame.b).columns) == 0
+
+
+def test_expand_column_with_repeated_and_missing_values():
+    coding = {"system": "http://loinc.org", "code": "1234-5"}
+
+    frame = Codeable.expand_column(
+        pd.Series([coding, math.nan, {**coding, "display": "Test"}, coding])
+    )
+
+    assert frame.columns.tolist() == [
+        "system__loinc.org__code",
+        "system__loinc.org__display",
+    ]
+    assert frame["system__loinc.org__code"].tolist()[2:] == ["1234-5"] * 2
+    assert math.isnan(frame.at[1, "system__loinc.org__code"])
+    assert frame.at[2, "system__loinc.org__display"] == "Test"
+    assert math.isnan(frame.at[3, "system__loinc.org__display"])
@@ -32,6 +32,7 @@ def test_writing_batches():
 
     writer.write(first_batch)
     writer.write(second_batch)
+    writer.finalize()
 
     frame = pd.read_csv("/tmp/sample.csv")
 
@@ -54,3 +55,40 @@ def test_writing_batches():
         ],
         is_nan(frame.values),
     ).all()
+
+
+def test_writing_to_path_with_spaces():
+    filename = "/tmp/sample with spaces.csv"
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    writer = CSVWriter(filename)
+    writer.write(pd.DataFrame([{"id": "a"}]))
+
+    # Nothing is written to the final file until finalized
+    assert not os.path.exists(filename)
+
+    writer.write(pd.DataFrame([{"id": "b", "status": "final"}]))
+    writer.finalize()
+
+    frame = pd.read_csv(filename)
+
+    assert frame.columns.tolist() == ["id", "status"]
+    assert frame.id.tolist() == ["a", "b"]
+    assert not os.path.exists(filename + ".partial")
+
+
+def test_finalize_replaces_existing_file_atomically():
+    setup()
+    pd.DataFrame([{"id": "old"}]).to_csv("/tmp/sample.csv", index=False)
+
+    with open("/tmp/sample.csv", "r") as reader:
+        writer = CSVWriter("/tmp/sample.csv")
+        writer.write(pd.DataFrame([{"id": "new"}]))
+        writer.finalize()
+
+        # An open reader keeps the previous file instead of a truncated one
+        assert reader.read() == "id\nold\n"
+
+    assert pd.read_csv("/tmp/sample.csv").id.tolist() == ["new"]
+    assert not os.path.exists("/tmp/sample.csv.tmp")
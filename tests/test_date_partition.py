@@ -0,0 +1,43 @@
+import pandas as pd
+
+from phc.easy.query.date_partition import partition_date_range
+
+DATES = [
+    pd.Timestamp("2021-01-01") + pd.Timedelta(hours=i * i) for i in range(40)
+]
+
+
+def count(since, until):
+    return len(
+        [d for d in DATES if d >= since and (until is None or d < until)]
+    )
+
+
+def test_windows_cover_range_in_order_with_similar_counts():
+    windows = partition_date_range(count, "2021-01-01", "2021-04-01", 4)
+
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+    assert sum(count(since, until) for since, until in windows) == len(DATES)
+    assert all(count(since, until) <= 10 for since, until in windows)
+
+
+def test_last_window_is_open_without_until():
+    windows = partition_date_range(count, "2021-01-01", None, 2)
+
+    assert windows[0][0] == pd.Timestamp("2021-01-01")
+    assert windows[-1][1] is None
+    assert sum(count(since, until) for since, until in windows) == len(DATES)
+
+
+def test_open_range_ends_at_utc_now_for_naive_dates():
+    ends = []
+
+    def record_end(since, until):
+        ends.append(until)
+        return 0
+
+    partition_date_range(record_end, "2021-01-01", None, 2)
+    utc_now = pd.Timestamp.now(tz="UTC").tz_localize(None)
+
+    assert ends[0].tz is None
+    assert abs(utc_now - ends[0]) < pd.Timedelta(minutes=1)
@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import jwt
+import pytest
+
+from phc.easy.auth import Auth
+from phc.easy.query.fhir_dsl import execute_sliced_fhir_dsl
+from phc.easy.query.fhir_dsl_query import build_query, get_limit
+from phc.services import Fhir
+
+PAGES_PER_SLICE = 2
+
+
+class FakeResponse:
+    def __init__(self, data: dict):
+        self.data = data
+        self.size = 0
+
+
+def build_auth():
+    token = jwt.encode(
+        {"exp": time.time() + 3600, "iss": "https://api.us.lifeomic.com"},
+        "a-test-key-that-is-long-enough-for-hs256",
+        algorithm="HS256",
+    )
+
+    return Auth({"token": token, "account": "account", "project_id": "p"})
+
+
+class FakeDSL:
+    "Slices of PAGES_PER_SLICE pages with one hit each"
+
+    def __init__(self):
+        self.requests = []
+        # Pages (slice id and scroll id) that fail once
+        self.failures = []
+
+
+@pytest.fixture
+def fake_dsl(monkeypatch):
+    fake = FakeDSL()
+    requests = fake.requests
+    failures = fake.failures
+
+    async def dsl(self, project, data, scroll=""):
+        slice_id = data["slice"]["id"]
+        requests.append({"query": data, "scroll": scroll})
+        # Let the other slices run as if waiting on the network
+        await asyncio.sleep(0)
+
+        if (slice_id, scroll) in failures:
+            failures.remove((slice_id, scroll))
+            raise Exception("Internal server error")
+
+        page = 0 if scroll == "true" else int(scroll.split(":")[1]) + 1
+        hits = [{"_id": f"{slice_id}-{page}"}] if page < PAGES_PER_SLICE else []
+
+        return FakeResponse(
+            {
+                "hits": {"hits": hits, "total": {"value": 1000}},
+                "_scroll_id": f"{slice_id}:{page}",
+            }
+        )
+
+    monkeypatch.setattr(Fhir, "dsl", dsl)
+
+    return fake
+
+
+def _query():
+    return build_query(
+        {"type": "select", "columns": "*", "from": [{"table": "patient"}]},
+        page_size=100,
+    )
+
+
+def test_slices_are_requested_and_merged(fake_dsl):
+    hits = execute_sliced_fhir_dsl(_query(), 3, auth_args=build_auth())
+
+    assert sorted(hit["_id"] for hit in hits) == [
+        f"{slice_id}-{page}"
+        for slice_id in range(3)
+        for page in range(PAGES_PER_SLICE)
+    ]
+    assert sorted(
+        set(r["query"]["slice"]["id"] for r in fake_dsl.requests)
+    ) == [0, 1, 2]
+    assert all(r["query"]["slice"]["max"] == 3 for r in fake_dsl.requests)
+
+
+def test_max_pages_is_shared_by_slices(fake_dsl):
+    hits = execute_sliced_fhir_dsl(
+        _query(), 2, auth_args=build_auth(), max_pages=3
+    )
+
+    assert len(fake_dsl.requests) == 3
+    assert len(hits) == 3
+
+
+def test_failed_pages_are_retried_with_smaller_limit(fake_dsl):
+    fake_dsl.failures.append((1, "1:0"))
+
+    hits = execute_sliced_fhir_dsl(_query(), 2, auth_args=build_auth())
+
+    assert len(hits) == 2 * PAGES_PER_SLICE
+
+    slice_requests = [
+        r for r in fake_dsl.requests if r["query"]["slice"]["id"] == 1
+    ]
+    failed = [r["scroll"] for r in slice_requests].index("1:0")
+
+    # The smaller limit is kept for the rest of the slice's scroll
+    assert get_limit(slice_requests[0]["query"]) == 100
+    assert all(
+        get_limit(r["query"]) == 50 for r in slice_requests[failed + 2 :]
+    )
+    assert [r["scroll"] for r in slice_requests][failed + 2 :] == ["1:0", "1:1"]
@@ -1,8 +1,15 @@
 import math
+from datetime import datetime
 
 from nose.tools import raises
 
-from phc.easy.query.fhir_dsl_query import build_query, get_limit, update_limit
+from phc.easy.query.fhir_dsl_query import (
+    build_query,
+    chunk_patient_ids,
+    get_limit,
+    patient_id_chunks_can_overlap,
+    update_limit,
+)
 
 
 def test_update_limit_with_base_query():
@@ -325,3 +332,64 @@ def test_add_code_filters():
             },
         }
     }
+
+
+def test_chunk_patient_ids_leaves_small_lists_alone():
+    query_kwargs = {"patient_ids": ["a", "b"], "patient_key": "id"}
+
+    assert chunk_patient_ids(query_kwargs, chunk_size=2) == [query_kwargs]
+
+
+def test_chunk_patient_ids_splits_unique_ids():
+    chunks = chunk_patient_ids(
+        {"patient_id": "e", "patient_ids": ["a", "b", "a", "c", "d"]},
+        chunk_size=2,
+    )
+
+    assert chunks == [
+        {"patient_id": None, "patient_ids": ["a", "b"]},
+        {"patient_id": None, "patient_ids": ["c", "d"]},
+        {"patient_id": None, "patient_ids": ["e"]},
+    ]
+
+
+def test_patient_id_chunks_only_overlap_for_multiple_patient_references():
+    assert not patient_id_chunks_can_overlap({"patient_ids": ["a"]})
+    assert not patient_id_chunks_can_overlap(
+        {"patient_key": "patient.reference"}
+    )
+    assert patient_id_chunks_can_overlap(
+        {"patient_key": "entity.reference.reference"}
+    )
+
+
+def test_project_columns():
+    query = build_query(
+        {"type": "select", "columns": "*", "from": [{"table": "observation"}]},
+        columns=["code.coding", "subject", "code", "valueQuantity.value"],
+    )
+
+    assert query["columns"] == [
+        {"expr": {"type": "column_ref", "column": "id"}},
+        {"expr": {"type": "column_ref", "column": "code"}},
+        {"expr": {"type": "column_ref", "column": "subject"}},
+        {"expr": {"type": "column_ref", "column": "valueQuantity"}},
+    ]
+
+
+def test_add_date_range():
+    query = build_query(
+        {"type": "select", "columns": "*", "from": [{"table": "observation"}]},
+        since="2021-01-01",
+        until=datetime(2021, 2, 1),
+        date_field="effectiveDateTime",
+    )
+
+    assert query["where"]["query"] == {
+        "range": {
+            "effectiveDateTime": {
+                "gte": "2021-01-01",
+                "lt": "2021-02-01T00:00:00",
+            }
+        }
+    }
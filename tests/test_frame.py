@@ -3,7 +3,7 @@ from datetime import datetime
 
 import pandas as pd
 
-from phc.easy.frame import Frame
+from phc.easy.frame import ExpansionPlan, Frame
 
 
 def test_frame_expand_date_out_of_range():
@@ -44,3 +44,128 @@ def test_local_and_timezone_split():
     assert expanded.at[1, "effectiveDateTime.local"] == pd.Timestamp(
         "2020-08-09 10:00:00", tz="utc"
     )
+
+
+def test_expand_with_workers_matches_single_process():
+    original = pd.DataFrame(
+        [
+            {
+                "id": f"obs{i}",
+                "code": {
+                    "coding": [{"system": "http://loinc.org", "code": str(i)}]
+                },
+                "effectiveDateTime": "2020-08-08 11:00:00+0300",
+                **({"subject": {"reference": "Patient/a"}} if i > 2 else {}),
+            }
+            for i in range(5)
+        ]
+    )
+    custom_columns = [Frame.codeable_like_column_expander("subject")]
+
+    pd.testing.assert_frame_equal(
+        Frame.expand(original, custom_columns=custom_columns),
+        Frame.expand(original, custom_columns=custom_columns, workers=2),
+    )
+
+
+def test_expand_with_workers_reuses_the_pool_of_a_plan():
+    original = pd.DataFrame(
+        [
+            {
+                "id": f"obs{i}",
+                "code": {"coding": [{"system": "a", "code": str(i)}]},
+            }
+            for i in range(4)
+        ]
+    )
+
+    with ExpansionPlan() as plan:
+        first = Frame.expand(original, workers=2, plan=plan)
+        executor = plan._executor
+        second = Frame.expand(original, workers=2, plan=plan)
+
+        assert plan._executor is executor
+
+    assert plan._executor is None
+    pd.testing.assert_frame_equal(first, Frame.expand(original))
+    pd.testing.assert_frame_equal(second, first)
+
+
+def test_expansion_plan_keeps_column_layout_across_batches():
+    plan = ExpansionPlan()
+
+    def expand(records):
+        return plan.conform(Frame.expand(pd.DataFrame(records), plan=plan))
+
+    first = expand(
+        [{"id": "obs1", "code": {"coding": [{"system": "a", "code": "1"}]}}]
+    )
+    second = expand([{"id": "obs2", "status": "final"}])
+    third = expand(
+        [{"id": "obs3", "code": {"coding": [{"system": "a", "code": "1"}]}}]
+    )
+
+    assert list(second.columns) == [*first.columns, "status"]
+    assert list(third.columns) == list(second.columns)
+    assert math.isnan(second.at[0, "code.coding_system__a__code"])
+    assert third.at[0, "code.coding_system__a__code"] == "1"
+
+
+def test_expansion_plan_layout_comes_from_declared_columns():
+    plan = ExpansionPlan()
+
+    def expand(records):
+        return plan.conform(
+            Frame.expand(
+                pd.DataFrame(records), date_columns=["startDate"], plan=plan
+            )
+        )
+
+    first = expand([{"id": "goal1", "status": "active"}])
+    second = expand([{"id": "goal2", "startDate": "2020-01-01T00:00:00+00:00"}])
+
+    # Declared dates are present before any batch has them
+    assert list(first.columns) == [
+        "id",
+        "startDate.tz",
+        "startDate.local",
+        "status",
+    ]
+    assert list(second.columns) == list(first.columns)
+    assert second.at[0, "startDate.tz"] == 0
+
+
+def test_expansion_plan_layout_follows_projection():
+    plan = ExpansionPlan(projection=["status", "code.coding"])
+
+    expanded = plan.conform(
+        Frame.expand(
+            pd.DataFrame(
+                [
+                    {
+                        "id": "obs1",
+                        "code": {"coding": [{"system": "a", "code": "1"}]},
+                    }
+                ]
+            ),
+            plan=plan,
+        )
+    )
+
+    assert list(expanded.columns) == [
+        "id",
+        "status",
+        "code.coding_system__a__code",
+    ]
+    assert math.isnan(expanded.at[0, "status"])
+
+
+def test_expand_uses_the_active_plan():
+    plan = ExpansionPlan()
+
+    with plan.active():
+        Frame.expand(
+            pd.DataFrame([{"id": "obs1", "code": {"coding": [{"code": "1"}]}}])
+        )
+
+    assert len(plan.memo("code")) == 1
@@ -0,0 +1,42 @@
+import math
+
+from phc.util import json_codec
+
+VALUE = {"a": [1, 2.5, None, "http://x/y"], "b": {"c": True}, "d": "é"}
+
+
+def test_round_trip_from_bytes_and_str():
+    assert json_codec.loads(json_codec.dump_bytes(VALUE)) == VALUE
+    assert json_codec.loads(json_codec.dumps(VALUE, indent=2)) == VALUE
+
+
+def test_stdlib_fallback(monkeypatch):
+    monkeypatch.setattr(json_codec, "_has_orjson", False)
+    monkeypatch.setattr(json_codec, "_has_ujson", False)
+
+    assert json_codec.backend() == "json"
+    assert json_codec.loads(json_codec.dump_bytes(VALUE)) == VALUE
+    assert json_codec.dumps({"a": 1}, indent=4) == '{\n    "a": 1\n}'
+
+
+def test_non_finite_floats_do_not_depend_on_backend(monkeypatch):
+    value = {"a": float("nan"), "b": [float("inf")], "c": None}
+    encoded = json_codec.dumps(value)
+
+    monkeypatch.setattr(json_codec, "_has_orjson", False)
+    monkeypatch.setattr(json_codec, "_has_ujson", False)
+
+    # Written like the standard library (not as null)
+    assert (
+        encoded
+        == json_codec.dumps(value)
+        == '{"a": NaN, "b": [Infinity], "c": null}'
+    )
+    assert json_codec.dump_bytes(value) == encoded.encode("utf-8")
+
+    monkeypatch.undo()
+    decoded = json_codec.loads(encoded)
+
+    assert math.isnan(decoded["a"])
+    assert decoded["b"] == [float("inf")]
+    assert decoded["c"] is None
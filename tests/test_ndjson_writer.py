@@ -0,0 +1,28 @@
+import os
+
+from phc.util.ndjson_writer import NDJSONWriter
+
+
+def setup():
+    if os.path.exists("/tmp/sample.ndjson.gz"):
+        os.remove("/tmp/sample.ndjson.gz")
+
+
+def test_writing_batches():
+    setup()
+    writer = NDJSONWriter("/tmp/sample.ndjson.gz")
+
+    writer.write([{"id": "a", "code": {"coding": [{"code": "1"}]}}])
+    writer.write([])
+    writer.write([{"id": "b"}, {"id": "c"}])
+
+    assert not os.path.exists("/tmp/sample.ndjson.gz")
+
+    writer.finalize()
+
+    assert list(
+        NDJSONWriter.read_batches("/tmp/sample.ndjson.gz", batch_size=2)
+    ) == [
+        [{"id": "a", "code": {"coding": [{"code": "1"}]}}, {"id": "b"}],
+        [{"id": "c"}],
+    ]
@@ -0,0 +1,99 @@
+from phc.easy.query import page_size
+from phc.easy.query.fhir_dsl_query import get_limit
+from phc.easy.query.page_size import PageSizeController
+
+
+def _query(table="patient", limit=None):
+    query = {"type": "select", "columns": "*", "from": [{"table": table}]}
+
+    if limit is not None:
+        query["limit"] = [
+            {"type": "number", "value": 0},
+            {"type": "number", "value": limit},
+        ]
+
+    return query
+
+
+def test_grows_by_at_most_growth_when_pages_are_fast():
+    controller = PageSizeController(initial_size=100, max_size=1000)
+
+    controller.observe(100, latency=0.1, size_in_bytes=1000)
+    assert controller.size == 150
+
+    for _ in range(10):
+        controller.observe(controller.size, latency=0.1, size_in_bytes=1000)
+
+    assert controller.size == 1000
+
+
+def test_shrinks_to_target_latency_at_once():
+    controller = PageSizeController(initial_size=1000, target_latency=5)
+
+    controller.observe(1000, latency=50, size_in_bytes=1000)
+
+    assert controller.size == 100
+
+
+def test_shrinks_when_pages_are_too_large():
+    controller = PageSizeController(initial_size=1000, max_bytes=1000)
+
+    controller.observe(1000, latency=0.1, size_in_bytes=10000)
+
+    assert controller.size == 100
+
+
+def test_failed_shrinks_like_server_error_backoff():
+    controller = PageSizeController(initial_size=1000, min_size=10)
+
+    controller.failed()
+    assert controller.size == int(1000 ** 0.85)
+
+    for _ in range(20):
+        controller.failed()
+
+    assert controller.size == 10
+
+
+def test_apply_sets_limit_of_query():
+    controller = PageSizeController(initial_size=250)
+
+    assert get_limit(controller.apply(_query(limit=1000))) == 250
+
+
+def test_remembers_tuned_size_per_table():
+    page_size._tuned_sizes.clear()
+
+    controller = PageSizeController.for_query(_query("documentreference"))
+    controller.observe(controller.size, latency=100, size_in_bytes=1)
+
+    assert (
+        PageSizeController.for_query(_query("documentreference")).size
+        == controller.size
+    )
+    assert (
+        PageSizeController.for_query(_query("patient", limit=500)).size == 500
+    )
+
+    page_size._tuned_sizes.clear()
+
+
+def test_remembers_tuned_size_per_projection():
+    page_size._tuned_sizes.clear()
+
+    projected = _query("observation")
+    projected["columns"] = [
+        {"expr": {"type": "column_ref", "column": "id"}},
+        {"expr": {"type": "column_ref", "column": "code"}},
+    ]
+
+    controller = PageSizeController.for_query(projected)
+    controller.observe(controller.size, latency=100, size_in_bytes=1)
+
+    assert PageSizeController.for_query(projected).size == controller.size
+    assert (
+        PageSizeController.for_query(_query("observation", limit=500)).size
+        == 500
+    )
+
+    page_size._tuned_sizes.clear()
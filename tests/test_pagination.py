@@ -0,0 +1,71 @@
+import asyncio
+import sys
+
+from nose.tools import raises
+
+from phc.easy.query.pagination import aiter_pages, iter_pages, prefetch_pages
+
+
+def fake_fetch(last_page: int):
+    def fetch_page(cursor):
+        cursor = cursor or 1
+        return ([cursor], cursor + 1 if cursor < last_page else None, last_page)
+
+    return fetch_page
+
+
+def test_iter_pages_until_no_cursor():
+    pages = list(iter_pages(fake_fetch(3)))
+
+    assert [page.items for page in pages] == [[1], [2], [3]]
+    assert [page.is_last for page in pages] == [False, False, True]
+    assert pages[-1].total == 3
+
+
+def test_aiter_pages_with_max_pages():
+    fetch = fake_fetch(10)
+
+    async def fetch_page(cursor):
+        return fetch(cursor)
+
+    async def collect():
+        return [page async for page in aiter_pages(fetch_page, max_pages=3)]
+
+    pages = asyncio.new_event_loop().run_until_complete(collect())
+
+    assert [page.items for page in pages] == [[1], [2], [3]]
+    assert [page.is_last for page in pages] == [False, False, True]
+
+
+def test_iter_pages_with_max_pages():
+    pages = list(iter_pages(fake_fetch(10), max_pages=2))
+
+    assert [page.number for page in pages] == [1, 2]
+    assert pages[-1].is_last
+
+
+def test_iter_pages_past_recursion_limit():
+    last_page = sys.getrecursionlimit() * 2
+
+    assert len(list(iter_pages(fake_fetch(last_page)))) == last_page
+
+
+def test_prefetch_pages_preserves_order():
+    pages = prefetch_pages(iter_pages(fake_fetch(5)), size=2)
+
+    assert [page.items for page in pages] == [[1], [2], [3], [4], [5]]
+
+
+@raises(ValueError)
+def test_prefetch_pages_raises_fetch_errors():
+    def fetch_page(cursor):
+        raise ValueError("Failed fetch")
+
+    list(prefetch_pages(iter_pages(fetch_page)))
+
+
+def test_prefetch_pages_stops_when_closed_early():
+    pages = prefetch_pages(iter_pages(fake_fetch(100)), size=1)
+
+    assert next(pages).items == [1]
+    pages.close()
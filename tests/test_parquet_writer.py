@@ -0,0 +1,90 @@
+import os
+import shutil
+
+import pandas as pd
+
+from phc.util.parquet_writer import ParquetWriter
+
+DIRNAME = "/tmp/sample.parquet"
+
+
+def setup():
+    shutil.rmtree(DIRNAME, ignore_errors=True)
+
+
+def test_writing_batches():
+    setup()
+    writer = ParquetWriter(DIRNAME)
+
+    writer.write(
+        pd.DataFrame(
+            [
+                {"first_name": "Laura", "last_name": "Lane"},
+                {"first_name": "Susie", "last_name": "Smith"},
+            ]
+        )
+    )
+    writer.write(
+        pd.DataFrame(
+            [
+                {"first_name": "Jenny", "last_name": "Jones"},
+                {
+                    "last_name": "Motte",
+                    "date_of_birth": pd.Timestamp("1986-03-07", tz="UTC"),
+                },
+            ]
+        )
+    )
+
+    writer.finalize()
+    frame = ParquetWriter.read(DIRNAME)
+
+    assert frame.columns.tolist() == [
+        "first_name",
+        "last_name",
+        "date_of_birth",
+    ]
+    assert frame.last_name.tolist() == ["Lane", "Smith", "Jones", "Motte"]
+    assert frame.at[3, "date_of_birth"] == pd.Timestamp("1986-03-07", tz="UTC")
+
+
+def test_reading_projected_columns():
+    setup()
+    writer = ParquetWriter(DIRNAME)
+
+    writer.write(pd.DataFrame([{"id": "a", "status": "final", "n": 1}]))
+    writer.write(pd.DataFrame([{"id": "b", "n": 2}]))
+    writer.finalize()
+
+    frame = ParquetWriter.read(DIRNAME, columns=["status", "id"])
+
+    assert frame.columns.tolist() == ["status", "id"]
+    assert frame.id.tolist() == ["a", "b"]
+
+
+def test_writing_nested_values():
+    setup()
+    writer = ParquetWriter(DIRNAME)
+
+    writer.write(pd.DataFrame([{"note": [{"text": "a"}]}, {"note": "plain"}]))
+    writer.finalize()
+
+    assert ParquetWriter.read(DIRNAME).note.tolist() == [
+        '[{"text": "a"}]',
+        "plain",
+    ]
+
+
+def test_finalize_replaces_existing_parts():
+    setup()
+    writer = ParquetWriter(DIRNAME)
+    writer.write(pd.DataFrame([{"id": "a"}]))
+    writer.write(pd.DataFrame([{"id": "b"}]))
+    writer.finalize()
+
+    writer = ParquetWriter(DIRNAME)
+    writer.write(pd.DataFrame([{"id": "c"}]))
+    writer.finalize()
+
+    assert ParquetWriter.read(DIRNAME).id.tolist() == ["c"]
+    assert not os.path.exists(DIRNAME + ".tmp")
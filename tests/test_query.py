@@ -1,4 +1,16 @@
+import time
+
+import jwt
+import pandas as pd
+import pytest
+
+from phc.easy.auth import Auth
+from phc.easy.item import Item
+from phc.easy.patient_item import PatientItem
+from phc.easy.query import Query
+from phc.easy.query.fhir_dsl_query import build_query
 from phc.easy.util.api_cache import APICache
+from phc.services import Fhir
 
 
 def test_filename_for_fhir_dsl_with_simple_statement():
@@ -10,7 +22,7 @@ def test_filename_for_fhir_dsl_with_simple_statement():
         }
     )
 
-    assert filename == "fhir_dsl_patient_observation_c57bdb78.csv"
+    assert filename == "fhir_dsl_patient_observation_873c4e1a.csv"
 
 
 def test_filename_for_fhir_dsl_with_complex_statement():
@@ -44,7 +56,7 @@ def test_filename_for_fhir_dsl_with_complex_statement():
         }
     )
 
-    assert filename == "fhir_dsl_goal_1col_where_08c25b4c.csv"
+    assert filename == "fhir_dsl_goal_1col_where_9e364a55.csv"
 
 
 def test_filename_for_fhir_dsl_with_aggregation():
@@ -85,4 +97,223 @@ def test_filename_for_fhir_dsl_with_aggregation():
         }
     )
 
-    assert filename == "fhir_dsl_goal_agg_where_58a8bb32.json"
+    assert filename == "fhir_dsl_goal_agg_where_76c1264b.json"
+
+
+def test_filename_for_fhir_dsl_is_canonical():
+    first = build_query(
+        {"type": "select", "columns": "*", "from": [{"table": "goal"}]},
+        patient_ids=["b", "a", "Patient/a"],
+        page_size=100,
+    )
+    second = build_query(
+        {"from": [{"table": "goal"}], "columns": "*", "type": "select"},
+        patient_ids=["a", "b"],
+    )
+
+    assert APICache.filename_for_fhir_dsl(
+        first
+    ) == APICache.filename_for_fhir_dsl(second)
+
+
+def test_filename_for_fhir_dsl_depends_on_project():
+    query = {"type": "select", "columns": "*", "from": [{"table": "goal"}]}
+
+    assert APICache.filename_for_fhir_dsl(
+        query, {"account": "account", "project_id": "a"}
+    ) != APICache.filename_for_fhir_dsl(
+        query, {"account": "account", "project_id": "b"}
+    )
+
+
+def test_filename_for_fhir_dsl_keeps_prefixed_values_of_other_fields():
+    def query(codes):
+        return {
+            "type": "select",
+            "columns": "*",
+            "from": [{"table": "observation"}],
+            "where": {
+                "type": "elasticsearch",
+                "query": {"terms": {"code.coding.code.keyword": codes}},
+            },
+        }
+
+    assert APICache.filename_for_fhir_dsl(
+        query(["a"])
+    ) != APICache.filename_for_fhir_dsl(query(["a", "Patient/a"]))
+
+
+PAGE_SIZE = 2
+
+
+class FakeResponse:
+    def __init__(self, data: dict):
+        self.data = data
+        self.size = 0
+
+
+class FakeScroll:
+    """Records (with the patients they reference) served in pages of
+    PAGE_SIZE"""
+
+    def __init__(self, records):
+        self.records = records
+        self.requests = []
+
+
+def _patient_terms(value):
+    "The patient IDs of the (first) terms clause in a query"
+    if isinstance(value, dict):
+        if "terms" in value:
+            return next(iter(value["terms"].values()))
+
+        value = list(value.values())
+
+    if isinstance(value, list):
+        return next(
+            (t for t in map(_patient_terms, value) if t is not None), None
+        )
+
+    return None
+
+
+@pytest.fixture
+def fake_scroll(monkeypatch):
+    fake = FakeScroll(
+        [{"id": f"r{i}", "patients": [f"p{i}"]} for i in range(5)]
+    )
+
+    def dsl(self, project, data, scroll=""):
+        fake.requests.append(scroll)
+
+        terms = _patient_terms(data.get("where", {}))
+        matching = [
+            record
+            for record in fake.records
+            if terms is None or any(p in terms for p in record["patients"])
+        ]
+
+        page = 0 if scroll == "true" else int(scroll)
+        hits = [
+            {"_id": record["id"], "_source": {"id": record["id"]}}
+            for record in matching[page * PAGE_SIZE : (page + 1) * PAGE_SIZE]
+        ]
+
+        return FakeResponse(
+            {
+                "hits": {"hits": hits, "total": {"value": len(matching)}},
+                "_scroll_id": str(page + 1),
+            }
+        )
+
+    monkeypatch.setattr(Fhir, "dsl", dsl)
+
+    return fake
+
+
+def build_auth():
+    token = jwt.encode(
+        {"exp": time.time() + 3600, "iss": "https://api.us.lifeomic.com"},
+        "a-test-key-that-is-long-enough-for-hs256",
+        algorithm="HS256",
+    )
+
+    return Auth({"token": token, "account": "account", "project_id": "p"})
+
+
+class Thing(PatientItem):
+    @staticmethod
+    def table_name():
+        return "thing"
+
+    @staticmethod
+    def transform_results(data_frame: pd.DataFrame, **expand_args):
+        return data_frame.assign(transformed=True)
+
+
+class Organization(Item):
+    @staticmethod
+    def table_name():
+        return "organization"
+
+    @staticmethod
+    def transform_results(data_frame: pd.DataFrame, **expand_args):
+        return data_frame.assign(transformed=True)
+
+
+def _iter_ids(patient_key: str, patient_ids):
+    return [
+        list(df.id)
+        for df in Query.iter_fhir_dsl_with_options(
+            {"type": "select", "columns": "*", "from": [{"table": "thing"}]},
+            None,
+            True,
+            {},
+            build_auth(),
+            None,
+            patient_ids=patient_ids,
+            patient_key=patient_key,
+        )
+    ]
+
+
+def test_iter_data_frame_yields_transformed_batches_in_order(fake_scroll):
+    frames = list(Thing.iter_data_frame(auth_args=build_auth()))
+
+    assert [list(df.id) for df in frames] == [
+        ["r0", "r1"],
+        ["r2", "r3"],
+        ["r4"],
+    ]
+    assert all(df.transformed.all() for df in frames)
+
+    raw_frames = list(Thing.iter_data_frame(raw=True, auth_args=build_auth()))
+
+    assert [list(df.columns) for df in raw_frames] == [["id"]] * 3
+
+
+def test_item_iter_data_frame_yields_transformed_batches(fake_scroll):
+    frames = list(
+        Organization.iter_data_frame(max_pages=2, auth_args=build_auth())
+    )
+
+    assert [list(df.id) for df in frames] == [["r0", "r1"], ["r2", "r3"]]
+    assert all(df.transformed.all() for df in frames)
+
+
+def test_iter_data_frame_honours_max_pages(fake_scroll):
+    frames = list(Thing.iter_data_frame(max_pages=2, auth_args=build_auth()))
+
+    assert [list(df.id) for df in frames] == [["r0", "r1"], ["r2", "r3"]]
+    assert len(fake_scroll.requests) == 2
+
+
+def test_iter_data_frame_only_fetches_pages_that_are_consumed(fake_scroll):
+    for df in Thing.iter_data_frame(auth_args=build_auth()):
+        break
+
+    assert list(df.id) == ["r0", "r1"]
+    assert fake_scroll.requests == ["true"]
+
+
+def test_iter_drops_duplicates_only_when_patient_chunks_can_overlap(
+    fake_scroll,
+):
+    # Two chunks of patient IDs (p0-p999 and p1000) that both match r0
+    fake_scroll.records[0]["patients"] = ["p0", "p1000"]
+    patient_ids = [f"p{i}" for i in range(1001)]
+
+    # The page of the second chunk only holds r0 again so it is skipped
+    assert _iter_ids("entity.reference.reference", patient_ids) == [
+        ["r0", "r1"],
+        ["r2", "r3"],
+        ["r4"],
+    ]
+    # Chunks of a single patient reference match separate records, so nothing
+    # is dropped (the fake matches r0 in both chunks)
+    assert _iter_ids("subject.reference", patient_ids) == [
+        ["r0", "r1"],
+        ["r2", "r3"],
+        ["r4"],
+        ["r0"],
+    ]
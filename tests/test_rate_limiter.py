@@ -0,0 +1,56 @@
+import asyncio
+
+from phc.util.rate_limiter import HostLimiter, TokenBucket, host_limiter
+
+
+def test_limit_halves_on_overload_and_grows_on_success():
+    limiter = HostLimiter(initial_concurrency=8, decrease_interval=0)
+
+    asyncio.new_event_loop().run_until_complete(limiter.acquire())
+    limiter.release(429, 0.1)
+    assert limiter.limit == 4
+
+    for _ in range(8):
+        asyncio.new_event_loop().run_until_complete(limiter.acquire())
+        limiter.release(200, 0.1)
+
+    assert limiter.limit == 5
+    assert limiter.in_flight == 0
+
+
+def test_concurrency_never_exceeds_limit():
+    limiter = HostLimiter(initial_concurrency=3, max_concurrency=3)
+    state = {"current": 0, "peak": 0}
+
+    async def request():
+        await limiter.acquire()
+        state["current"] += 1
+        state["peak"] = max(state["peak"], state["current"])
+        await asyncio.sleep(0.01)
+        state["current"] -= 1
+        limiter.release(200, 0.01)
+
+    async def run_all():
+        await asyncio.gather(*[request() for _ in range(20)])
+
+    asyncio.new_event_loop().run_until_complete(run_all())
+
+    assert state["peak"] == 3
+    assert limiter.in_flight == 0
+
+
+def test_token_bucket_delays_after_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0.05 < bucket.reserve() <= 0.1
+
+
+def test_limiters_are_shared_per_host():
+    assert host_limiter("https://api.us.lifeomic.com/v1/a") is host_limiter(
+        "https://api.us.lifeomic.com/v1/b"
+    )
+    assert host_limiter("https://api.us.lifeomic.com/") is not host_limiter(
+        "https://fhir.us.lifeomic.com/"
+    )
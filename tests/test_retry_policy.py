@@ -0,0 +1,82 @@
+import asyncio
+
+from nose.tools import raises
+
+from phc.api_response import ApiResponse
+from phc.base_client import BaseClient
+from phc.errors import ApiError
+from phc.util.retry_policy import RetryPolicy
+
+
+def api_error(status_code: int, headers: dict = {}):
+    return ApiError(
+        "failed",
+        ApiResponse(
+            client=None,
+            http_verb="GET",
+            api_url="",
+            req_args={},
+            data="",
+            headers=headers,
+            status_code=status_code,
+        ),
+    )
+
+
+def test_status_and_method_classification():
+    policy = RetryPolicy()
+
+    assert not policy.is_retryable("GET", api_error(404))
+    assert policy.is_retryable("GET", api_error(500))
+    assert not policy.is_retryable("POST", api_error(500))
+    assert policy.is_retryable("POST", api_error(429))
+
+
+def test_retry_after_and_budget():
+    policy = RetryPolicy(base_delay=0, max_elapsed=10)
+
+    assert (
+        policy.retry_delay("GET", api_error(503, {"Retry-After": "4"}), 1, 0)
+        == 4
+    )
+    assert (
+        policy.retry_delay("GET", api_error(503, {"Retry-After": "4"}), 1, 7)
+        is None
+    )
+    assert policy.retry_delay("GET", api_error(500), 3, 0) is None
+
+
+def client_with_responses(status_codes):
+    client = BaseClient("session", retry_policy=RetryPolicy(base_delay=0))
+    calls = []
+
+    async def request(http_verb, api_url, req_args):
+        calls.append(http_verb)
+        return {"data": "", "headers": {}, "status_code": status_codes.pop(0)}
+
+    client._request = request
+    return client, calls
+
+
+def test_send_retries_transient_errors():
+    client, calls = client_with_responses([502, 200])
+
+    response = asyncio.new_event_loop().run_until_complete(
+        client._send("GET", "https://api.us.lifeomic.com/v1/files", {})
+    )
+
+    assert len(calls) == 2
+    assert response.retries == 1
+    assert client.retry_policy.stats()["retries"] == 1
+
+
+@raises(ApiError)
+def test_send_does_not_retry_missing_resources():
+    client, calls = client_with_responses([404, 200])
+
+    try:
+        asyncio.new_event_loop().run_until_complete(
+            client._send("GET", "https://api.us.lifeomic.com/v1/files", {})
+        )
+    finally:
+        assert len(calls) == 1
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import time
+
+import jwt
+
+from phc import Session
+
+KEY = "a-test-key-that-is-long-enough-for-hs256"
+
+
+def build_token(expires_in: float):
+    return jwt.encode(
+        {"exp": time.time() + expires_in, "iss": "https://api.us.lifeomic.com"},
+        KEY,
+        algorithm="HS256",
+    )
+
+
+def test_claims_are_decoded_again_when_token_changes():
+    session = Session(token=build_token(-10), account="account")
+    assert session.is_expired()
+
+    session.token = build_token(3600)
+    assert not session.is_expired()
+
+
+def test_refresh_ahead_of_expiry_happens_once():
+    session = Session(
+        token=build_token(30), refresh_token="refresh", account="account"
+    )
+    calls = []
+
+    def refresh():
+        calls.append(True)
+        time.sleep(0.1)
+        return build_token(3600)
+
+    threads = [
+        threading.Thread(target=session.refresh_if_expiring, args=(refresh,))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert not session.is_expired(session.refresh_margin)
+
+
+def test_async_refresh_ahead_of_expiry_happens_once():
+    session = Session(
+        token=build_token(30), refresh_token="refresh", account="account"
+    )
+    calls = []
+
+    async def refresh():
+        calls.append(True)
+        await asyncio.sleep(0.1)
+        return build_token(3600)
+
+    async def refresh_concurrently():
+        await asyncio.gather(
+            *[session.arefresh_if_expiring(refresh) for _ in range(5)]
+        )
+
+    asyncio.new_event_loop().run_until_complete(refresh_concurrently())
+
+    assert len(calls) == 1
+    assert not session.is_expired(session.refresh_margin)